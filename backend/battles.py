@@ -0,0 +1,354 @@
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from bson import ObjectId
+
+from case_catalog import case_catalog
+from database import (
+    add_items_to_inventory, db, debit_user_balance, inventory_summary_cache, run_in_transaction,
+    update_user_balance
+)
+from market_prices import price_map
+from models import BalanceReason
+
+MIN_PLAYERS = 2
+MAX_PLAYERS = 4
+
+# Most cases (rounds) in one battle
+MAX_ROUNDS = 10
+
+
+class BattleError(Exception):
+    """A battle action that isn't allowed; the message is safe to show"""
+
+
+class InsufficientBalanceError(BattleError):
+    def __init__(self, steam_id: str):
+        super().__init__(f"Player {steam_id} has insufficient balance")
+        self.steam_id = steam_id
+
+
+def _player(user: dict) -> dict:
+    return {
+        "steam_id": user["steam_id"],
+        "user_id": str(user["_id"]),
+        "username": user.get("username"),
+        "avatar": user.get("avatar")
+    }
+
+
+class BattleRoom:
+    """One battle: players, the cases to open and, once started, every drop.
+
+    All rounds are drawn and settled when the battle starts; the rounds are
+    then only revealed to subscribers one by one, so nothing touches the
+    database between rounds.
+    """
+
+    def __init__(self, case_ids: List[str], max_players: int, creator: dict):
+        self.id = str(uuid.uuid4())
+        self.case_ids = case_ids
+        self.max_players = max_players
+        self.price = sum(case_catalog.get(case_id)["price"] for case_id in case_ids)
+        self.players: List[dict] = [_player(creator)]
+        self.status = "waiting"
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.rounds: List[List[dict]] = []
+        self.revealed = 0
+        self.winner: Optional[dict] = None
+        self.totals: Dict[str, int] = {}
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def creator(self) -> dict:
+        return self.players[0]
+
+    def has_player(self, steam_id: str) -> bool:
+        return any(player["steam_id"] == steam_id for player in self.players)
+
+    def public_round(self, index: int) -> dict:
+        return {
+            "round": index + 1,
+            "case_id": self.case_ids[index],
+            "drops": [
+                {"steam_id": player["steam_id"], "item": item}
+                for player, item in zip(self.players, self.rounds[index])
+            ]
+        }
+
+    def state(self) -> dict:
+        """What subscribers may see now: rounds are hidden until revealed"""
+        state = {
+            "id": self.id,
+            "status": self.status,
+            "case_ids": self.case_ids,
+            "price": self.price,
+            "max_players": self.max_players,
+            "players": [
+                {key: player[key] for key in ("steam_id", "username", "avatar")}
+                for player in self.players
+            ],
+            "rounds": [self.public_round(index) for index in range(self.revealed)],
+            "created_at": self.created_at.isoformat()
+        }
+        if self.status == "finished":
+            state["winner"] = self.winner["steam_id"]
+            state["totals"] = self.totals
+        return state
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def broadcast(self, event: dict):
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def close(self):
+        """Tell every subscriber the room is gone"""
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+        self._subscribers.clear()
+
+
+class BattleManager:
+    """In-memory battle rooms of this worker.
+
+    Rooms live in the worker that created them, so joining and watching a
+    battle must reach the same worker (sticky sessions when scaled out).
+    Waiting rooms cost no more than a dict entry; a running room has one
+    task that reveals its rounds.
+    """
+
+    def __init__(self):
+        self.rooms: Dict[str, BattleRoom] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @property
+    def round_seconds(self) -> float:
+        return float(os.environ.get('BATTLE_ROUND_SECONDS', '3'))
+
+    @property
+    def waiting_ttl(self) -> float:
+        return float(os.environ.get('BATTLE_WAITING_TTL_SECONDS', '600'))
+
+    @property
+    def finished_ttl(self) -> float:
+        return float(os.environ.get('BATTLE_FINISHED_TTL_SECONDS', '120'))
+
+    def get(self, room_id: str) -> BattleRoom:
+        room = self.rooms.get(room_id)
+        if room is None:
+            raise LookupError("Battle not found")
+        return room
+
+    def list_waiting(self) -> List[dict]:
+        return [room.state() for room in self.rooms.values() if room.status == "waiting"]
+
+    def create(self, user: dict, case_ids: List[str], max_players: int) -> BattleRoom:
+        if not MIN_PLAYERS <= max_players <= MAX_PLAYERS:
+            raise BattleError(f"A battle has {MIN_PLAYERS} to {MAX_PLAYERS} players")
+        if not 1 <= len(case_ids) <= MAX_ROUNDS:
+            raise BattleError(f"A battle has 1 to {MAX_ROUNDS} cases")
+        unknown = [case_id for case_id in case_ids if case_catalog.get(case_id) is None]
+        if unknown:
+            raise BattleError(f"Unknown cases: {', '.join(unknown)}")
+        # Checked again by the debit at start; this only rejects obvious cases early
+        if user.get("balance", 0) < sum(case_catalog.get(case_id)["price"] for case_id in case_ids):
+            raise BattleError("Insufficient balance")
+        room = BattleRoom(case_ids, max_players, user)
+        self.rooms[room.id] = room
+        return room
+
+    async def join(self, room_id: str, user: dict) -> BattleRoom:
+        room = self.get(room_id)
+        if room.status != "waiting":
+            raise BattleError("Battle already started")
+        if room.has_player(user["steam_id"]):
+            raise BattleError("Already in this battle")
+        if len(room.players) >= room.max_players:
+            raise BattleError("Battle is full")
+        if user.get("balance", 0) < room.price:
+            raise BattleError("Insufficient balance")
+        room.players.append(_player(user))
+        room.broadcast({"type": "joined", "player": room.state()["players"][-1]})
+        if len(room.players) == room.max_players:
+            await self._start(room)
+        return room
+
+    async def begin(self, room_id: str, user: dict) -> BattleRoom:
+        """Start before the room is full; only its creator may"""
+        room = self.get(room_id)
+        if room.creator["steam_id"] != user["steam_id"]:
+            raise BattleError("Only the creator can start the battle")
+        if room.status != "waiting":
+            raise BattleError("Battle already started")
+        if len(room.players) < MIN_PLAYERS:
+            raise BattleError(f"At least {MIN_PLAYERS} players are needed")
+        await self._start(room)
+        return room
+
+    def leave(self, room_id: str, user: dict) -> BattleRoom:
+        room = self.get(room_id)
+        if room.status != "waiting":
+            raise BattleError("Battle already started")
+        if not room.has_player(user["steam_id"]):
+            raise BattleError("Not in this battle")
+        if room.creator["steam_id"] == user["steam_id"]:
+            self._cancel(room)
+        else:
+            room.players = [p for p in room.players if p["steam_id"] != user["steam_id"]]
+            room.broadcast({"type": "left", "steam_id": user["steam_id"]})
+        return room
+
+    def _cancel(self, room: BattleRoom):
+        room.status = "cancelled"
+        room.broadcast({"type": "cancelled"})
+        room.close()
+        self.rooms.pop(room.id, None)
+
+    def _draw(self, room: BattleRoom):
+        for case_id in room.case_ids:
+            case = case_catalog.get(case_id)
+            sampler = case_catalog.sampler_for(case)
+            room.rounds.append([price_map.priced(sampler.draw()) for _ in room.players])
+        room.totals = {player["steam_id"]: 0 for player in room.players}
+        for drops in room.rounds:
+            for player, item in zip(room.players, drops):
+                room.totals[player["steam_id"]] += item["price"]
+        best = max(room.totals.values())
+        room.winner = random.choice([p for p in room.players if room.totals[p["steam_id"]] == best])
+
+    async def _settle(self, room: BattleRoom):
+        """Debit every player once, give the winner every item and record the battle"""
+        items = [item for drops in room.rounds for item in drops]
+        document = {
+            "_id": room.id,
+            "case_ids": room.case_ids,
+            "price": room.price,
+            "players": room.players,
+            "rounds": room.rounds,
+            "totals": room.totals,
+            "winner_steam_id": room.winner["steam_id"],
+            "created_at": room.created_at,
+            "finished_at": datetime.utcnow()
+        }
+
+        # Ids are set here so the items can be found again if settling fails midway
+        awarded = [{**item, "_id": ObjectId()} for item in items]
+
+        async def settle(session):
+            debited = []
+            try:
+                for player in room.players:
+                    remaining = await debit_user_balance(
+                        player["steam_id"], room.price, BalanceReason.BATTLE.value,
+                        reference=room.id, session=session
+                    )
+                    if remaining is None:
+                        raise InsufficientBalanceError(player["steam_id"])
+                    debited.append(player)
+                await add_items_to_inventory(room.winner["user_id"], awarded, session=session)
+                await db.battles.insert_one(document, session=session)
+            except Exception:
+                # Without a transaction the writes already made stay; undo them
+                if session is None:
+                    await self._compensate(room, debited, awarded)
+                raise
+
+        await run_in_transaction(settle)
+        room.finished_at = document["finished_at"]
+
+    async def _compensate(self, room: BattleRoom, debited: List[dict], awarded: List[dict]):
+        """Take back the items of a battle that failed to settle and refund its debits"""
+        winner_id = room.winner["user_id"]
+        result = await db.inventory.delete_many(
+            {"_id": {"$in": [item["_id"] for item in awarded]}, "user_id": winner_id}
+        )
+        if result.deleted_count:
+            inventory_summary_cache.pop(winner_id)
+        for player in debited:
+            await update_user_balance(
+                player["steam_id"], room.price, BalanceReason.BATTLE.value, reference=room.id
+            )
+
+    async def _start(self, room: BattleRoom):
+        room.status = "settling"
+        try:
+            self._draw(room)
+            await self._settle(room)
+        except InsufficientBalanceError as e:
+            # Drop the player who can't pay and let the room fill up again
+            room.rounds, room.totals, room.winner = [], {}, None
+            if room.creator["steam_id"] == e.steam_id:
+                self._cancel(room)
+            else:
+                room.players = [p for p in room.players if p["steam_id"] != e.steam_id]
+                room.status = "waiting"
+                room.broadcast({"type": "left", "steam_id": e.steam_id})
+            raise
+        except Exception:
+            logging.exception(f"Failed to settle battle {room.id}")
+            self._cancel(room)
+            raise BattleError("Battle could not be settled")
+        room.status = "running"
+        room.broadcast({"type": "started", "state": room.state()})
+        task = asyncio.create_task(self._reveal(room))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _reveal(self, room: BattleRoom):
+        for index in range(len(room.rounds)):
+            await asyncio.sleep(self.round_seconds)
+            room.revealed = index + 1
+            room.broadcast({"type": "round", **room.public_round(index)})
+        room.broadcast({"type": "finished", "winner": room.winner["steam_id"], "totals": room.totals})
+        room.status = "finished"
+
+    def sweep(self):
+        """Drop waiting rooms nobody joined and finished rooms nobody watches anymore"""
+        now = datetime.utcnow()
+        for room in list(self.rooms.values()):
+            if room.status == "waiting" and (now - room.created_at).total_seconds() > self.waiting_ttl:
+                self._cancel(room)
+            elif room.status == "finished" and (now - room.finished_at).total_seconds() > self.finished_ttl:
+                room.close()
+                self.rooms.pop(room.id, None)
+
+    async def _run_sweeper(self):
+        while True:
+            await asyncio.sleep(30)
+            self.sweep()
+
+    async def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._run_sweeper())
+
+    async def stop(self):
+        """Stop sweeping and finish revealing running battles (they are already settled)"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for room in list(self.rooms.values()):
+            room.close()
+
+
+battle_manager = BattleManager()
@@ -0,0 +1,189 @@
+from json import dumps
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional
+
+from drop_sampler import case_samplers
+
+# Keys of a case definition that are used for drops and never sent to clients
+PRIVATE_CASE_KEYS = ("drop_pool", "rarity_weights")
+
+# Case definitions served by /api/cases
+CASES = [
+    {
+        "id": "1",
+        "name": "КОНФЕТТИ БУМ",
+        "items": 35,
+        "price": 1500,  # 15 RUB
+        "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpou-6kejhz2v_Nfz5H_uO1gb-Gw_alIITCmX5d_MR6mOzG-oLw2w2yrUo5N2j0LI6XdAU-YluE-AS9kOy918Pu6M6YwSE26CB3sGGdwULdGVNUiw/360fx360f",
+        "is_new": True
+    },
+    {
+        "id": "2", 
+        "name": "КБ КОРМИТ",
+        "items": 50,
+        "price": 7500,  # 75 RUB
+        "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpot621FAR17PLfYQJD_9W7m5a0mvLwOq7c2DMBupQn2eqVotqkiwHiqhdlMmigJtOWJwE5Zw3X8wS-yea8jcDo7c7XiSw0g89L9us/360fx360f",
+        "is_new": True
+    },
+    {
+        "id": "3",
+        "name": "КОРОЛЬ КЕЙСОВ", 
+        "items": 38,
+        "price": 13500,  # 135 RUB
+        "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpovbSsLQJf3qr3czxb49KzgL-ImOX3NrfUhGRu5Mx2gv2P8Y3w2gS3rkVsYzqlI9edJgI2NAmE-VK3wOe9h8W6uJTJzmwj5Hc3nWGdwUKnJ-gWGw/360fx360f",
+        "is_new": True
+    },
+    {
+        "id": "4",
+        "name": "АФТЕРПАТИ",
+        "items": 49, 
+        "price": 55000,  # 550 RUB
+        "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpovbSsLQJf0Ob3dDFL7929ldaOwfX3MLrFnm5u5Mx2gv2P8I2p3g3l-kY9N2yiI4KcdVVvNQyC_FO2kr3ohpHptZ6fzmwj5HcqeFN1sQ/360fx360f",
+        "is_new": True
+    },
+    {
+        "id": "5",
+        "name": "ОГНЕННАЯ ШЕСТЕРКА",
+        "items": 53,
+        "price": 95000,  # 950 RUB
+        "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpopuP1FA957ODYfi9W7927kYyDgvun4IrqyT5Q5sFo2u2T8I-niwHg8hI5ZGv3ddSSI1I5ZwzY-FO2l-e8h5C4vczXiSw0Oj2SzDo/360fx360f",
+        "is_new": True
+    },
+    {
+        "id": "6",
+        "name": "СТАНДАРТНЫЙ",
+        "items": 27,
+        "price": 7000,  # 70 RUB  
+        "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpopuP1FAR17P7NdTRH-t26q4SClvD7Ib6ukmJE6ct0h-zF_Jn4xlCx-UA-azjxdICWegVtYlyC-lK7wrnshZK06Z_XiSw0PXJwqWo/360fx360f"
+    }
+]
+
+# Default drop pool shared by all cases, with realistic data and Steam image URLs
+CASE_DROP_POOL = [
+    {
+        "name": "AK-47 | Редлайн",
+        "rarity": "rare",
+        "price": 850000,  # 8500 RUB
+        "market_hash_name": "AK-47 | Redline (Field-Tested)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpot7HxfDhjxszJemkV09-5gZKKkuXLPr7Vn35cppMk3L3Dp96k21Lg_EJuYjqnJNKSdFU2YVrQ_ljrwOzv1MK46pzJwHRkuCR2sCvbgVXp1gcKLrE/360fx360f",
+        "color_class": "from-red-400 to-red-600"
+    },
+    {
+        "name": "M4A4 | Хаул",
+        "rarity": "epic", 
+        "price": 1200000,  # 12000 RUB
+        "market_hash_name": "M4A4 | Howl (Field-Tested)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpou-6kejhjxszFJTwW09izh4-HluPxDKjBl2hU18l4jeHVu4is0VHi_ENqMG6iI9DEJAU9M1vY_FXqyLvs0JC6tJucm3MxuSgltH7D30vgCRVnojY/360fx360f",
+        "color_class": "from-purple-400 to-purple-600"
+    },
+    {
+        "name": "AWP | Азимов",
+        "rarity": "legendary",
+        "price": 2500000,  # 25000 RUB 
+        "market_hash_name": "AWP | Asiimov (Field-Tested)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpot621FAR17PLfYQJO5du5q4GFk8j4OrzZgiVQuJwg2O2WrdWl2Q21-0duMWH6JoWXcwVqYVyG_gC2xObugJ-16MzPn3Y3vykh5yzZgVXp1hlSLrE/360fx360f",
+        "color_class": "from-yellow-400 to-yellow-600"
+    },
+    {
+        "name": "Glock-18 | Выцветший",
+        "rarity": "common",
+        "price": 15000,  # 150 RUB
+        "market_hash_name": "Glock-18 | Fade (Factory New)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgposbaqKAxf0Ob3djFN79eJmIyPkuXLNqjFm2pT18l4jeHVu433iVa1qkprYDr7dtWRcQA3MlHS81PtyOa6hZW-6c6YzSNjvykg5H7D30vga1SMHA/360fx360f",
+        "color_class": "from-gray-400 to-gray-600"
+    },
+    {
+        "name": "USP-S | Орион",
+        "rarity": "rare",
+        "price": 320000,  # 3200 RUB
+        "market_hash_name": "USP-S | Orion (Factory New)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpoo6m1FBRp3_bGcjhQ09-jq5WYh8j_OrfYlDMEuJNz3L3C896h3wLl_xJuNzjyJdWXegZrYV6C8lXsw-3rhpW8uJqfzHYyvSJx5HfZnBS_hRhOaOE6gvfPSg/360fx360f",
+        "color_class": "from-blue-400 to-blue-600"
+    },
+    {
+        "name": "★ Карамбит | Убийство",
+        "rarity": "mythical",
+        "price": 15000000,  # 150000 RUB
+        "market_hash_name": "★ Karambit | Slaughter (Factory New)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpovbSsLQJf2PLacDBA5ciJlY20kfb5NqjYglRc7cF4n-SPrN2m21Ls_kc-YW77I4ORcQdqMwrV-VK9w7q-15W4vZTNyHZgu3Mm-z-DyLOsxaXl/360fx360f",
+        "color_class": "from-orange-400 to-orange-600"
+    },
+    {
+        "name": "P90 | Азимов",
+        "rarity": "epic",
+        "price": 450000,  # 4500 RUB
+        "market_hash_name": "P90 | Asiimov (Factory New)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpopuP1FAR17PLJYTJL49uJkIGZkfX5MaexmX5D_8l4jeHVu97ziQLl_0c5MG3wI4aScA8_MlHX-gLqk-3v0J626c7LzCcxuSAq7HzD30vgfAJdKsM/360fx360f",
+        "color_class": "from-purple-400 to-purple-600"
+    },
+    {
+        "name": "MAC-10 | Неон Rider",
+        "rarity": "common",
+        "price": 80000,  # 800 RUB
+        "market_hash_name": "MAC-10 | Neon Rider (Factory New)",
+        "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpou7uOFA957PfJYzh97cqJmImMn-O6YriBx2pH18l4jeHVu4-l3wXir0M6YTj3JdSSIVU7NV3X_FG5kLrqgJ-56sDLz3E3syQl43vD30vgrS5vOGY/360fx360f",
+        "color_class": "from-green-400 to-green-600"
+    }
+]
+
+# Default drop rates by rarity; a case may override them with "rarity_weights"
+CASE_RARITY_WEIGHTS = {
+    "common": 50,
+    "rare": 25,
+    "epic": 15,
+    "legendary": 8,
+    "mythical": 2
+}
+
+
+class CaseCatalog:
+    """Immutable id -> case index with a pre-serialized /api/cases payload.
+
+    The catalog is built once at startup. ``load`` swaps in a new set of
+    definitions atomically and drops the cached drop samplers so that they
+    are rebuilt from the new pools on the next opening.
+    """
+
+    def __init__(self, cases: Iterable[dict]):
+        self.load(cases)
+
+    def load(self, cases: Iterable[dict]):
+        index = {}
+        public_cases = []
+        for case in cases:
+            if case["id"] in index:
+                raise ValueError(f"Duplicate case id: {case['id']}")
+            index[case["id"]] = MappingProxyType({
+                **case,
+                "drop_pool": tuple(case.get("drop_pool", CASE_DROP_POOL)),
+                "rarity_weights": MappingProxyType(dict(case.get("rarity_weights", CASE_RARITY_WEIGHTS)))
+            })
+            public_cases.append({k: v for k, v in case.items() if k not in PRIVATE_CASE_KEYS})
+
+        # Serialized the same way FastAPI's JSONResponse would do it
+        response_bytes = dumps(
+            {"cases": public_cases},
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+        self._index = MappingProxyType(index)
+        self.response_bytes = response_bytes
+        case_samplers.invalidate()
+
+    def get(self, case_id: str) -> Optional[Mapping]:
+        return self._index.get(case_id)
+
+    def sampler_for(self, case: Mapping):
+        """Drop sampler for a case from this catalog"""
+        return case_samplers.get_or_build(case["id"], case["drop_pool"], case["rarity_weights"])
+
+    def __iter__(self):
+        return iter(self._index.values())
+
+    def __len__(self):
+        return len(self._index)
+
+
+case_catalog = CaseCatalog(CASES)
@@ -0,0 +1,164 @@
+"""Monte Carlo simulator for case return-to-player and variance.
+
+Usage:
+    python case_simulator.py --case 1 --openings 5000000
+    python case_simulator.py --all --prices new_prices.json
+    python case_simulator.py --range high --price 60000
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from case_catalog import case_catalog
+from drop_sampler import WeightedSampler, build_rarity_sampler
+from market_prices import price_map
+from skins_database import SKIN_RARITY_WEIGHTS, get_skins_for_case
+
+DEFAULT_OPENINGS = 1_000_000
+DEFAULT_BATCH_SIZE = 1_000_000
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99, 99.9)
+
+
+def simulate_pool(values: Sequence[int], probabilities: Sequence[float], case_price: int,
+                  openings: int = DEFAULT_OPENINGS, batch_size: int = DEFAULT_BATCH_SIZE,
+                  seed: Optional[int] = None) -> Dict:
+    """Simulate ``openings`` draws from a pool and summarize the outcome.
+
+    Values and the case price are in kopecks. Draws are made in batches of
+    ``batch_size`` so memory stays flat regardless of the number of openings;
+    only per-item hit counts are kept between batches.
+    """
+    if openings <= 0:
+        raise ValueError("openings must be positive")
+    if case_price <= 0:
+        raise ValueError("case_price must be positive")
+
+    values = np.asarray(values, dtype=np.float64)
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    probabilities = probabilities / probabilities.sum()
+    rng = np.random.default_rng(seed)
+
+    counts = np.zeros(len(values), dtype=np.int64)
+    remaining = openings
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        drawn = rng.choice(len(values), size=size, p=probabilities)
+        counts += np.bincount(drawn, minlength=len(values))
+        remaining -= size
+
+    frequencies = counts / openings
+    mean = float(np.dot(frequencies, values))
+    variance = float(np.dot(frequencies, (values - mean) ** 2))
+
+    # Percentiles of a single opening, read off the sorted value distribution
+    order = np.argsort(values, kind="stable")
+    cumulative = np.cumsum(counts[order]) / openings
+    percentiles = {}
+    for q in PERCENTILES:
+        position = min(int(np.searchsorted(cumulative, q / 100.0)), len(order) - 1)
+        percentiles[f"p{q:g}"] = int(values[order[position]])
+
+    expected_value = float(np.dot(probabilities, values))
+    rtp = mean / case_price * 100
+    return {
+        "openings": openings,
+        "case_price": case_price,
+        "mean_value": mean,
+        "expected_value": expected_value,
+        "standard_error": (variance / openings) ** 0.5,
+        "variance": variance,
+        "std_dev": variance ** 0.5,
+        "rtp_percent": rtp,
+        "expected_rtp_percent": expected_value / case_price * 100,
+        "house_edge_percent": 100 - rtp,
+        "profit_probability": float(frequencies[values > case_price].sum()),
+        "percentiles": percentiles,
+    }
+
+
+def simulate_sampler(sampler: WeightedSampler, case_price: int, **kwargs) -> Dict:
+    """Simulate openings of a case pool backed by a drop sampler, at current market prices"""
+    values = [price_map.price_of(item) for item in sampler.items]
+    return simulate_pool(values, sampler.probabilities(), case_price, **kwargs)
+
+
+def expected_value(sampler: WeightedSampler) -> float:
+    """Exact value of one draw from a case pool at current market prices, in kopecks"""
+    return sum(
+        probability * price_map.price_of(item)
+        for item, probability in zip(sampler.items, sampler.probabilities())
+    )
+
+
+def _format_report(title: str, report: Dict) -> str:
+    lines = [
+        f"== {title} ==",
+        f"openings:      {report['openings']:,}",
+        f"case price:    {report['case_price'] / 100:,.2f} RUB",
+        f"mean value:    {report['mean_value'] / 100:,.2f} RUB "
+        f"(exact {report['expected_value'] / 100:,.2f}, "
+        f"±{report['standard_error'] / 100:,.2f})",
+        f"std dev:       {report['std_dev'] / 100:,.2f} RUB",
+        f"RTP:           {report['rtp_percent']:.2f}% "
+        f"(exact {report['expected_rtp_percent']:.2f}%)",
+        f"house edge:    {report['house_edge_percent']:.2f}%",
+        f"P(win > price): {report['profit_probability'] * 100:.3f}%",
+        "percentiles:   " + ", ".join(
+            f"{name}={value / 100:,.0f}" for name, value in report["percentiles"].items()
+        ),
+    ]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate case openings to estimate RTP and variance")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--case", help="case id to simulate")
+    target.add_argument("--all", action="store_true", help="simulate every case")
+    target.add_argument("--range", choices=["low", "medium", "high"],
+                        help="simulate a catalog pool from skins_database")
+    parser.add_argument("--price", type=int, help="case price in kopecks (overrides the current price)")
+    parser.add_argument("--prices", help="JSON file mapping case id to a new price in kopecks")
+    parser.add_argument("--openings", type=int, default=DEFAULT_OPENINGS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="print raw JSON instead of a report")
+    args = parser.parse_args(argv)
+
+    options = {"openings": args.openings, "batch_size": args.batch_size, "seed": args.seed}
+    reports = {}
+
+    if args.range:
+        if args.price is None:
+            parser.error("--range requires --price")
+        sampler = build_rarity_sampler(get_skins_for_case(args.range), SKIN_RARITY_WEIGHTS)
+        reports[f"range {args.range}"] = simulate_sampler(sampler, args.price, **options)
+    else:
+        price_table = {}
+        if args.prices:
+            with open(args.prices) as f:
+                price_table = {str(k): int(v) for k, v in json.load(f).items()}
+
+        case_ids = [case["id"] for case in case_catalog] if args.all else [args.case]
+        for case_id in case_ids:
+            case = case_catalog.get(case_id)
+            if case is None:
+                parser.error(f"unknown case id: {case_id}")
+            price = args.price or price_table.get(case_id, case["price"])
+            sampler = case_catalog.sampler_for(case)
+            reports[f"case {case_id} {case['name']}"] = simulate_sampler(sampler, price, **options)
+
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        print("\n\n".join(_format_report(title, report) for title, report in reports.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,323 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 from typing import Optional
 import os
-from datetime import datetime
+import logging
+import threading
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from cache import TTLCache
+from models import BalanceReason
+from metrics import balance_credited, balance_debited, command_timer
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-db_name = os.environ.get('DB_NAME', 'test_database')
+# Recently read user documents keyed by Steam ID. Balance changes made through
+# this module write through, so the TTL only bounds staleness from other workers.
+user_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('USER_CACHE_TTL', '5'))
+)
 
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+# Inventory summaries keyed by user id, evicted whenever this process changes
+# the inventory; the TTL bounds staleness from changes made by other workers.
+inventory_summary_cache = TTLCache(
+    maxsize=int(os.environ.get('INVENTORY_SUMMARY_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('INVENTORY_SUMMARY_CACHE_TTL', '300'))
+)
 
-# Collections
-users_collection = db.users
-inventory_collection = db.inventory
-cases_collection = db.cases
-case_results_collection = db.case_results
+# Environment variables that tune the shared connection pool,
+# mapped to the AsyncIOMotorClient option they set
+POOL_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
 
-async def create_or_update_user(steam_id: str, profile_data: dict) -> dict:
-    """Create new user or update existing user"""
-    existing_user = await users_collection.find_one({"steam_id": steam_id})
+def get_client_options() -> dict:
+    """Build client options from the environment, leaving unset ones at driver defaults"""
+    options = {}
+    for env_name, option in POOL_OPTIONS.items():
+        value = os.environ.get(env_name)
+        if value:
+            options[option] = int(value)
+    compressors = os.environ.get("MONGO_COMPRESSORS")
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connection pool events so pool usage can be reported"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def _bump(self, address, key, amount=1):
+        with self._lock:
+            stats = self._stats.setdefault(f"{address[0]}:{address[1]}", {
+                "open": 0,
+                "in_use": 0,
+                "created": 0,
+                "closed": 0,
+                "checked_out": 0,
+                "check_out_failed": 0,
+                "cleared": 0
+            })
+            stats[key] += amount
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {address: dict(stats) for address, stats in self._stats.items()}
+    
+    def pool_created(self, event):
+        self._bump(event.address, "open", 0)
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        self._bump(event.address, "cleared")
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        self._bump(event.address, "created")
+        self._bump(event.address, "open")
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        self._bump(event.address, "closed")
+        self._bump(event.address, "open", -1)
+    
+    def connection_check_out_started(self, event):
+        pass
+    
+    def connection_check_out_failed(self, event):
+        self._bump(event.address, "check_out_failed")
+    
+    def connection_checked_out(self, event):
+        self._bump(event.address, "checked_out")
+        self._bump(event.address, "in_use")
+    
+    def connection_checked_in(self, event):
+        self._bump(event.address, "in_use", -1)
+
+class MongoConnection:
+    """Owns the single Motor client shared by every module in the process"""
+    
+    def __init__(self):
+        self.client = None
+        self.database = None
+        self.pool_monitor = PoolMonitor()
+        self.transactions_supported = None
+    
+    def connect(self):
+        """Create the client if needed and return the database"""
+        if self.client is None:
+            mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+            db_name = os.environ.get('DB_NAME', 'test_database')
+            self.client = AsyncIOMotorClient(
+                mongo_url,
+                event_listeners=[self.pool_monitor, command_timer],
+                **get_client_options()
+            )
+            self.database = self.client[db_name]
+        return self.database
+    
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self.database = None
+            self.transactions_supported = None
+    
+    def pool_stats(self) -> dict:
+        return {
+            "connected": self.client is not None,
+            "options": get_client_options(),
+            "servers": self.pool_monitor.stats()
+        }
+
+class DatabaseProxy:
+    """Stands in for the Motor database so `db.<collection>` always hits the shared client"""
     
+    def __init__(self, connection: MongoConnection):
+        self._connection = connection
+    
+    def __getattr__(self, name):
+        return getattr(self._connection.connect(), name)
+    
+    def __getitem__(self, name):
+        return self._connection.connect()[name]
+
+# MongoDB connection, opened and closed by the app lifespan
+mongo = MongoConnection()
+db = DatabaseProxy(mongo)
+
+async def supports_transactions() -> bool:
+    """Whether the deployment is a replica set or sharded cluster"""
+    if mongo.transactions_supported is None:
+        mongo.connect()
+        hello = await mongo.client.admin.command("hello")
+        mongo.transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return mongo.transactions_supported
+
+async def run_in_transaction(callback):
+    """Run ``callback(session)`` inside a multi-document transaction.
+
+    On a standalone server, which cannot run transactions, the callback is
+    called with ``session=None`` and its writes are applied one by one;
+    callbacks must therefore order their writes so that the first one is
+    the conditional update that guards the rest.
+    """
+    if not await supports_transactions():
+        return await callback(None)
+    async with await mongo.client.start_session() as session:
+        return await session.with_transaction(callback)
+
+# Inventory page orderings: field and direction, with _id as the tie breaker
+INVENTORY_SORTS = {
+    "newest": ("obtained_at", DESCENDING),
+    "oldest": ("obtained_at", ASCENDING),
+    "price_desc": ("price", DESCENDING),
+    "price_asc": ("price", ASCENDING),
+}
+
+# Inventory fields clients may ask for
+INVENTORY_FIELDS = ("name", "rarity", "price", "market_hash_name", "image_url", "color_class", "obtained_at")
+
+# Indexes backing the hot queries, keyed by collection name.
+# ensure_indexes() creates them idempotently at startup; changing an
+# index definition requires giving it a new name so both can coexist
+# until the old one is dropped.
+INDEXES = {
+    "users": [
+        IndexModel([("steam_id", ASCENDING)], name="steam_id_unique", unique=True),
+    ],
+    "inventory": [
+        IndexModel(
+            [("user_id", ASCENDING), ("obtained_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_obtained_at"
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("price", DESCENDING), ("_id", DESCENDING)],
+            name="user_price"
+        ),
+        # Only items claimed by a sale on a standalone server carry the field
+        IndexModel(
+            [("sale_claimed_at", ASCENDING)],
+            name="sale_claimed_at",
+            partialFilterExpression={"sale_claimed_at": {"$exists": True}}
+        ),
+    ],
+    "case_results": [
+        IndexModel([("user_id", ASCENDING), ("opened_at", DESCENDING)], name="user_opened_at"),
+    ],
+    "payment_transactions": [
+        # Promocode transactions have no invoice, so only real invoice ids are unique
+        IndexModel(
+            [("invoice_id", ASCENDING)],
+            name="invoice_id_unique",
+            unique=True,
+            partialFilterExpression={"invoice_id": {"$type": "string"}}
+        ),
+        IndexModel(
+            [("user_steam_id", ASCENDING), ("created_at", DESCENDING)],
+            name="user_created_at"
+        ),
+    ],
+    "skin_prices": [
+        IndexModel([("market_hash_name", ASCENDING)], name="market_hash_name_unique", unique=True),
+    ],
+    "webhook_inbox": [
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)], name="status_available_at"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        # Processed events are kept for a month for audits, then expire
+        IndexModel([("processed_at", ASCENDING)], name="processed_at_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "ledger_entries": [
+        IndexModel([("user_steam_id", ASCENDING), ("_id", ASCENDING)], name="user_entry"),
+    ],
+    "ledger_snapshots": [
+        IndexModel(
+            [("user_steam_id", ASCENDING), ("through_id", DESCENDING)],
+            name="user_through_unique",
+            unique=True
+        ),
+    ],
+    "battles": [
+        IndexModel([("players.steam_id", ASCENDING), ("finished_at", DESCENDING)], name="player_finished_at"),
+    ],
+    "exchange_rates": [
+        IndexModel(
+            [("from_currency", ASCENDING), ("to_currency", ASCENDING)],
+            name="currency_pair_unique",
+            unique=True
+        ),
+    ],
+}
+
+async def ensure_indexes() -> dict:
+    """Create all declared indexes; safe to run on every startup"""
+    created = {}
+    for collection_name, indexes in INDEXES.items():
+        try:
+            created[collection_name] = await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            # Conflicting definitions or duplicate data; keep serving and let the report show it
+            logging.error(f"Failed to create indexes on {collection_name}: {e}")
+            created[collection_name] = []
+    return created
+
+# Longest pause between attempts to create indexes while MongoDB is unreachable
+INDEX_RETRY_MAX_SECONDS = 60
+
+async def ensure_indexes_with_retry() -> dict:
+    """Run ensure_indexes until MongoDB is reachable.
+
+    Started as a background task, so the app still boots (and serves what
+    it can) when MongoDB is down; the indexes are created once it is up.
+    """
+    delay = 1
+    while True:
+        try:
+            return await ensure_indexes()
+        except PyMongoError as e:
+            logging.error(f"Failed to create indexes, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, INDEX_RETRY_MAX_SECONDS)
+
+async def get_index_report() -> dict:
+    """Compare declared indexes with the existing ones and their usage counters"""
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        declared = [index.document["name"] for index in indexes]
+        usage = {}
+        async for stats in collection.aggregate([{"$indexStats": {}}]):
+            usage[stats["name"]] = {
+                "ops": stats["accesses"]["ops"],
+                "since": stats["accesses"]["since"]
+            }
+        report[collection_name] = {
+            "missing": [name for name in declared if name not in existing],
+            "undeclared": [name for name in existing if name not in declared and name != "_id_"],
+            "unused": [name for name, stats in usage.items() if stats["ops"] == 0 and name != "_id_"],
+            "usage": usage
+        }
+    return report
+
+async def create_or_update_user(steam_id: str, profile_data: dict) -> dict:
+    """Create new user or update existing user in a single upsert"""
     user_data = {
         "steam_id": steam_id,
         "username": profile_data.get("personaname", "Unknown"),
@@ -27,46 +325,366 @@ async def create_or_update_user(steam_id: str, profile_data: dict) -> dict:
         "profile_url": profile_data.get("profileurl", ""),
         "last_login": datetime.utcnow()
     }
+    update = {
+        "$set": user_data,
+        "$setOnInsert": {"balance": 0, "created_at": user_data["last_login"]}
+    }
     
-    if existing_user:
-        await users_collection.update_one(
-            {"steam_id": steam_id},
-            {"$set": user_data}
+    try:
+        user = await db.users.find_one_and_update(
+            {"steam_id": steam_id}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Two first logins raced on the unique steam_id index; the user exists now
+        user = await db.users.find_one_and_update(
+            {"steam_id": steam_id}, update, return_document=ReturnDocument.AFTER
+        )
+    user_cache.set(steam_id, user)
+    return user
+
+async def get_user_by_steam_id(steam_id: str) -> Optional[dict]:
+    """Get user by Steam ID (served from the short-lived user cache when possible)"""
+    user = user_cache.get(steam_id)
+    if user is None:
+        user = await db.users.find_one({"steam_id": steam_id})
+        if user is not None:
+            user_cache.set(steam_id, user)
+    return user
+
+def _cache_user_after_write(steam_id: str, updated_user: Optional[dict], session=None):
+    # Inside a transaction the write may still be rolled back, so only evict
+    if updated_user is None or session is not None:
+        user_cache.pop(steam_id)
+    else:
+        user_cache.set(steam_id, updated_user)
+
+async def record_ledger_entry(updated_user: dict, amount: int, reason: str,
+                              reference: Optional[str] = None, session=None) -> str:
+    """Append an immutable ledger entry for a balance change that was just applied"""
+    result = await db.ledger_entries.insert_one({
+        "user_steam_id": updated_user["steam_id"],
+        "amount": amount,
+        "reason": reason,
+        "reference": reference,
+        "balance_after": updated_user["balance"],
+        "created_at": datetime.utcnow()
+    }, session=session)
+    return str(result.inserted_id)
+
+async def _apply_balance_change(steam_id: str, query: dict, amount: int, reason: str,
+                                reference: Optional[str], session) -> Optional[dict]:
+    """Apply ``$inc`` to the user matched by ``query`` and record the ledger entry.
+
+    Both writes go into the caller's session when one is given, otherwise
+    into a transaction of their own when the deployment supports them, so
+    a balance change never lands without its entry. On a standalone server
+    they are two writes; a failure between them leaves a change without an
+    entry, which ledger.reconcile reports as drift.
+    """
+    async def apply(session):
+        updated_user = await db.users.find_one_and_update(
+            query,
+            {"$inc": {"balance": amount}},
+            return_document=ReturnDocument.AFTER,
+            session=session
         )
-        updated_user = await users_collection.find_one({"steam_id": steam_id})
+        if updated_user is not None:
+            await record_ledger_entry(updated_user, amount, reason, reference, session)
         return updated_user
+    
+    try:
+        if session is not None:
+            updated_user = await apply(session)
+        else:
+            updated_user = await run_in_transaction(apply)
+    except Exception:
+        user_cache.pop(steam_id)
+        raise
+    # A failed debit also evicts: the cached balance may be what let the caller try
+    _cache_user_after_write(steam_id, updated_user, session)
+    return updated_user
+
+async def update_user_balance(steam_id: str, amount: int, reason: str,
+                              reference: Optional[str] = None, session=None) -> bool:
+    """Update user balance (amount in kopecks) and record why in the ledger"""
+    updated_user = await _apply_balance_change(
+        steam_id, {"steam_id": steam_id}, amount, reason, reference, session
+    )
+    if updated_user is None:
+        return False
+    if amount >= 0:
+        balance_credited.inc(amount, reason=reason)
     else:
-        user_data["balance"] = 0
-        user_data["created_at"] = datetime.utcnow()
-        result = await users_collection.insert_one(user_data)
-        new_user = await users_collection.find_one({"_id": result.inserted_id})
-        return new_user
+        balance_debited.inc(-amount, reason=reason)
+    return True
 
-async def get_user_by_steam_id(steam_id: str) -> Optional[dict]:
-    """Get user by Steam ID"""
-    return await users_collection.find_one({"steam_id": steam_id})
-
-async def update_user_balance(steam_id: str, amount: int) -> bool:
-    """Update user balance (amount in kopecks)"""
-    result = await users_collection.update_one(
-        {"steam_id": steam_id},
-        {"$inc": {"balance": amount}}
+async def debit_user_balance(steam_id: str, amount: int, reason: str,
+                             reference: Optional[str] = None, session=None) -> Optional[int]:
+    """Atomically debit balance if it covers the amount; returns new balance or None"""
+    updated_user = await _apply_balance_change(
+        steam_id, {"steam_id": steam_id, "balance": {"$gte": amount}}, -amount, reason, reference, session
     )
-    return result.modified_count > 0
+    if updated_user is None:
+        return None
+    balance_debited.inc(amount, reason=reason)
+    return updated_user["balance"]
 
 async def add_item_to_inventory(user_id: str, item_data: dict) -> str:
     """Add item to user inventory"""
     item_data["user_id"] = user_id
     item_data["obtained_at"] = datetime.utcnow()
-    result = await inventory_collection.insert_one(item_data)
+    result = await db.inventory.insert_one(item_data)
+    inventory_summary_cache.pop(user_id)
     return str(result.inserted_id)
 
+async def add_items_to_inventory(user_id: str, items: list, session=None) -> list:
+    """Add several items to user inventory with a single insert"""
+    obtained_at = datetime.utcnow()
+    documents = [
+        {**item_data, "user_id": user_id, "obtained_at": obtained_at}
+        for item_data in items
+    ]
+    result = await db.inventory.insert_many(documents, session=session)
+    inventory_summary_cache.pop(user_id)
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
 async def get_user_inventory(user_id: str) -> list:
     """Get all items in user inventory"""
-    cursor = inventory_collection.find({"user_id": user_id})
+    cursor = db.inventory.find({"user_id": user_id})
     items = await cursor.to_list(length=None)
     return items
 
+async def get_user_inventory_page(
+    user_id: str,
+    limit: int = 50,
+    after: Optional[dict] = None,
+    sort: str = "newest",
+    fields: Optional[list] = None,
+    rarities: Optional[list] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None
+) -> tuple:
+    """Get one keyset-paginated page of user inventory.
+
+    ``after`` is the key of the last item of the previous page, as returned
+    in the second element of the result ({"value": <sort field>, "id": _id});
+    it is None when there are no more pages.
+    """
+    sort_field, direction = INVENTORY_SORTS[sort]
+    
+    query = {"user_id": user_id}
+    if rarities:
+        query["rarity"] = {"$in": rarities}
+    price_range = {}
+    if min_price is not None:
+        price_range["$gte"] = min_price
+    if max_price is not None:
+        price_range["$lte"] = max_price
+    if price_range:
+        query["price"] = price_range
+    
+    if after is not None:
+        op = "$lt" if direction == DESCENDING else "$gt"
+        query = {"$and": [query, {"$or": [
+            {sort_field: {op: after["value"]}},
+            {sort_field: after["value"], "_id": {op: after["id"]}}
+        ]}]}
+    
+    projection = {field: True for field in (fields or INVENTORY_FIELDS)}
+    projection[sort_field] = True
+    
+    cursor = db.inventory.find(query, projection).sort(
+        [(sort_field, direction), ("_id", direction)]
+    ).limit(limit + 1)
+    items = await cursor.to_list(length=limit + 1)
+    
+    next_key = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_key = {"value": items[-1][sort_field], "id": items[-1]["_id"]}
+    return items, next_key
+
+async def sell_inventory_items(steam_id: str, user_id: str, query: dict, market_price, rate: float) -> tuple:
+    """Sell the user's items matching ``query`` back to the house in one pass.
+
+    ``market_price(market_hash_name)`` gives the current market price in
+    kopecks, or None to use the price recorded on the item; the payout is
+    ``rate`` times the total, rounded down. One aggregation counts the
+    items per skin, one delete_many removes them and one balance update
+    credits the payout, all in a single transaction. On a standalone
+    server the items are first claimed with a sale id, so a concurrent sell
+    can't pay out the same item twice; a failed sale releases its claim.
+    Returns (items sold, payout in kopecks).
+    """
+    # Items claimed by an unfinished sale are no longer for sale
+    query = {**query, "user_id": user_id, "sale_id": {"$exists": False}}
+    
+    async def sell(session):
+        sale_id = str(uuid.uuid4())
+        match = query
+        if session is None:
+            await db.inventory.update_many(
+                query, {"$set": {"sale_id": sale_id, "sale_claimed_at": datetime.utcnow()}}
+            )
+            match = {"user_id": user_id, "sale_id": sale_id}
+        
+        try:
+            group = {"_id": "$market_hash_name", "count": {"$sum": 1}, "recorded": {"$sum": "$price"}}
+            if session is None:
+                # Without a transaction the deleted items must be restorable by hand
+                group["items"] = {"$push": "$$ROOT"}
+            skins = await db.inventory.aggregate([
+                {"$match": match},
+                {"$group": group}
+            ], session=session).to_list(length=None)
+            count = sum(skin["count"] for skin in skins)
+            if not count:
+                return 0, 0
+            value = 0
+            for skin in skins:
+                price = market_price(skin["_id"])
+                value += skin["recorded"] if price is None else price * skin["count"]
+            payout = int(value * rate)
+            
+            result = await db.inventory.delete_many(match, session=session)
+            if result.deleted_count != count:
+                # Only possible without a transaction's snapshot; abort instead of mispaying
+                if session is None:
+                    await restore_sold_items(skins)
+                raise RuntimeError("Inventory changed during sale")
+            if not await update_user_balance(
+                steam_id, payout, BalanceReason.SELL.value, reference=sale_id, session=session
+            ):
+                if session is None:
+                    # Nothing was credited, so the deleted items go back
+                    await restore_sold_items(skins)
+                raise LookupError(f"User {steam_id} not found")
+        except Exception:
+            if session is None:
+                await release_sale(sale_id)
+            raise
+        return count, payout
+    
+    try:
+        return await run_in_transaction(sell)
+    finally:
+        inventory_summary_cache.pop(user_id)
+
+async def restore_sold_items(skins: list):
+    """Re-insert the items of a sale that could not be paid out, if they were deleted"""
+    items = [item for skin in skins for item in skin["items"]]
+    remaining = {
+        item["_id"] async for item in
+        db.inventory.find({"_id": {"$in": [item["_id"] for item in items]}}, {"_id": True})
+    }
+    items = [item for item in items if item["_id"] not in remaining]
+    for item in items:
+        item.pop("sale_id", None)
+        item.pop("sale_claimed_at", None)
+    if items:
+        await db.inventory.insert_many(items)
+
+async def release_sale(sale_id: str) -> int:
+    """Put items claimed by a sale back into the inventory; returns how many"""
+    result = await db.inventory.update_many(
+        {"sale_id": sale_id}, {"$unset": {"sale_id": "", "sale_claimed_at": ""}}
+    )
+    return result.modified_count
+
+async def release_abandoned_sales(older_than_seconds: float) -> int:
+    """Release claims of sales that never finished, e.g. because the process died"""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+    result = await db.inventory.update_many(
+        {"sale_claimed_at": {"$lt": cutoff}}, {"$unset": {"sale_id": "", "sale_claimed_at": ""}}
+    )
+    return result.modified_count
+
+class SaleClaimSweeper:
+    """Periodically releases inventory items left claimed by abandoned sales"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def interval(self) -> float:
+        return float(os.environ.get('SALE_CLAIM_SWEEP_SECONDS', '300'))
+
+    @property
+    def claim_timeout(self) -> float:
+        # Far longer than any sale takes, so a slow sale is never released under it
+        return float(os.environ.get('SALE_CLAIM_TIMEOUT_SECONDS', '600'))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                released = await release_abandoned_sales(self.claim_timeout)
+                if released:
+                    logging.warning(f"Released {released} items of abandoned sales")
+            except Exception as e:
+                logging.error(f"Failed to release abandoned sales: {e}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+sale_claim_sweeper = SaleClaimSweeper()
+
+# Most valuable items kept in a cached inventory summary
+INVENTORY_SUMMARY_TOP = 10
+
+async def get_inventory_summary(user_id: str) -> dict:
+    """Item count and value per rarity, the most valuable items and the total worth.
+
+    Computed in one aggregation (the $match uses the user_id index) and
+    cached until the next inventory change made through this module.
+    """
+    summary = inventory_summary_cache.get(user_id)
+    if summary is not None:
+        return summary
+    
+    pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$facet": {
+            "by_rarity": [
+                {"$group": {"_id": "$rarity", "count": {"$sum": 1}, "value": {"$sum": "$price"}}},
+                {"$sort": {"value": -1}}
+            ],
+            "top_items": [
+                {"$sort": {"price": -1, "_id": -1}},
+                {"$limit": INVENTORY_SUMMARY_TOP},
+                {"$project": {field: True for field in INVENTORY_FIELDS}}
+            ],
+            "total": [
+                {"$group": {"_id": None, "count": {"$sum": 1}, "value": {"$sum": "$price"}}}
+            ]
+        }}
+    ]
+    result = (await db.inventory.aggregate(pipeline).to_list(length=1))[0]
+    total = result["total"][0] if result["total"] else {"count": 0, "value": 0}
+    summary = {
+        "total_count": total["count"],
+        "total_value": total["value"],
+        "by_rarity": [
+            {"rarity": row["_id"], "count": row["count"], "value": row["value"]}
+            for row in result["by_rarity"]
+        ],
+        "top_items": [
+            {"id": str(item.pop("_id")), **item} for item in result["top_items"]
+        ]
+    }
+    inventory_summary_cache.set(user_id, summary)
+    return summary
+
 async def save_case_result(user_id: str, case_id: str, item_data: dict) -> str:
     """Save case opening result"""
     result_data = {
@@ -75,5 +693,20 @@ async def save_case_result(user_id: str, case_id: str, item_data: dict) -> str:
         "item": item_data,
         "opened_at": datetime.utcnow()
     }
-    result = await case_results_collection.insert_one(result_data)
-    return str(result.inserted_id)
\ No newline at end of file
+    result = await db.case_results.insert_one(result_data)
+    return str(result.inserted_id)
+
+async def save_case_results(user_id: str, case_id: str, items: list) -> list:
+    """Save several case opening results with a single insert"""
+    opened_at = datetime.utcnow()
+    documents = [
+        {
+            "user_id": user_id,
+            "case_id": case_id,
+            "item": item_data,
+            "opened_at": opened_at
+        }
+        for item_data in items
+    ]
+    result = await db.case_results.insert_many(documents)
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
\ No newline at end of file
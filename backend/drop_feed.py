@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import List, Optional, Set
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from cache import TTLCache
+from database import db
+
+# Item fields shown in the feed
+DROP_ITEM_FIELDS = ("name", "rarity", "price", "image_url", "color_class")
+
+
+def make_drop(user: dict, case_id: str, item: dict, opened_at: Optional[datetime] = None) -> dict:
+    """Public feed entry for one opened item"""
+    return {
+        "username": user.get("username"),
+        "avatar": user.get("avatar"),
+        "case_id": case_id,
+        "item": {field: item.get(field) for field in DROP_ITEM_FIELDS},
+        "opened_at": (opened_at or datetime.utcnow()).isoformat()
+    }
+
+
+class DropFeed:
+    """In-process pub/sub of recent drops with a fixed-size ring buffer.
+
+    New subscribers get the buffered drops first and then every new one
+    pushed to their queue. A subscriber that stops reading is disconnected
+    once its queue is full rather than slowing down publishing.
+
+    By default each worker publishes the drops it produced itself. With
+    DROP_FEED_CHANGE_STREAM=true drops are instead read from a change
+    stream on ``case_results`` (needs a replica set), so every worker sees
+    the drops of all workers.
+    """
+
+    def __init__(self):
+        self.recent = deque(maxlen=int(os.environ.get('DROP_FEED_SIZE', '50')))
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Task] = None
+        # Profiles of users seen in the change stream, keyed by user id
+        self._users = TTLCache(maxsize=10000, ttl=300)
+
+    @property
+    def queue_size(self) -> int:
+        return int(os.environ.get('DROP_FEED_QUEUE_SIZE', '100'))
+
+    @property
+    def change_stream_enabled(self) -> bool:
+        return os.environ.get('DROP_FEED_CHANGE_STREAM', 'false').lower() == 'true'
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> tuple:
+        """Returns the buffered drops and a queue that receives new ones.
+
+        The queue yields None when the subscriber was dropped for lagging.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return list(self.recent), queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _disconnect(self, queue: asyncio.Queue):
+        # Skip whatever the subscriber hasn't read and make it stop
+        self.unsubscribe(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def _publish(self, drop: dict):
+        self.recent.append(drop)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(drop)
+            except asyncio.QueueFull:
+                self._disconnect(queue)
+
+    def publish(self, user: dict, case_id: str, items: List[dict]):
+        """Publish drops produced by this worker (no-op in change stream mode)"""
+        if self.change_stream_enabled:
+            return
+        for item in items:
+            self._publish(make_drop(user, case_id, item))
+
+    async def _user_for(self, user_id: str) -> dict:
+        user = self._users.get(user_id)
+        if user is None:
+            try:
+                user = await db.users.find_one(
+                    {"_id": ObjectId(user_id)}, {"username": True, "avatar": True}
+                ) or {}
+            except InvalidId:
+                user = {}
+            self._users.set(user_id, user)
+        return user
+
+    async def _watch(self):
+        while True:
+            try:
+                async with db.case_results.watch([{"$match": {"operationType": "insert"}}]) as stream:
+                    async for change in stream:
+                        result = change["fullDocument"]
+                        user = await self._user_for(result["user_id"])
+                        self._publish(make_drop(user, result["case_id"], result["item"], result["opened_at"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Drop feed change stream failed: {e}")
+                await asyncio.sleep(5)
+
+    async def start(self):
+        if self.change_stream_enabled and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Wake every subscriber so open streams end
+        for queue in list(self._subscribers):
+            self._disconnect(queue)
+
+
+drop_feed = DropFeed()
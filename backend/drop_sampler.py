@@ -0,0 +1,123 @@
+import random
+from typing import Dict, List, Optional, Sequence
+
+
+class WeightedSampler:
+    """Constant-time weighted sampler built with Vose's alias method.
+
+    Weights may be fractional; items with a zero weight are never drawn.
+    The tables are built once, so every draw costs a single random number
+    and two list lookups regardless of the size of the pool.
+    """
+
+    __slots__ = ("items", "weights", "total_weight", "_prob", "_alias", "_size")
+
+    def __init__(self, items: Sequence, weights: Sequence[float]):
+        if len(items) != len(weights):
+            raise ValueError("items and weights must have the same length")
+        if not items:
+            raise ValueError("cannot build a sampler for an empty pool")
+        if any(w < 0 for w in weights):
+            raise ValueError("weights must be non-negative")
+
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("at least one weight must be positive")
+
+        self.items = tuple(items)
+        self.weights = tuple(float(w) for w in weights)
+        self.total_weight = total
+        self._size = size = len(self.items)
+
+        scaled = [w * size / total for w in self.weights]
+        prob = [0.0] * size
+        alias = list(range(size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+
+        # Whatever is left over is 1.0 up to floating point error
+        for i in large + small:
+            prob[i] = 1.0
+
+        self._prob = prob
+        self._alias = alias
+
+    def __len__(self):
+        return self._size
+
+    def draw(self, rng: random.Random = random):
+        """Draw a single item"""
+        u = rng.random() * self._size
+        i = int(u)
+        if u - i < self._prob[i]:
+            return self.items[i]
+        return self.items[self._alias[i]]
+
+    def draw_many(self, count: int, rng: random.Random = random) -> list:
+        """Draw ``count`` items with replacement"""
+        size = self._size
+        prob = self._prob
+        alias = self._alias
+        items = self.items
+        rand = rng.random
+        drawn = []
+        for _ in range(count):
+            u = rand() * size
+            i = int(u)
+            drawn.append(items[i] if u - i < prob[i] else items[alias[i]])
+        return drawn
+
+    def probabilities(self) -> List[float]:
+        """Exact drop probability of every item, in pool order"""
+        return [w / self.total_weight for w in self.weights]
+
+
+def build_rarity_sampler(items: Sequence[dict], rarity_weights: Dict[str, float],
+                         default_weight: float = 1) -> WeightedSampler:
+    """Build a sampler where each item is weighted by its rarity"""
+    weights = [rarity_weights.get(item["rarity"], default_weight) for item in items]
+    return WeightedSampler(items, weights)
+
+
+class CaseSamplerRegistry:
+    """Per-case samplers that are rebuilt only when the case definition changes.
+
+    A sampler is keyed by case id and remembers the pool and odds objects it
+    was built from. As long as the caller keeps passing the same objects the
+    cached sampler is reused; passing a new pool or new odds rebuilds it.
+    Call ``invalidate`` after mutating a pool in place.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, tuple] = {}
+
+    def get(self, case_id: str) -> Optional[WeightedSampler]:
+        entry = self._entries.get(case_id)
+        return entry[2] if entry else None
+
+    def get_or_build(self, case_id: str, items: Sequence[dict],
+                     rarity_weights: Dict[str, float]) -> WeightedSampler:
+        entry = self._entries.get(case_id)
+        if entry is not None and entry[0] is items and entry[1] is rarity_weights:
+            return entry[2]
+        sampler = build_rarity_sampler(items, rarity_weights)
+        self._entries[case_id] = (items, rarity_weights, sampler)
+        return sampler
+
+    def invalidate(self, case_id: Optional[str] = None):
+        """Drop one cached sampler, or all of them when no id is given"""
+        if case_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(case_id, None)
+
+
+case_samplers = CaseSamplerRegistry()
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from database import db
+from http_clients import http_clients
+
+# Last-resort rate, used only when neither the API nor the database has one
+DEFAULT_USD_TO_RUB = 90.0
+
+# While no rate is known, readers retry the upstream at most this often
+COLD_START_RETRY_SECONDS = 30
+
+
+class ExchangeRateService:
+    """Keeps the current exchange rate in memory and refreshes it in the background.
+
+    Readers never wait on the upstream API: they get the last known rate.
+    When a refresh fails the previous rate is kept, and on a cold start the
+    rate persisted in ``exchange_rates`` is used before falling back to
+    DEFAULT_USD_TO_RUB.
+    """
+
+    def __init__(self, from_currency: str = "USD", to_currency: str = "RUB"):
+        self.from_currency = from_currency
+        self.to_currency = to_currency
+        self.rate: Optional[float] = None
+        self.updated_at: Optional[datetime] = None
+        self.source: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._cold_start_lock = asyncio.Lock()
+        self._cold_start_retry_at = 0.0
+
+    @property
+    def url(self) -> str:
+        base_url = os.environ.get('EXCHANGE_RATE_URL', 'https://api.exchangerate-api.com/v4/latest')
+        return f"{base_url}/{self.from_currency}"
+
+    @property
+    def refresh_interval(self) -> float:
+        return float(os.environ.get('EXCHANGE_RATE_REFRESH_SECONDS', '600'))
+
+    def age_seconds(self) -> Optional[float]:
+        if self.updated_at is None:
+            return None
+        return (datetime.utcnow() - self.updated_at).total_seconds()
+
+    def is_stale(self) -> bool:
+        age = self.age_seconds()
+        return age is None or age > 2 * self.refresh_interval
+
+    async def fetch(self) -> float:
+        """Get the rate from the upstream API"""
+        response = await http_clients.exchange_rate.get(self.url)
+        response.raise_for_status()
+        rate = response.json().get("rates", {}).get(self.to_currency)
+        if not rate:
+            raise ValueError(f"No {self.to_currency} rate in exchange rate response")
+        return float(rate)
+
+    async def refresh(self) -> bool:
+        """Fetch a fresh rate and persist it; returns False if the upstream failed"""
+        try:
+            rate = await self.fetch()
+        except Exception as e:
+            logging.error(f"Failed to get exchange rate: {e}")
+            if self.rate is None:
+                await self.load_persisted()
+            return False
+
+        self.rate = rate
+        self.updated_at = datetime.utcnow()
+        self.source = "api"
+        try:
+            await db.exchange_rates.replace_one(
+                {"from_currency": self.from_currency, "to_currency": self.to_currency},
+                {
+                    "from_currency": self.from_currency,
+                    "to_currency": self.to_currency,
+                    "rate": rate,
+                    "updated_at": self.updated_at
+                },
+                upsert=True
+            )
+        except Exception as e:
+            # The fresh rate is served from memory anyway; it is persisted on the next refresh
+            logging.error(f"Failed to persist exchange rate: {e}")
+        return True
+
+    async def load_persisted(self) -> bool:
+        """Load the last persisted rate; returns False if there is none"""
+        try:
+            document = await db.exchange_rates.find_one(
+                {"from_currency": self.from_currency, "to_currency": self.to_currency}
+            )
+        except Exception as e:
+            logging.error(f"Failed to load persisted exchange rate: {e}")
+            return False
+        if not document:
+            return False
+        self.rate = float(document["rate"])
+        self.updated_at = document.get("updated_at")
+        self.source = "database"
+        return True
+
+    async def _cold_start_refresh(self):
+        """Refresh while no rate is known: one request at a time, once per cooldown"""
+        async with self._cold_start_lock:
+            if self.rate is not None or time.monotonic() < self._cold_start_retry_at:
+                return
+            self._cold_start_retry_at = time.monotonic() + COLD_START_RETRY_SECONDS
+            await self.refresh()
+
+    async def get_rate(self) -> float:
+        """Current rate; only calls made before any rate is known may wait for a refresh"""
+        if self.rate is None:
+            await self._cold_start_refresh()
+        if self.rate is None:
+            return DEFAULT_USD_TO_RUB
+        return self.rate
+
+    def snapshot(self) -> dict:
+        age = self.age_seconds()
+        return {
+            "rate": self.rate if self.rate is not None else DEFAULT_USD_TO_RUB,
+            "updated_at": self.updated_at,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "source": self.source or "default",
+            "stale": self.is_stale()
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Exchange rate refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def start(self):
+        """Load the persisted rate and start refreshing in the background"""
+        await self.load_persisted()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+exchange_rate_service = ExchangeRateService()
@@ -0,0 +1,106 @@
+import os
+import importlib.util
+import aiohttp
+import httpx
+
+from metrics import InstrumentedTransport, aiohttp_trace_config
+
+
+def http2_enabled() -> bool:
+    """HTTP/2 needs the optional h2 package; without it clients use HTTP/1.1 keep-alive"""
+    return (
+        os.environ.get('HTTP2_ENABLED', 'true').lower() == 'true'
+        and importlib.util.find_spec('h2') is not None
+    )
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+class HttpClients:
+    """App-scoped pooled HTTP clients, one per upstream.
+
+    Clients are created on first use (or by ``start`` in the app lifespan)
+    and reused for every request, so connections and TLS sessions are kept
+    alive between calls. ``close`` releases all of them on shutdown.
+    """
+
+    def __init__(self):
+        self._crypto_bot = None
+        self._exchange_rate = None
+        self._steam = None
+
+    def _httpx_client(self, upstream: str) -> httpx.AsyncClient:
+        # Pool settings live on the wrapped transport, which times every call
+        transport = httpx.AsyncHTTPTransport(
+            http2=http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=_env_int('HTTP_MAX_CONNECTIONS_PER_HOST', 20),
+                max_keepalive_connections=_env_int('HTTP_MAX_KEEPALIVE_CONNECTIONS', 10),
+                keepalive_expiry=_env_float('HTTP_KEEPALIVE_EXPIRY', 30)
+            )
+        )
+        return httpx.AsyncClient(
+            transport=InstrumentedTransport(upstream, transport),
+            timeout=httpx.Timeout(
+                _env_float('HTTP_TIMEOUT', 10),
+                connect=_env_float('HTTP_CONNECT_TIMEOUT', 5)
+            )
+        )
+
+    @property
+    def crypto_bot(self) -> httpx.AsyncClient:
+        """Client for the Crypto Bot payment API"""
+        if self._crypto_bot is None:
+            self._crypto_bot = self._httpx_client("crypto_bot")
+        return self._crypto_bot
+
+    @property
+    def exchange_rate(self) -> httpx.AsyncClient:
+        """Client for the exchange rate API"""
+        if self._exchange_rate is None:
+            self._exchange_rate = self._httpx_client("exchange_rate")
+        return self._exchange_rate
+
+    @property
+    def steam(self) -> aiohttp.ClientSession:
+        """Session for Steam OpenID, Web API and Community Market (no HTTP/2 in aiohttp)"""
+        if self._steam is None or self._steam.closed:
+            self._steam = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=_env_int('HTTP_MAX_CONNECTIONS', 100),
+                    limit_per_host=_env_int('HTTP_MAX_CONNECTIONS_PER_HOST', 20),
+                    keepalive_timeout=_env_float('HTTP_KEEPALIVE_EXPIRY', 30)
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=_env_float('HTTP_TIMEOUT', 10),
+                    connect=_env_float('HTTP_CONNECT_TIMEOUT', 5)
+                ),
+                trace_configs=[aiohttp_trace_config("steam")]
+            )
+        return self._steam
+
+    async def start(self):
+        """Create every client up front; must run inside the event loop"""
+        self.crypto_bot
+        self.exchange_rate
+        self.steam
+
+    async def close(self):
+        if self._crypto_bot is not None:
+            await self._crypto_bot.aclose()
+            self._crypto_bot = None
+        if self._exchange_rate is not None:
+            await self._exchange_rate.aclose()
+            self._exchange_rate = None
+        if self._steam is not None:
+            await self._steam.close()
+            self._steam = None
+
+
+http_clients = HttpClients()
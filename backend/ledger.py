@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from database import db, mongo, record_ledger_entry
+from models import BalanceReason
+
+# Entries younger than this are left out of snapshots. ObjectIds from
+# different workers are only ordered by their timestamp second, so a fresh
+# entry could still appear "behind" a snapshot boundary; old ones cannot.
+SETTLE_SECONDS = 60
+
+
+async def get_last_snapshot(steam_id: str) -> Optional[dict]:
+    return await db.ledger_snapshots.find_one(
+        {"user_steam_id": steam_id},
+        sort=[("through_id", -1)]
+    )
+
+
+async def _sum_entries(steam_id: str, after_id: Optional[ObjectId] = None,
+                       before_id: Optional[ObjectId] = None) -> dict:
+    id_range = {}
+    if after_id is not None:
+        id_range["$gt"] = after_id
+    if before_id is not None:
+        id_range["$lt"] = before_id
+    match = {"user_steam_id": steam_id}
+    if id_range:
+        match["_id"] = id_range
+
+    totals = {"amount": 0, "count": 0, "last_id": None}
+    async for row in db.ledger_entries.aggregate([
+        {"$match": match},
+        {"$group": {"_id": None, "amount": {"$sum": "$amount"}, "count": {"$sum": 1}, "last_id": {"$max": "$_id"}}}
+    ]):
+        totals = {"amount": row["amount"], "count": row["count"], "last_id": row["last_id"]}
+    return totals
+
+
+async def get_ledger_balance(steam_id: str) -> dict:
+    """Balance according to the ledger: last snapshot plus the entries after it"""
+    snapshot = await get_last_snapshot(steam_id)
+    after_id = snapshot["through_id"] if snapshot else None
+    tail = await _sum_entries(steam_id, after_id=after_id)
+    return {
+        "balance": (snapshot["balance"] if snapshot else 0) + tail["amount"],
+        "snapshot_at": snapshot["created_at"] if snapshot else None,
+        "entries_after_snapshot": tail["count"]
+    }
+
+
+async def compact(steam_id: str) -> Optional[dict]:
+    """Fold settled entries since the last snapshot into a new snapshot.
+
+    Entries are never modified or removed; a snapshot only records the
+    running total up to an entry so later reads don't have to rescan it.
+    Returns the new snapshot, or None if there was nothing to fold.
+    """
+    snapshot = await get_last_snapshot(steam_id)
+    boundary = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS))
+    totals = await _sum_entries(
+        steam_id,
+        after_id=snapshot["through_id"] if snapshot else None,
+        before_id=boundary
+    )
+    if totals["count"] == 0:
+        return None
+
+    new_snapshot = {
+        "user_steam_id": steam_id,
+        "balance": (snapshot["balance"] if snapshot else 0) + totals["amount"],
+        "through_id": totals["last_id"],
+        "entry_count": (snapshot["entry_count"] if snapshot else 0) + totals["count"],
+        "created_at": datetime.utcnow()
+    }
+    try:
+        await db.ledger_snapshots.insert_one(new_snapshot)
+    except DuplicateKeyError:
+        # Another worker compacted the same range first
+        return None
+    return new_snapshot
+
+
+async def reconcile(steam_id: str) -> dict:
+    """Compare the cached balance on the user with the ledger balance"""
+    user = await db.users.find_one({"steam_id": steam_id}, {"balance": True})
+    ledger_balance = await get_ledger_balance(steam_id)
+    cached_balance = user["balance"] if user else None
+    return {
+        "steam_id": steam_id,
+        "cached_balance": cached_balance,
+        "ledger_balance": ledger_balance["balance"],
+        "drift": None if cached_balance is None else cached_balance - ledger_balance["balance"],
+        "snapshot_at": ledger_balance["snapshot_at"],
+        "entries_after_snapshot": ledger_balance["entries_after_snapshot"]
+    }
+
+
+async def get_entries(steam_id: str, limit: int = 50, before_id: Optional[ObjectId] = None) -> list:
+    """Most recent ledger entries of a user, newest first"""
+    query = {"user_steam_id": steam_id}
+    if before_id is not None:
+        query["_id"] = {"$lt": before_id}
+    return await db.ledger_entries.find(query).sort("_id", -1).limit(limit).to_list(limit)
+
+
+async def open_missing_accounts() -> int:
+    """One-off migration: give users that predate the ledger an opening entry.
+
+    Run it while traffic is low; a balance change racing with it for the
+    same user would be counted twice and show up as drift.
+    """
+    opened = 0
+    async for user in db.users.find({}, {"steam_id": True, "balance": True}):
+        if await db.ledger_entries.find_one({"user_steam_id": user["steam_id"]}, {"_id": True}):
+            continue
+        await record_ledger_entry(user, user.get("balance", 0), BalanceReason.OPENING.value)
+        opened += 1
+    return opened
+
+
+class LedgerCompactor:
+    """Periodically snapshots every user with new ledger entries"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._since: Optional[ObjectId] = None
+
+    @property
+    def interval(self) -> float:
+        return float(os.environ.get('LEDGER_COMPACTION_SECONDS', '3600'))
+
+    async def compact_all(self) -> int:
+        """Compact users with entries since the previous run; returns snapshots written"""
+        started = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS))
+        query = {"_id": {"$gte": self._since}} if self._since is not None else {}
+        written = 0
+        for steam_id in await db.ledger_entries.distinct("user_steam_id", query):
+            if await compact(steam_id):
+                written += 1
+        self._since = started
+        return written
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                written = await self.compact_all()
+                logging.info(f"Ledger compaction wrote {written} snapshots")
+            except Exception as e:
+                logging.error(f"Ledger compaction failed: {e}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+ledger_compactor = LedgerCompactor()
+
+
+async def _open_accounts():
+    try:
+        print(f"{await open_missing_accounts()} ledger accounts opened")
+    finally:
+        mongo.close()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    asyncio.run(_open_accounts())
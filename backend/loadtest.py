@@ -0,0 +1,345 @@
+"""Load test the API in-process against local stand-ins for its dependencies.
+
+The app runs with its real lifespan inside this process, behind either an
+ASGI transport (no sockets, measures the app itself) or a local uvicorn
+server (adds HTTP parsing). MongoDB is a local mongod (--mongo-url, a
+throwaway database that is dropped afterwards) or an in-memory fake
+(mongomock-motor). Steam, Crypto Bot and the exchange rate API are served
+by a fake upstream on localhost.
+
+Requests are started at a fixed rate (open loop), so a slow server shows up
+as growing latency instead of a lower request rate:
+
+    python loadtest.py --rps 200 --duration 30 --mix cases=4,open=3,inventory=2,transactions=1,payment=1,webhook=1
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from aiohttp import web
+
+SCENARIOS = ("cases", "open", "inventory", "transactions", "payment", "webhook")
+
+DEFAULT_MIX = "cases=4,open=3,inventory=2,transactions=1,payment=1,webhook=1"
+
+# Balance given to every simulated user, in kopecks
+USER_BALANCE = 10 ** 12
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeUpstream:
+    """Minimal Steam, Crypto Bot and exchange rate APIs on one local port"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.port = free_port()
+        self._invoice_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def environment(self) -> Dict[str, str]:
+        return {
+            "CRYPTO_BOT_BASE_URL": f"{self.base_url}/cryptobot",
+            "STEAM_API_URL": f"{self.base_url}/steam",
+            "STEAM_MARKET_URL": f"{self.base_url}/market/priceoverview/",
+            "EXCHANGE_RATE_URL": f"{self.base_url}/rates",
+        }
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def create_invoice(self, request: web.Request) -> web.Response:
+        await self._delay()
+        body = await request.json()
+        invoice_id = next(self._invoice_ids)
+        return web.json_response({"ok": True, "result": {
+            "invoice_id": invoice_id,
+            "amount": body["amount"],
+            "pay_url": f"{self.base_url}/pay/{invoice_id}"
+        }})
+
+    async def get_me(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"ok": True, "result": {"app_id": 1, "name": "loadtest"}})
+
+    async def player_summaries(self, request: web.Request) -> web.Response:
+        await self._delay()
+        steam_id = request.query.get("steamids", "0")
+        return web.json_response({"response": {"players": [{
+            "steamid": steam_id,
+            "personaname": f"Player_{steam_id[-4:]}",
+            "avatarfull": f"{self.base_url}/avatar.png",
+            "profileurl": f"{self.base_url}/profiles/{steam_id}"
+        }]}})
+
+    async def price_overview(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"success": True, "lowest_price": f"{random.randint(10, 50000)},00 pуб."})
+
+    async def rates(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"base": request.match_info["currency"], "rates": {"RUB": 90.0}})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/cryptobot/createInvoice", self.create_invoice)
+        app.router.add_get("/cryptobot/getMe", self.get_me)
+        app.router.add_get("/steam/ISteamUser/GetPlayerSummaries/v0002/", self.player_summaries)
+        app.router.add_get("/market/priceoverview/", self.price_overview)
+        app.router.add_get("/rates/{currency}", self.rates)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadTest:
+    """Drives a weighted mix of scenarios at a target rate and records latencies"""
+
+    def __init__(self, client: httpx.AsyncClient, tokens: List[str], case_ids: List[str]):
+        self.client = client
+        self.tokens = tokens
+        self.case_ids = case_ids
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.skipped = 0
+        self.invoices: List[int] = []
+
+    def _auth(self) -> dict:
+        return {"Authorization": f"Bearer {random.choice(self.tokens)}"}
+
+    async def cases(self):
+        return await self.client.get("/api/cases")
+
+    async def open(self):
+        return await self.client.post(f"/api/cases/{random.choice(self.case_ids)}/open", headers=self._auth())
+
+    async def inventory(self):
+        return await self.client.get("/api/user/inventory", params={"limit": 50}, headers=self._auth())
+
+    async def transactions(self):
+        return await self.client.get("/api/user/transactions", headers=self._auth())
+
+    async def payment(self):
+        response = await self.client.post(
+            "/api/create-crypto-payment",
+            json={"amount_usd": 10, "crypto_currency": "USDT"},
+            headers=self._auth()
+        )
+        if response.status_code == 200:
+            self.invoices.append(response.json()["invoice_id"])
+        return response
+
+    async def webhook(self):
+        # Pay an invoice created by the payment scenario, or send an unknown one
+        invoice_id = self.invoices.pop() if self.invoices else f"unknown-{uuid.uuid4().hex}"
+        return await self.client.post("/api/webhook/crypto-bot", json={
+            "update_id": uuid.uuid4().hex,
+            "update_type": "invoice_paid",
+            "payload": {"invoice_id": invoice_id}
+        })
+
+    async def _timed(self, name: str):
+        started = time.perf_counter()
+        try:
+            response = await getattr(self, name)()
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        self.latencies[name].append(time.perf_counter() - started)
+        if failed:
+            self.errors[name] += 1
+
+    async def run(self, mix: Dict[str, float], rps: float, duration: float, max_in_flight: int) -> float:
+        """Start requests at ``rps`` for ``duration`` seconds; returns the elapsed time"""
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        in_flight = set()
+        interval = 1.0 / rps
+        started = time.perf_counter()
+        for index in itertools.count():
+            due = started + index * interval
+            if due - started >= duration:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(in_flight) >= max_in_flight:
+                # The server can't keep up; count it instead of queueing without bound
+                self.skipped += 1
+                continue
+            task = asyncio.create_task(self._timed(random.choices(names, weights)[0]))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(self.latencies):
+            samples = np.array(self.latencies[name]) * 1000
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            endpoints[name] = {
+                "requests": len(samples),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(samples) / elapsed, 1),
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "p99_ms": round(float(p99), 2),
+                "max_ms": round(float(samples.max()), 2)
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 1),
+            "skipped": self.skipped,
+            "endpoints": endpoints
+        }
+
+
+def print_report(report: dict):
+    print(f"{report['requests']} requests in {report['elapsed_seconds']}s "
+          f"({report['throughput_rps']} req/s, {report['skipped']} skipped at the in-flight limit)")
+    print(f"{'endpoint':<14}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:<14}{row['requests']:>9}{row['errors']:>8}{row['throughput_rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}")
+
+
+async def seed_users(db, count: int) -> List[str]:
+    """Create users with a large balance; returns their Steam IDs"""
+    steam_ids = [f"7656119{random.randint(10 ** 9, 10 ** 10 - 1)}" for _ in range(count)]
+    await db.users.insert_many([
+        {
+            "steam_id": steam_id,
+            "username": f"Player_{steam_id[-4:]}",
+            "avatar": "",
+            "profile_url": "",
+            "balance": USER_BALANCE
+        }
+        for steam_id in steam_ids
+    ])
+    return steam_ids
+
+
+async def main(args):
+    upstream = FakeUpstream(latency=args.upstream_latency / 1000)
+    os.environ.update(upstream.environment())
+    os.environ.setdefault("SESSION_SECRET", uuid.uuid4().hex)
+    db_name = f"loadtest_{uuid.uuid4().hex[:8]}"
+    os.environ["DB_NAME"] = db_name
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+
+    # Import after the environment points every upstream at the fakes
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+    from database import db, mongo
+
+    if not args.mongo_url:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("Install mongomock-motor or pass --mongo-url to use a local mongod")
+        # connect() keeps an existing client, so the lifespan uses the fake
+        mongo.client = AsyncMongoMockClient()
+        mongo.database = mongo.client[db_name]
+        mongo.transactions_supported = False
+
+    await upstream.start()
+    try:
+        async with server.app.router.lifespan_context(server.app):
+            steam_ids = await seed_users(db, args.users)
+            tokens = [server.steam_auth_instance.generate_jwt_token(steam_id, {}) for steam_id in steam_ids]
+            case_ids = [case["id"] for case in server.case_catalog]
+
+            if args.transport == "http":
+                import uvicorn
+                port = free_port()
+                config = uvicorn.Config(server.app, host="127.0.0.1", port=port, lifespan="off", log_level="warning")
+                http_server = uvicorn.Server(config)
+                serve_task = asyncio.create_task(http_server.serve())
+                while not http_server.started:
+                    await asyncio.sleep(0.05)
+                client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout,
+                                           limits=httpx.Limits(max_connections=args.max_in_flight))
+            else:
+                client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app),
+                                           base_url="http://loadtest", timeout=args.timeout)
+
+            try:
+                load_test = LoadTest(client, tokens, case_ids)
+                elapsed = await load_test.run(parse_mix(args.mix), args.rps, args.duration, args.max_in_flight)
+            finally:
+                await client.aclose()
+                if args.transport == "http":
+                    http_server.should_exit = True
+                    await serve_task
+
+            if args.mongo_url:
+                await mongo.client.drop_database(db_name)
+    finally:
+        await upstream.stop()
+
+    report = load_test.report(elapsed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load test the API against local stand-ins")
+    parser.add_argument("--rps", type=float, default=50, help="Requests started per second")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to generate load")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"Weighted scenarios, name=weight (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=100, help="Simulated users")
+    parser.add_argument("--mongo-url", help="Local mongod to use instead of the in-memory fake")
+    parser.add_argument("--transport", choices=("asgi", "http"), default="asgi",
+                        help="Call the app directly or through a local uvicorn server")
+    parser.add_argument("--upstream-latency", type=float, default=0, help="Added latency of fake upstreams, ms")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Skip requests beyond this many in flight")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    return parser
+
+
+if __name__ == "__main__":
+    asyncio.run(main(build_parser().parse_args()))
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from case_catalog import case_catalog
+from database import db, mongo
+from http_clients import http_clients
+from skins_database import get_all_skins
+
+# Steam appid of CS2 and currency code of RUB on the Community Market
+STEAM_APP_ID = 730
+STEAM_CURRENCY_RUB = 5
+
+# Longest pause after repeated 429s
+MAX_BACKOFF_SECONDS = 300
+
+
+def parse_market_price(price_text: str) -> Optional[int]:
+    """Parse a market price such as "1 234,56 pуб." into kopecks"""
+    match = re.search(r"\d[\d\s.,]*", price_text.replace("\xa0", " "))
+    if not match:
+        return None
+    number = re.sub(r"\s", "", match.group(0)).rstrip(".,")
+    # The last separator followed by one or two digits is the decimal one
+    decimal = re.search(r"[.,](\d{1,2})$", number)
+    if decimal:
+        whole = re.sub(r"[.,]", "", number[:decimal.start()])
+        fraction = decimal.group(1).ljust(2, "0")
+    else:
+        whole = re.sub(r"[.,]", "", number)
+        fraction = "00"
+    return int(whole or "0") * 100 + int(fraction)
+
+
+class PriceMap:
+    """Current market prices in kopecks keyed by market_hash_name"""
+
+    def __init__(self):
+        self._prices: Dict[str, int] = {}
+        # Bumped on every update so indexes built from prices know when to rebuild
+        self.version = 0
+
+    def update(self, prices: Dict[str, int]):
+        self._prices.update(prices)
+        self.version += 1
+
+    def market_price(self, market_hash_name: str) -> Optional[int]:
+        """Known market price of a skin, or None"""
+        return self._prices.get(market_hash_name)
+
+    def price_of(self, item: dict) -> int:
+        """Market price of an item, or its catalog price if none is known"""
+        return self._prices.get(item.get("market_hash_name"), item["price"])
+
+    def priced(self, item: dict) -> dict:
+        """Copy of an item carrying its current market price"""
+        return {**item, "price": self.price_of(item)}
+
+    def below(self, price: int) -> dict:
+        """Mongo filter for items whose price_of is below ``price``.
+
+        Items with a known market price are matched by name and the rest by
+        their recorded price, so a selection agrees with what it is paid at.
+        """
+        cheap = [name for name, market_price in self._prices.items() if market_price < price]
+        return {"$or": [
+            {"market_hash_name": {"$in": cheap}},
+            {"market_hash_name": {"$nin": list(self._prices)}, "price": {"$lt": price}}
+        ]}
+
+    def __len__(self):
+        return len(self._prices)
+
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("Steam market rate limit hit")
+        self.retry_after = retry_after
+
+
+class RequestBudget:
+    """Spaces requests evenly to stay within a per-minute budget.
+
+    ``pause`` holds back every caller, so one 429 slows down the whole
+    refresher instead of only the request that hit it.
+    """
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._paused_until)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class SteamPriceRefresher:
+    """Walks the catalog and refreshes prices from Steam's priceoverview endpoint.
+
+    Requests are bounded by both a per-minute budget and a concurrency
+    limit; a 429 pauses everything with exponential backoff. Results are
+    applied to ``price_map`` and upserted into ``skin_prices`` one batch at
+    a time, so indexes built from the price map rebuild once per batch
+    rather than once per price.
+    """
+
+    def __init__(self, price_map: PriceMap):
+        self.price_map = price_map
+        self._task: Optional[asyncio.Task] = None
+        self._manual_task: Optional[asyncio.Task] = None
+        self.last_run: Optional[dict] = None
+        self.running = False
+
+    @property
+    def url(self) -> str:
+        return os.environ.get('STEAM_MARKET_URL', 'https://steamcommunity.com/market/priceoverview/')
+
+    @property
+    def requests_per_minute(self) -> float:
+        return float(os.environ.get('MARKET_PRICE_REQUESTS_PER_MINUTE', '20'))
+
+    @property
+    def concurrency(self) -> int:
+        return int(os.environ.get('MARKET_PRICE_CONCURRENCY', '2'))
+
+    @property
+    def max_retries(self) -> int:
+        return int(os.environ.get('MARKET_PRICE_MAX_RETRIES', '5'))
+
+    @property
+    def refresh_interval(self) -> float:
+        return float(os.environ.get('MARKET_PRICE_REFRESH_SECONDS', '21600'))
+
+    @property
+    def write_batch_size(self) -> int:
+        return int(os.environ.get('MARKET_PRICE_WRITE_BATCH', '50'))
+
+    async def fetch_price(self, market_hash_name: str) -> Optional[int]:
+        """Get the lowest listing price of one item in kopecks"""
+        params = {
+            "appid": STEAM_APP_ID,
+            "currency": STEAM_CURRENCY_RUB,
+            "market_hash_name": market_hash_name
+        }
+        async with http_clients.steam.get(self.url, params=params) as response:
+            if response.status == 429:
+                retry_after = response.headers.get("Retry-After")
+                raise RateLimitedError(float(retry_after) if retry_after and retry_after.isdigit() else None)
+            if response.status != 200:
+                return None
+            data = await response.json(content_type=None)
+        if not data or not data.get("success"):
+            return None
+        price_text = data.get("lowest_price") or data.get("median_price")
+        return parse_market_price(price_text) if price_text else None
+
+    async def _fetch_with_backoff(self, market_hash_name: str, budget: RequestBudget) -> Optional[int]:
+        for attempt in range(self.max_retries + 1):
+            await budget.acquire()
+            try:
+                return await self.fetch_price(market_hash_name)
+            except RateLimitedError as e:
+                delay = e.retry_after or min(MAX_BACKOFF_SECONDS, budget.interval * 2 ** (attempt + 1))
+                delay += random.uniform(0, budget.interval)
+                logging.warning(f"Steam market rate limited, backing off {delay:.0f}s")
+                budget.pause(delay)
+            except Exception as e:
+                logging.error(f"Error fetching Steam price for {market_hash_name}: {e}")
+                return None
+        return None
+
+    async def _apply(self, prices: Dict[str, int]):
+        """Publish a batch of refreshed prices in memory and persist it"""
+        if not prices:
+            return
+        self.price_map.update(prices)
+        await self._write(prices)
+
+    async def _write(self, prices: Dict[str, int]):
+        if not prices:
+            return
+        now = datetime.utcnow()
+        await db.skin_prices.bulk_write([
+            UpdateOne(
+                {"market_hash_name": name},
+                {"$set": {"price": price, "updated_at": now}},
+                upsert=True
+            )
+            for name, price in prices.items()
+        ], ordered=False)
+
+    async def refresh(self, market_hash_names: Iterable[str]) -> dict:
+        """Refresh prices of the given items; returns run statistics"""
+        if self.running:
+            raise RuntimeError("A price refresh is already running")
+        self.running = True
+        try:
+            return await self._refresh(list(dict.fromkeys(market_hash_names)))
+        finally:
+            self.running = False
+
+    async def _refresh(self, names: List[str]) -> dict:
+        budget = RequestBudget(self.requests_per_minute)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending: Dict[str, int] = {}
+        stats = {"requested": len(names), "updated": 0, "failed": 0, "started_at": datetime.utcnow()}
+
+        async def refresh_one(name: str):
+            async with semaphore:
+                price = await self._fetch_with_backoff(name, budget)
+            if price is None:
+                stats["failed"] += 1
+                return
+            pending[name] = price
+            stats["updated"] += 1
+            if len(pending) >= self.write_batch_size:
+                batch = dict(pending)
+                pending.clear()
+                await self._apply(batch)
+
+        await asyncio.gather(*(refresh_one(name) for name in names))
+        await self._apply(pending)
+
+        stats["finished_at"] = datetime.utcnow()
+        self.last_run = stats
+        return stats
+
+    async def load(self) -> int:
+        """Load persisted prices into the price map; returns how many were loaded"""
+        prices = {}
+        async for document in db.skin_prices.find({}, {"market_hash_name": True, "price": True}):
+            prices[document["market_hash_name"]] = document["price"]
+        self.price_map.update(prices)
+        return len(prices)
+
+    @property
+    def refresh_enabled(self) -> bool:
+        return os.environ.get('MARKET_PRICE_REFRESH_ENABLED', 'false').lower() == 'true'
+
+    @property
+    def reload_interval(self) -> float:
+        return float(os.environ.get('MARKET_PRICE_RELOAD_SECONDS', '300'))
+
+    async def _run(self):
+        while True:
+            if self.refresh_enabled:
+                try:
+                    stats = await self.refresh(catalog_market_hash_names())
+                    logging.info(f"Steam prices refreshed: {stats['updated']} updated, {stats['failed']} failed")
+                except Exception as e:
+                    logging.error(f"Steam price refresh failed: {e}")
+                await asyncio.sleep(self.refresh_interval)
+            else:
+                # Another process refreshes; just pick up what it persisted
+                await asyncio.sleep(self.reload_interval)
+                try:
+                    await self.load()
+                except Exception as e:
+                    logging.error(f"Failed to reload skin prices: {e}")
+
+    async def start(self):
+        """Load persisted prices and keep them current in the background.
+
+        Only processes with MARKET_PRICE_REFRESH_ENABLED=true call Steam, so
+        running several workers does not multiply the request budget; the
+        others periodically reload the persisted prices.
+        """
+        try:
+            await self.load()
+        except Exception as e:
+            logging.error(f"Failed to load persisted skin prices: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def refresh_now(self) -> int:
+        """Start a refresh of the whole catalog in the background; returns its size.
+
+        Raises RuntimeError if this process doesn't refresh prices or a
+        refresh is already running.
+        """
+        if not self.refresh_enabled:
+            raise RuntimeError("Price refresh is disabled on this process")
+        if self.running or (self._manual_task is not None and not self._manual_task.done()):
+            raise RuntimeError("A price refresh is already running")
+        names = catalog_market_hash_names()
+        self._manual_task = asyncio.create_task(self.refresh(names))
+        self._manual_task.add_done_callback(self._log_manual_refresh)
+        return len(names)
+
+    @staticmethod
+    def _log_manual_refresh(task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logging.error(f"Steam price refresh failed: {task.exception()}")
+        else:
+            stats = task.result()
+            logging.info(f"Steam prices refreshed: {stats['updated']} updated, {stats['failed']} failed")
+
+    async def stop(self):
+        for task in (self._task, self._manual_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                except Exception:
+                    # Already logged by _log_manual_refresh
+                    pass
+        self._task = None
+        self._manual_task = None
+
+
+def catalog_market_hash_names() -> List[str]:
+    """Every market_hash_name that can drop from a case or is in the skins catalog"""
+    names = [skin["market_hash_name"] for skin in get_all_skins()]
+    for case in case_catalog:
+        names.extend(item["market_hash_name"] for item in case["drop_pool"])
+    return list(dict.fromkeys(names))
+
+
+price_map = PriceMap()
+price_refresher = SteamPriceRefresher(price_map)
+
+
+async def _refresh_once():
+    try:
+        stats = await price_refresher.refresh(catalog_market_hash_names())
+        print(f"{stats['updated']} prices updated, {stats['failed']} failed")
+    finally:
+        await http_clients.close()
+        mongo.close()
+
+
+if __name__ == "__main__":
+    from pathlib import Path
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    asyncio.run(_refresh_once())
@@ -0,0 +1,285 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+import httpx
+from pymongo import monitoring
+
+# Histogram buckets in seconds, from fast cache hits to slow upstream calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        # Pymongo listeners run on driver threads, not only on the event loop
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # Per label set: count per bucket (last one is +Inf), sum, count
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()}
+        lines = []
+        for key, (bucket_counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+# HTTP server
+http_requests = registry.register(Counter(
+    "http_requests_total", "Requests handled, by route template and status", ("method", "route", "status")
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled"
+))
+
+# MongoDB
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command", ("collection", "command")
+))
+mongo_command_failures = registry.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands by collection and command", ("collection", "command")
+))
+
+# Outbound HTTP
+upstream_request_duration = registry.register(Histogram(
+    "upstream_request_duration_seconds", "Outbound call latency by upstream", ("upstream",)
+))
+upstream_requests = registry.register(Counter(
+    "upstream_requests_total", "Outbound calls by upstream and outcome (2xx, 4xx, 5xx or error)", ("upstream", "outcome")
+))
+
+# Business
+cases_opened = registry.register(Counter(
+    "cases_opened_total", "Cases opened, by case id", ("case_id",)
+))
+upgrades = registry.register(Counter(
+    "upgrades_total", "Resolved upgrades, by outcome", ("outcome",)
+))
+balance_debited = registry.register(Counter(
+    "balance_debited_kopecks_total", "Kopecks taken from balances, by reason", ("reason",)
+))
+balance_credited = registry.register(Counter(
+    "balance_credited_kopecks_total", "Kopecks added to balances, by reason", ("reason",)
+))
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records latency and status per route template.
+
+    The template (``/api/cases/{case_id}/open``) rather than the raw path is
+    used as label so ids in URLs don't create a time series each. Requests
+    that match no route are labelled ``unmatched``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_request_duration.observe(time.perf_counter() - started, method=method, route=route_path)
+            http_requests.inc(method=method, route=route_path, status=status["code"])
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Times every MongoDB command by the collection it targets"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections: Dict[tuple, str] = {}
+
+    @staticmethod
+    def _event_key(event) -> tuple:
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        # Most commands name their collection as the value of the command key
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._collections[self._event_key(event)] = collection
+
+    def _finish(self, event) -> str:
+        with self._lock:
+            return self._collections.pop(self._event_key(event), "")
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        mongo_command_duration.observe(
+            event.duration_micros / 1e6, collection=collection, command=event.command_name
+        )
+
+    def failed(self, event):
+        collection = self._finish(event)
+        mongo_command_duration.observe(
+            event.duration_micros / 1e6, collection=collection, command=event.command_name
+        )
+        mongo_command_failures.inc(collection=collection, command=event.command_name)
+
+
+def _record_upstream(upstream: str, elapsed: float, status: Optional[int]):
+    upstream_request_duration.observe(elapsed, upstream=upstream)
+    outcome = "error" if status is None else f"{status // 100}xx"
+    upstream_requests.inc(upstream=upstream, outcome=outcome)
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """httpx transport wrapper that times calls to one upstream"""
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except Exception:
+            _record_upstream(self.upstream, time.perf_counter() - started, None)
+            raise
+        _record_upstream(self.upstream, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def aiohttp_trace_config(upstream: str) -> aiohttp.TraceConfig:
+    """Trace config that times every request of an aiohttp session"""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        _record_upstream(upstream, time.perf_counter() - context.started, params.response.status)
+
+    async def on_request_exception(session, context, params):
+        _record_upstream(upstream, time.perf_counter() - context.started, None)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+command_timer = CommandTimer()
@@ -1,8 +1,19 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
+from enum import Enum
 import uuid
 
+class BalanceReason(str, Enum):
+    """Why a balance changed; stored on every ledger entry"""
+    CASE_OPEN = "case_open"
+    PROMO = "promo"
+    CRYPTO_PAYMENT = "crypto_payment"
+    SELL = "sell"
+    MANUAL = "manual"
+    OPENING = "opening"
+    BATTLE = "battle"
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     steam_id: str
@@ -1,9 +1,8 @@
-from fastapi import FastAPI, APIRouter, Request, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, Request, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import sys
 import logging
@@ -11,11 +10,15 @@ from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
+import asyncio
 from datetime import datetime
-import aiohttp
 import json
-import httpx
+import base64
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
 from enum import Enum
+from contextlib import asynccontextmanager
 
 # Add current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -24,19 +27,56 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import steam_auth
 from models import *
 from database import *
+from case_catalog import case_catalog
+from http_clients import http_clients
+from exchange_rates import exchange_rate_service
+from market_prices import price_map, price_refresher, catalog_market_hash_names
+from webhook_inbox import webhook_inbox, RetryLater
+import ledger
+from write_behind import case_results_writer
+from drop_feed import drop_feed
+import metrics
+from battles import battle_manager, BattleError
+from upgrades import skin_price_index, upgrade_item, UpgradeError
+from skin_search import skin_search_index
+from case_simulator import simulate_sampler, expected_value, DEFAULT_OPENINGS
 
 steam_auth_instance = steam_auth.steam_auth
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared MongoDB and HTTP pools on startup and close them on shutdown"""
+    mongo.connect()
+    # Not awaited: an unreachable MongoDB must not keep the app from starting
+    index_task = asyncio.create_task(ensure_indexes_with_retry())
+    await http_clients.start()
+    await exchange_rate_service.start()
+    await price_refresher.start()
+    await webhook_inbox.start()
+    await ledger.ledger_compactor.start()
+    await case_results_writer.start()
+    await drop_feed.start()
+    await battle_manager.start()
+    await sale_claim_sweeper.start()
+    yield
+    await sale_claim_sweeper.stop()
+    await battle_manager.stop()
+    await drop_feed.stop()
+    await case_results_writer.stop()
+    await ledger.ledger_compactor.stop()
+    await webhook_inbox.stop()
+    await price_refresher.stop()
+    await exchange_rate_service.stop()
+    index_task.cancel()
+    await asyncio.gather(index_task, return_exceptions=True)
+    await http_clients.close()
+    mongo.close()
 
 # Create the main app without a prefix
-app = FastAPI(title="Case Battle API")
+app = FastAPI(title="Case Battle API", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -46,7 +86,29 @@ security = HTTPBearer()
 
 # Crypto Bot API configuration
 CRYPTO_BOT_TOKEN = os.environ.get('CRYPTO_BOT_TOKEN', '')
-CRYPTO_BOT_BASE_URL = "https://pay.crypt.bot/api"
+CRYPTO_BOT_BASE_URL = os.environ.get('CRYPTO_BOT_BASE_URL', "https://pay.crypt.bot/api")
+
+# Maximum number of cases that can be opened in one batch request
+MAX_BATCH_OPEN = 100
+
+# Maximum number of inventory items returned per page
+MAX_INVENTORY_PAGE = 200
+
+# Maximum number of item ids in one sell request
+MAX_SELL_ITEMS = 500
+
+# Share of an item's price paid when it is sold back; the rest is the house spread
+SELL_BACK_RATE = float(os.environ.get('SELL_BACK_RATE', '0.7'))
+
+# Upper bound for a single admin simulation run
+MAX_SIMULATED_OPENINGS = 20_000_000
+
+# Steam IDs allowed to use admin endpoints (comma separated)
+ADMIN_STEAM_IDS = {
+    steam_id.strip()
+    for steam_id in os.environ.get('ADMIN_STEAM_IDS', '').split(',')
+    if steam_id.strip()
+}
 
 # Supported cryptocurrencies
 SUPPORTED_CRYPTO = ["USDT", "TON", "TRX", "BTC", "ETH", "LTC", "NOT", "BNB"]
@@ -76,6 +138,18 @@ class PaymentRequest(BaseModel):
     amount_usd: float
     crypto_currency: str
 
+class BattleCreateRequest(BaseModel):
+    case_ids: List[str]
+    max_players: int = 2
+
+class SellItemsRequest(BaseModel):
+    item_ids: Optional[List[str]] = None
+    below_price: Optional[int] = None  # Sell everything cheaper than this, in kopecks
+
+class UpgradeRequest(BaseModel):
+    item_id: str
+    target_market_hash_name: str
+
 class PromoCodeRequest(BaseModel):
     promo_code: str
     amount_rub: float
@@ -93,12 +167,11 @@ async def get_crypto_bot_me():
         "Crypto-Pay-API-Token": CRYPTO_BOT_TOKEN
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{CRYPTO_BOT_BASE_URL}/getMe",
-            headers=headers
-        )
-        return response.json()
+    response = await http_clients.crypto_bot.get(
+        f"{CRYPTO_BOT_BASE_URL}/getMe",
+        headers=headers
+    )
+    return response.json()
 
 async def create_crypto_invoice(amount_usd: float, crypto_currency: str, user_steam_id: str):
     """Create invoice via Crypto Bot API"""
@@ -116,39 +189,34 @@ async def create_crypto_invoice(amount_usd: float, crypto_currency: str, user_st
         "payload": user_steam_id
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{CRYPTO_BOT_BASE_URL}/createInvoice",
-            headers=headers,
-            json=payload
-        )
-        return response.json()
-
-async def get_current_exchange_rate():
-    """Get current USD to RUB exchange rate"""
+    response = await http_clients.crypto_bot.post(
+        f"{CRYPTO_BOT_BASE_URL}/createInvoice",
+        headers=headers,
+        json=payload
+    )
+    return response.json()
+
+# Inventory pagination
+class InventorySort(str, Enum):
+    NEWEST = "newest"
+    OLDEST = "oldest"
+    PRICE_DESC = "price_desc"
+    PRICE_ASC = "price_asc"
+
+def encode_inventory_cursor(key: dict, sort: InventorySort) -> str:
+    """Encode the key of the last item of a page as an opaque cursor"""
+    raw = json_util.dumps({"s": sort.value, "v": key["value"], "id": key["id"]})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_inventory_cursor(cursor: str, sort: InventorySort) -> dict:
+    """Decode a cursor produced by encode_inventory_cursor"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get("https://api.exchangerate-api.com/v4/latest/USD")
-            data = response.json()
-            usd_to_rub_rate = data.get("rates", {}).get("RUB", 90.0)  # fallback rate
-            
-            # Update rate in database
-            await db.exchange_rates.replace_one(
-                {"from_currency": "USD", "to_currency": "RUB"},
-                {
-                    "from_currency": "USD",
-                    "to_currency": "RUB",
-                    "rate": usd_to_rub_rate,
-                    "updated_at": datetime.utcnow()
-                },
-                upsert=True
-            )
-            
-            return usd_to_rub_rate
-    except Exception as e:
-        # Fallback rate if API fails
-        logging.error(f"Failed to get exchange rate: {e}")
-        return 90.0
+        data = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if data["s"] != sort.value:
+            raise ValueError("cursor was issued for another sort order")
+        return {"value": data["v"], "id": data["id"]}
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 # Dependency to get current user
 async def get_current_user(token: str = Depends(security)):
@@ -167,6 +235,12 @@ async def get_current_user(token: str = Depends(security)):
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
+async def get_admin_user(current_user = Depends(get_current_user)):
+    """Get current user and make sure they are an admin"""
+    if current_user["steam_id"] not in ADMIN_STEAM_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
 # Steam Authentication Routes
 @api_router.get("/auth/steam/login", response_model=SteamLoginResponse)
 async def steam_login():
@@ -214,11 +288,107 @@ async def get_profile(current_user = Depends(get_current_user)):
     """Get current user profile"""
     return current_user
 
+@api_router.get("/user/inventory/summary")
+async def get_user_inventory_summary(
+    top: int = Query(5, ge=0, le=INVENTORY_SUMMARY_TOP),
+    current_user = Depends(get_current_user)
+):
+    """Get inventory totals by rarity and the most valuable items without the full list"""
+    summary = await get_inventory_summary(str(current_user["_id"]))
+    return {**summary, "top_items": summary["top_items"][:top]}
+
 @api_router.get("/user/inventory")
-async def get_inventory(current_user = Depends(get_current_user)):
-    """Get user inventory"""
-    inventory = await get_user_inventory(current_user["_id"])
-    return {"items": inventory}
+async def get_inventory(
+    limit: int = Query(50, ge=1, le=MAX_INVENTORY_PAGE),
+    cursor: Optional[str] = None,
+    sort: InventorySort = InventorySort.NEWEST,
+    fields: Optional[str] = None,
+    rarity: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    current_user = Depends(get_current_user)
+):
+    """Get one page of user inventory (use next_cursor to fetch the next one)"""
+    requested_fields = None
+    if fields:
+        requested_fields = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested_fields if f not in INVENTORY_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    
+    items, next_key = await get_user_inventory_page(
+        str(current_user["_id"]),
+        limit=limit,
+        after=decode_inventory_cursor(cursor, sort) if cursor else None,
+        sort=sort.value,
+        fields=requested_fields,
+        rarities=[r.strip() for r in rarity.split(",") if r.strip()] if rarity else None,
+        min_price=min_price,
+        max_price=max_price
+    )
+    
+    page = []
+    for item in items:
+        item_id = str(item.pop("_id"))
+        if requested_fields:
+            # The sort field is always fetched for the cursor; drop it unless asked for
+            item = {field: item[field] for field in requested_fields if field in item}
+        page.append({"id": item_id, **item})
+    
+    return {
+        "items": page,
+        "next_cursor": encode_inventory_cursor(next_key, sort) if next_key else None
+    }
+
+def sell_back_rtp() -> float:
+    """Highest return, in percent, of opening any case and selling the drop back"""
+    return max(
+        expected_value(case_catalog.sampler_for(case)) * SELL_BACK_RATE / case["price"] * 100
+        for case in case_catalog
+    )
+
+@api_router.post("/user/inventory/sell")
+async def sell_inventory(sell_request: SellItemsRequest, current_user = Depends(get_current_user)):
+    """Sell items by id, or every item cheaper than below_price, back to the house.
+    
+    Items are paid SELL_BACK_RATE of their price: the market price where
+    it is known and the recorded item price otherwise, both for picking
+    the items and for the payout. Unavailable while some case would return
+    more than it costs when its drop is sold straight back.
+    """
+    if sell_back_rtp() > 100:
+        raise HTTPException(status_code=503, detail="Selling items is unavailable")
+    if (sell_request.item_ids is None) == (sell_request.below_price is None):
+        raise HTTPException(status_code=400, detail="Pass either item_ids or below_price")
+    
+    if sell_request.item_ids is not None:
+        if not 1 <= len(sell_request.item_ids) <= MAX_SELL_ITEMS:
+            raise HTTPException(status_code=400, detail=f"Sell 1 to {MAX_SELL_ITEMS} items at once")
+        try:
+            query = {"_id": {"$in": [ObjectId(item_id) for item_id in sell_request.item_ids]}}
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid item id")
+    else:
+        if sell_request.below_price <= 0:
+            raise HTTPException(status_code=400, detail="below_price must be positive")
+        query = price_map.below(sell_request.below_price)
+    
+    try:
+        sold_count, payout = await sell_inventory_items(
+            current_user["steam_id"], str(current_user["_id"]), query, price_map.market_price, SELL_BACK_RATE
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    updated_user = await get_user_by_steam_id(current_user["steam_id"])
+    
+    return {
+        "success": True,
+        "sold_count": sold_count,
+        "payout": payout,
+        "new_balance": updated_user["balance"]
+    }
 
 @api_router.post("/user/balance/add")
 async def add_balance(amount: int, current_user = Depends(get_current_user)):
@@ -226,7 +396,7 @@ async def add_balance(amount: int, current_user = Depends(get_current_user)):
     if amount <= 0:
         raise HTTPException(status_code=400, detail="Amount must be positive")
     
-    success = await update_user_balance(current_user["steam_id"], amount)
+    success = await update_user_balance(current_user["steam_id"], amount, BalanceReason.MANUAL.value)
     if success:
         updated_user = await get_user_by_steam_id(current_user["steam_id"])
         return {"success": True, "new_balance": updated_user["balance"]}
@@ -236,8 +406,15 @@ async def add_balance(amount: int, current_user = Depends(get_current_user)):
 # Crypto Payment Routes
 @api_router.get("/exchange-rate")
 async def get_exchange_rate():
-    rate = await get_current_exchange_rate()
-    return {"usd_to_rub": rate, "updated_at": datetime.utcnow()}
+    await exchange_rate_service.get_rate()
+    rate = exchange_rate_service.snapshot()
+    return {
+        "usd_to_rub": rate["rate"],
+        "updated_at": rate["updated_at"],
+        "age_seconds": rate["age_seconds"],
+        "source": rate["source"],
+        "stale": rate["stale"]
+    }
 
 @api_router.post("/create-crypto-payment")
 async def create_crypto_payment(payment_request: PaymentRequest, current_user = Depends(get_current_user)):
@@ -247,7 +424,7 @@ async def create_crypto_payment(payment_request: PaymentRequest, current_user =
         raise HTTPException(status_code=400, detail="Unsupported cryptocurrency")
     
     # Get current exchange rate
-    exchange_rate = await get_current_exchange_rate()
+    exchange_rate = await exchange_rate_service.get_rate()
     amount_rub = payment_request.amount_usd * exchange_rate
     
     # Create invoice via Crypto Bot
@@ -297,14 +474,6 @@ async def apply_promocode(promo_request: PromoCodeRequest, current_user = Depend
     # Convert rubles to kopecks
     amount_kopecks = int(promo_request.amount_rub * 100)
     
-    # Add balance to user
-    success = await update_user_balance(current_user["steam_id"], amount_kopecks)
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to update balance")
-    
-    # Get updated user data
-    updated_user = await get_user_by_steam_id(current_user["steam_id"])
-    
     # Create transaction record for promocode
     transaction = PaymentTransaction(
         user_steam_id=current_user["steam_id"],
@@ -317,6 +486,16 @@ async def apply_promocode(promo_request: PromoCodeRequest, current_user = Depend
         is_promocode=True
     )
     
+    # Add balance to user
+    success = await update_user_balance(
+        current_user["steam_id"], amount_kopecks, BalanceReason.PROMO.value, reference=transaction.id
+    )
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to update balance")
+    
+    # Get updated user data
+    updated_user = await get_user_by_steam_id(current_user["steam_id"])
+    
     await db.payment_transactions.insert_one(transaction.dict())
     
     return {
@@ -326,43 +505,84 @@ async def apply_promocode(promo_request: PromoCodeRequest, current_user = Depend
         "added_amount_kopecks": amount_kopecks
     }
 
+async def process_crypto_bot_update(data: dict):
+    """Apply a Crypto Bot update taken from the webhook inbox"""
+    if data.get("update_type") != "invoice_paid":
+        return
+    
+    invoice_id = str(data["payload"]["invoice_id"])
+    
+    async def settle(session):
+        # The pending -> paid transition guards the credit: only one delivery can win it
+        transaction = await db.payment_transactions.find_one_and_update(
+            {"invoice_id": invoice_id, "status": TransactionStatus.PENDING.value},
+            {
+                "$set": {
+                    "status": TransactionStatus.PAID.value,
+                    "paid_at": datetime.utcnow()
+                }
+            },
+            session=session
+        )
+        if not transaction:
+            if not await db.payment_transactions.find_one({"invoice_id": invoice_id}, {"_id": True}, session=session):
+                # The webhook beat the insert of the pending transaction; try again later
+                raise RetryLater(f"No transaction for invoice {invoice_id} yet")
+            return None
+        
+        # Convert rubles to kopecks and update user balance
+        amount_kopecks = int(transaction["amount_rub"] * 100)
+        if not await update_user_balance(
+            transaction["user_steam_id"],
+            amount_kopecks,
+            BalanceReason.CRYPTO_PAYMENT.value,
+            reference=invoice_id,
+            session=session
+        ):
+            raise RuntimeError(f"User {transaction['user_steam_id']} not found")
+        return amount_kopecks, transaction["user_steam_id"]
+    
+    result = await run_in_transaction(settle)
+    if result:
+        amount_kopecks, user_steam_id = result
+        logging.info(f"Payment processed: {amount_kopecks} kopecks added to user {user_steam_id}")
+    else:
+        logging.info(f"Invoice {invoice_id} already processed")
+
+webhook_inbox.register("crypto_bot", process_crypto_bot_update)
+
 @api_router.post("/webhook/crypto-bot")
 async def crypto_bot_webhook(request: Request):
-    """Handle webhooks from Crypto Bot"""
+    """Handle webhooks from Crypto Bot: store the update and acknowledge it.
+    
+    Only an update that is stored (or was already stored) is acknowledged
+    with 200; if the inbox can't be written Crypto Bot gets a 503 and
+    delivers the update again later.
+    """
     try:
         data = await request.json()
-        
-        # Process payment update
-        if data.get("update_type") == "invoice_paid":
-            invoice_id = str(data["payload"]["invoice_id"])
-            
-            # Find transaction by invoice_id
-            transaction = await db.payment_transactions.find_one({"invoice_id": invoice_id})
-            if not transaction:
-                return {"status": "error", "message": "Transaction not found"}
-            
-            # Update transaction status
-            await db.payment_transactions.update_one(
-                {"invoice_id": invoice_id},
-                {
-                    "$set": {
-                        "status": TransactionStatus.PAID.value,
-                        "paid_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            # Convert rubles to kopecks and update user balance
-            amount_kopecks = int(transaction["amount_rub"] * 100)
-            success = await update_user_balance(transaction["user_steam_id"], amount_kopecks)
-            
-            if success:
-                logging.info(f"Payment processed: {amount_kopecks} kopecks added to user {transaction['user_steam_id']}")
-        
-        return {"status": "ok"}
-    except Exception as e:
-        logging.error(f"Webhook error: {e}")
-        return {"status": "error", "message": str(e)}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Update must be a JSON object")
+    
+    # invoice_paid is deduplicated per invoice, anything else per update
+    if data.get("update_type") == "invoice_paid":
+        payload = data.get("payload")
+        if not isinstance(payload, dict) or payload.get("invoice_id") is None:
+            raise HTTPException(status_code=400, detail="invoice_paid update without payload.invoice_id")
+        dedup_key = f"invoice_paid:{payload['invoice_id']}"
+    else:
+        if data.get("update_id") is None:
+            raise HTTPException(status_code=400, detail="Update without update_id")
+        dedup_key = f"update:{data['update_id']}"
+    
+    try:
+        await webhook_inbox.append("crypto_bot", dedup_key, data)
+    except PyMongoError as e:
+        logging.error(f"Failed to store Crypto Bot webhook {dedup_key}: {e}")
+        raise HTTPException(status_code=503, detail="Update could not be stored, retry later")
+    return {"status": "ok"}
 
 @api_router.get("/test-crypto-bot")
 async def test_crypto_bot():
@@ -376,7 +596,9 @@ async def test_crypto_bot():
 @api_router.get("/user/transactions")
 async def get_user_transactions(current_user = Depends(get_current_user)):
     """Get user payment transactions"""
-    transactions = await db.payment_transactions.find({"user_steam_id": current_user["steam_id"]}).to_list(100)
+    transactions = await db.payment_transactions.find(
+        {"user_steam_id": current_user["steam_id"]}
+    ).sort("created_at", -1).to_list(100)
     return {"transactions": [
         {
             "id": str(t.get("_id")),
@@ -391,204 +613,368 @@ async def get_user_transactions(current_user = Depends(get_current_user)):
         for t in transactions
     ]}
 
-# Steam Market Integration
-async def get_steam_market_price(market_hash_name: str):
-    """Get item price from Steam Market"""
-    url = "https://steamcommunity.com/market/priceoverview/"
-    params = {
-        "appid": 730,  # CS2 app ID
-        "currency": 5,  # RUB
-        "market_hash_name": market_hash_name
-    }
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    price_text = data.get("lowest_price", "0 pуб.")
-                    # Extract numeric value and convert to kopecks
-                    import re
-                    price_match = re.search(r'(\d+)', price_text.replace(',', ''))
-                    if price_match:
-                        return int(float(price_match.group(1)) * 100)
-                return 0
-    except Exception as e:
-        print(f"Error fetching Steam price: {e}")
-        return 0
-
 # Case Management
 @api_router.get("/cases")
 async def get_cases():
-    """Get all available cases with updated prices"""
-    cases_data = [
-        {
-            "id": "1",
-            "name": "КОНФЕТТИ БУМ",
-            "items": 35,
-            "price": 1500,  # 15 RUB
-            "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpou-6kejhz2v_Nfz5H_uO1gb-Gw_alIITCmX5d_MR6mOzG-oLw2w2yrUo5N2j0LI6XdAU-YluE-AS9kOy918Pu6M6YwSE26CB3sGGdwULdGVNUiw/360fx360f",
-            "is_new": True
-        },
-        {
-            "id": "2", 
-            "name": "КБ КОРМИТ",
-            "items": 50,
-            "price": 7500,  # 75 RUB
-            "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpot621FAR17PLfYQJD_9W7m5a0mvLwOq7c2DMBupQn2eqVotqkiwHiqhdlMmigJtOWJwE5Zw3X8wS-yea8jcDo7c7XiSw0g89L9us/360fx360f",
-            "is_new": True
-        },
-        {
-            "id": "3",
-            "name": "КОРОЛЬ КЕЙСОВ", 
-            "items": 38,
-            "price": 13500,  # 135 RUB
-            "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpovbSsLQJf3qr3czxb49KzgL-ImOX3NrfUhGRu5Mx2gv2P8Y3w2gS3rkVsYzqlI9edJgI2NAmE-VK3wOe9h8W6uJTJzmwj5Hc3nWGdwUKnJ-gWGw/360fx360f",
-            "is_new": True
-        },
-        {
-            "id": "4",
-            "name": "АФТЕРПАТИ",
-            "items": 49, 
-            "price": 55000,  # 550 RUB
-            "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpovbSsLQJf0Ob3dDFL7929ldaOwfX3MLrFnm5u5Mx2gv2P8I2p3g3l-kY9N2yiI4KcdVVvNQyC_FO2kr3ohpHptZ6fzmwj5HcqeFN1sQ/360fx360f",
-            "is_new": True
-        },
-        {
-            "id": "5",
-            "name": "ОГНЕННАЯ ШЕСТЕРКА",
-            "items": 53,
-            "price": 95000,  # 950 RUB
-            "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpopuP1FA957ODYfi9W7927kYyDgvun4IrqyT5Q5sFo2u2T8I-niwHg8hI5ZGv3ddSSI1I5ZwzY-FO2l-e8h5C4vczXiSw0Oj2SzDo/360fx360f",
-            "is_new": True
-        },
-        {
-            "id": "6",
-            "name": "СТАНДАРТНЫЙ",
-            "items": 27,
-            "price": 7000,  # 70 RUB  
-            "image": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpopuP1FAR17P7NdTRH-t26q4SClvD7Ib6ukmJE6ct0h-zF_Jn4xlCx-UA-azjxdICWegVtYlyC-lK7wrnshZK06Z_XiSw0PXJwqWo/360fx360f"
-        }
-    ]
-    return {"cases": cases_data}
+    """Get all available cases (served from the pre-serialized catalog)"""
+    return Response(content=case_catalog.response_bytes, media_type="application/json")
 
 # Case opening with realistic CS:GO items
 @api_router.post("/cases/{case_id}/open")
 async def open_case(case_id: str, current_user = Depends(get_current_user)):
     """Open a case and get random item"""
     # Get case data
-    cases_response = await get_cases()
-    cases_data = cases_response["cases"]
-    case_data = next((c for c in cases_data if c["id"] == case_id), None)
+    case_data = case_catalog.get(case_id)
     
     if not case_data:
         raise HTTPException(status_code=404, detail="Case not found")
     
-    # Check user balance
-    if current_user["balance"] < case_data["price"]:
+    # Deduct case price only if the balance covers it, in one round trip
+    remaining_balance = await debit_user_balance(
+        current_user["steam_id"], case_data["price"], BalanceReason.CASE_OPEN.value, reference=case_id
+    )
+    if remaining_balance is None:
         raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    # Deduct case price from balance
-    await update_user_balance(current_user["steam_id"], -case_data["price"])
+    # Random item selection with realistic drop rates
+    sampler = case_catalog.sampler_for(case_data)
+    selected_item = price_map.priced(sampler.draw())
     
-    # CS:GO items with realistic data and Steam image URLs
-    items = [
-        {
-            "name": "AK-47 | Редлайн",
-            "rarity": "rare",
-            "price": 850000,  # 8500 RUB
-            "market_hash_name": "AK-47 | Redline (Field-Tested)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpot7HxfDhjxszJemkV09-5gZKKkuXLPr7Vn35cppMk3L3Dp96k21Lg_EJuYjqnJNKSdFU2YVrQ_ljrwOzv1MK46pzJwHRkuCR2sCvbgVXp1gcKLrE/360fx360f",
-            "color_class": "from-red-400 to-red-600"
-        },
-        {
-            "name": "M4A4 | Хаул",
-            "rarity": "epic", 
-            "price": 1200000,  # 12000 RUB
-            "market_hash_name": "M4A4 | Howl (Field-Tested)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpou-6kejhjxszFJTwW09izh4-HluPxDKjBl2hU18l4jeHVu4is0VHi_ENqMG6iI9DEJAU9M1vY_FXqyLvs0JC6tJucm3MxuSgltH7D30vgCRVnojY/360fx360f",
-            "color_class": "from-purple-400 to-purple-600"
-        },
-        {
-            "name": "AWP | Азимов",
-            "rarity": "legendary",
-            "price": 2500000,  # 25000 RUB 
-            "market_hash_name": "AWP | Asiimov (Field-Tested)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpot621FAR17PLfYQJO5du5q4GFk8j4OrzZgiVQuJwg2O2WrdWl2Q21-0duMWH6JoWXcwVqYVyG_gC2xObugJ-16MzPn3Y3vykh5yzZgVXp1hlSLrE/360fx360f",
-            "color_class": "from-yellow-400 to-yellow-600"
-        },
-        {
-            "name": "Glock-18 | Выцветший",
-            "rarity": "common",
-            "price": 15000,  # 150 RUB
-            "market_hash_name": "Glock-18 | Fade (Factory New)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgposbaqKAxf0Ob3djFN79eJmIyPkuXLNqjFm2pT18l4jeHVu433iVa1qkprYDr7dtWRcQA3MlHS81PtyOa6hZW-6c6YzSNjvykg5H7D30vga1SMHA/360fx360f",
-            "color_class": "from-gray-400 to-gray-600"
-        },
-        {
-            "name": "USP-S | Орион",
-            "rarity": "rare",
-            "price": 320000,  # 3200 RUB
-            "market_hash_name": "USP-S | Orion (Factory New)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpoo6m1FBRp3_bGcjhQ09-jq5WYh8j_OrfYlDMEuJNz3L3C896h3wLl_xJuNzjyJdWXegZrYV6C8lXsw-3rhpW8uJqfzHYyvSJx5HfZnBS_hRhOaOE6gvfPSg/360fx360f",
-            "color_class": "from-blue-400 to-blue-600"
-        },
-        {
-            "name": "★ Карамбит | Убийство",
-            "rarity": "mythical",
-            "price": 15000000,  # 150000 RUB
-            "market_hash_name": "★ Karambit | Slaughter (Factory New)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpovbSsLQJf2PLacDBA5ciJlY20kfb5NqjYglRc7cF4n-SPrN2m21Ls_kc-YW77I4ORcQdqMwrV-VK9w7q-15W4vZTNyHZgu3Mm-z-DyLOsxaXl/360fx360f",
-            "color_class": "from-orange-400 to-orange-600"
-        },
-        {
-            "name": "P90 | Азимов",
-            "rarity": "epic",
-            "price": 450000,  # 4500 RUB
-            "market_hash_name": "P90 | Asiimov (Factory New)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpopuP1FAR17PLJYTJL49uJkIGZkfX5MaexmX5D_8l4jeHVu97ziQLl_0c5MG3wI4aScA8_MlHX-gLqk-3v0J626c7LzCcxuSAq7HzD30vgfAJdKsM/360fx360f",
-            "color_class": "from-purple-400 to-purple-600"
-        },
-        {
-            "name": "MAC-10 | Неон Rider",
-            "rarity": "common",
-            "price": 80000,  # 800 RUB
-            "market_hash_name": "MAC-10 | Neon Rider (Factory New)",
-            "image_url": "https://community.akamai.steamstatic.com/economy/image/-9a81dlWLwJ2UUGcVs_nsVtzdOEdtWwKGZZLQHTxDZ7I56KU0Zwwo4NUX4oFJZEHLbXH5ApeO4YmlhxYQknCRvCo04DEVlxkKgpou7uOFA957PfJYzh97cqJmImMn-O6YriBx2pH18l4jeHVu4-l3wXir0M6YTj3JdSSIVU7NV3X_FG5kLrqgJ-56sDLz3E3syQl43vD30vgrS5vOGY/360fx360f",
-            "color_class": "from-green-400 to-green-600"
-        }
-    ]
+    # Add item to user inventory (keep the returned item free of Mongo fields)
+    await add_item_to_inventory(str(current_user["_id"]), dict(selected_item))
     
-    # Random item selection with realistic drop rates
-    import random
-    rarity_weights = {
-        "common": 50,
-        "rare": 25, 
-        "epic": 15,
-        "legendary": 8,
-        "mythical": 2
+    # Save case result (queued when write-behind is enabled)
+    await case_results_writer.save(str(current_user["_id"]), case_id, [selected_item])
+    drop_feed.publish(current_user, case_id, [selected_item])
+    metrics.cases_opened.inc(case_id=case_id)
+    
+    return {
+        "success": True,
+        "item": selected_item,
+        "remaining_balance": remaining_balance
     }
+
+@api_router.post("/cases/{case_id}/open-batch")
+async def open_case_batch(
+    case_id: str,
+    count: int = Query(..., ge=1, le=MAX_BATCH_OPEN),
+    current_user = Depends(get_current_user)
+):
+    """Open the same case several times with a single debit"""
+    case_data = case_catalog.get(case_id)
     
-    # Filter items by rarity and select based on weights
-    weighted_items = []
-    for item in items:
-        weight = rarity_weights.get(item["rarity"], 1)
-        weighted_items.extend([item] * weight)
+    if not case_data:
+        raise HTTPException(status_code=404, detail="Case not found")
     
-    selected_item = random.choice(weighted_items)
+    # Deduct the price of all cases in one conditional update
+    total_price = case_data["price"] * count
+    remaining_balance = await debit_user_balance(
+        current_user["steam_id"], total_price, BalanceReason.CASE_OPEN.value, reference=case_id
+    )
+    if remaining_balance is None:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    # Add item to user inventory
-    await add_item_to_inventory(str(current_user["_id"]), selected_item)
+    sampler = case_catalog.sampler_for(case_data)
+    selected_items = [price_map.priced(item) for item in sampler.draw_many(count)]
     
-    # Save case result
-    await save_case_result(str(current_user["_id"]), case_id, selected_item)
+    # Persist all drops with one insert; history may be written behind
+    user_id = str(current_user["_id"])
+    await add_items_to_inventory(user_id, selected_items)
+    await case_results_writer.save(user_id, case_id, selected_items)
+    drop_feed.publish(current_user, case_id, selected_items)
+    metrics.cases_opened.inc(count, case_id=case_id)
     
     return {
         "success": True,
-        "item": selected_item,
-        "remaining_balance": current_user["balance"] - case_data["price"]
+        "items": selected_items,
+        "total_price": total_price,
+        "remaining_balance": remaining_balance
     }
 
+# Live drop feed
+# Seconds between keep-alive comments on the SSE stream
+DROP_FEED_HEARTBEAT_SECONDS = 15
+
+@api_router.get("/drops/recent")
+async def get_recent_drops():
+    """Get the most recent drops, newest last"""
+    return {"drops": list(drop_feed.recent)}
+
+@api_router.websocket("/drops/ws")
+async def drops_websocket(websocket: WebSocket):
+    """Push recent drops, then every new drop, as JSON messages"""
+    await websocket.accept()
+    recent, queue = drop_feed.subscribe()
+    try:
+        for drop in recent:
+            await websocket.send_json(drop)
+        while True:
+            drop = await queue.get()
+            if drop is None:
+                break
+            await websocket.send_json(drop)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        drop_feed.unsubscribe(queue)
+
+@api_router.get("/drops/stream")
+async def drops_stream(request: Request):
+    """Server-sent events stream of recent drops followed by every new drop"""
+    recent, queue = drop_feed.subscribe()
+    
+    async def events():
+        try:
+            for drop in recent:
+                yield f"data: {json.dumps(drop, ensure_ascii=False)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    drop = await asyncio.wait_for(queue.get(), DROP_FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if drop is None:
+                    break
+                yield f"data: {json.dumps(drop, ensure_ascii=False)}\n\n"
+        finally:
+            drop_feed.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Skins catalog search
+@api_router.get("/skins")
+async def search_skins(
+    q: str = Query("", max_length=100),
+    rarity: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Search the skins catalog by Russian or English name (ranked, paginated)"""
+    try:
+        body = skin_search_index.search_response(q, rarity, min_price, max_price, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return Response(content=body, media_type="application/json")
+
+# Upgrades
+def parse_item_id(item_id: str) -> ObjectId:
+    try:
+        return ObjectId(item_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid item id")
+
+@api_router.get("/upgrade/targets")
+async def get_upgrade_targets(
+    item_id: str,
+    min_multiplier: float = Query(1.2, gt=0),
+    max_multiplier: float = Query(20.0, gt=0),
+    limit: int = Query(50, ge=1, le=200),
+    current_user = Depends(get_current_user)
+):
+    """List skins an inventory item can be upgraded to, with the chance for each"""
+    stake = await db.inventory.find_one(
+        {"_id": parse_item_id(item_id), "user_id": str(current_user["_id"])}, {"price": True}
+    )
+    if not stake:
+        raise HTTPException(status_code=404, detail="Item not found")
+    targets = skin_price_index.targets_for(stake["price"], min_multiplier, max_multiplier)
+    return {"stake_price": stake["price"], "targets": targets[:limit]}
+
+@api_router.post("/upgrade")
+async def upgrade(upgrade_request: UpgradeRequest, current_user = Depends(get_current_user)):
+    """Stake an inventory item for a pricier skin"""
+    try:
+        result = await upgrade_item(
+            str(current_user["_id"]),
+            parse_item_id(upgrade_request.item_id),
+            upgrade_request.target_market_hash_name
+        )
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Item not found")
+    except UpgradeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    metrics.upgrades.inc(outcome="won" if result["won"] else "lost")
+    return result
+
+# Case battles
+def get_battle_room(battle_id: str):
+    try:
+        return battle_manager.get(battle_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Battle not found")
+
+@api_router.get("/battles")
+async def list_battles():
+    """List battles waiting for players on this server"""
+    return {"battles": battle_manager.list_waiting()}
+
+@api_router.post("/battles")
+async def create_battle(battle_request: BattleCreateRequest, current_user = Depends(get_current_user)):
+    """Create a battle room; the creator is its first player"""
+    try:
+        room = battle_manager.create(current_user, battle_request.case_ids, battle_request.max_players)
+    except BattleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return room.state()
+
+@api_router.get("/battles/{battle_id}")
+async def get_battle(battle_id: str):
+    """Get the current state of a battle"""
+    return get_battle_room(battle_id).state()
+
+@api_router.post("/battles/{battle_id}/join")
+async def join_battle(battle_id: str, current_user = Depends(get_current_user)):
+    """Join a battle; it starts as soon as it is full"""
+    get_battle_room(battle_id)
+    try:
+        room = await battle_manager.join(battle_id, current_user)
+    except BattleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return room.state()
+
+@api_router.post("/battles/{battle_id}/start")
+async def start_battle(battle_id: str, current_user = Depends(get_current_user)):
+    """Start a battle that isn't full yet (creator only)"""
+    get_battle_room(battle_id)
+    try:
+        room = await battle_manager.begin(battle_id, current_user)
+    except BattleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return room.state()
+
+@api_router.post("/battles/{battle_id}/leave")
+async def leave_battle(battle_id: str, current_user = Depends(get_current_user)):
+    """Leave a waiting battle; the creator leaving cancels it"""
+    get_battle_room(battle_id)
+    try:
+        room = battle_manager.leave(battle_id, current_user)
+    except BattleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return room.state()
+
+@api_router.websocket("/battles/{battle_id}/ws")
+async def battle_websocket(websocket: WebSocket, battle_id: str):
+    """Push the battle state, then every join, round and the result"""
+    room = battle_manager.rooms.get(battle_id)
+    if room is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    queue = room.subscribe()
+    try:
+        await websocket.send_json({"type": "state", "state": room.state()})
+        # A finished room's state already holds every round and the winner
+        while room.status != "finished":
+            event = await queue.get()
+            if event is None:
+                break
+            await websocket.send_json(event)
+            if event["type"] in ("finished", "cancelled"):
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        room.unsubscribe(queue)
+
+@api_router.get("/admin/cases/{case_id}/simulate")
+async def simulate_case(
+    case_id: str,
+    openings: int = Query(DEFAULT_OPENINGS, ge=1000, le=MAX_SIMULATED_OPENINGS),
+    price: Optional[int] = Query(None, gt=0),
+    seed: Optional[int] = None,
+    admin_user = Depends(get_admin_user)
+):
+    """Estimate RTP, variance and house edge of a case (optionally at a new price)"""
+    case_data = case_catalog.get(case_id)
+    
+    if not case_data:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    sampler = case_catalog.sampler_for(case_data)
+    
+    # The simulation is CPU bound, keep it off the event loop
+    report = await asyncio.to_thread(
+        simulate_sampler,
+        sampler,
+        price or case_data["price"],
+        openings=openings,
+        seed=seed
+    )
+    # What opening the case and selling the drop straight back returns
+    sell_back = report["expected_value"] * SELL_BACK_RATE / report["case_price"] * 100
+    return {"case_id": case_id, **report, "sell_back_rtp_percent": sell_back}
+
+@api_router.get("/admin/prices")
+async def get_price_refresh_status(admin_user = Depends(get_admin_user)):
+    """Report the state of the Steam market price table"""
+    return {
+        "known_prices": len(price_map),
+        "catalog_items": len(catalog_market_hash_names()),
+        "refresh_enabled": price_refresher.refresh_enabled,
+        "last_run": price_refresher.last_run
+    }
+
+@api_router.post("/admin/prices/refresh")
+async def refresh_prices(admin_user = Depends(get_admin_user)):
+    """Start a Steam market price refresh of the whole catalog in the background"""
+    try:
+        items = price_refresher.refresh_now()
+    except RuntimeError as e:
+        # Processes without MARKET_PRICE_REFRESH_ENABLED stay within the single Steam budget
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "items": items}
+
+@api_router.get("/admin/ledger/{steam_id}")
+async def get_user_ledger(
+    steam_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    admin_user = Depends(get_admin_user)
+):
+    """Reconcile a user's balance against the ledger and list recent entries"""
+    try:
+        before_id = ObjectId(before) if before else None
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid entry id")
+    
+    entries = await ledger.get_entries(steam_id, limit=limit, before_id=before_id)
+    return {
+        **await ledger.reconcile(steam_id),
+        "entries": [{**entry, "_id": str(entry["_id"])} for entry in entries]
+    }
+
+@api_router.post("/admin/ledger/{steam_id}/compact")
+async def compact_user_ledger(steam_id: str, admin_user = Depends(get_admin_user)):
+    """Fold a user's settled ledger entries into a snapshot"""
+    snapshot = await ledger.compact(steam_id)
+    if snapshot:
+        snapshot.pop("_id", None)
+        snapshot["through_id"] = str(snapshot["through_id"])
+    return {"snapshot": snapshot}
+
+@api_router.get("/admin/indexes")
+async def get_indexes(admin_user = Depends(get_admin_user)):
+    """Report missing, undeclared and unused Mongo indexes"""
+    return await get_index_report()
+
+@api_router.get("/admin/db/pool")
+async def get_db_pool_stats(admin_user = Depends(get_admin_user)):
+    """Report MongoDB connection pool settings and usage"""
+    return mongo.pool_stats()
+
+@api_router.get("/admin/db/write-behind")
+async def get_write_behind_stats(admin_user = Depends(get_admin_user)):
+    """Report the case results write-behind queue"""
+    return case_results_writer.stats()
+
 # Add original routes
 @api_router.get("/")
 async def root():
@@ -609,6 +995,13 @@ async def get_status_checks():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -623,7 +1016,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
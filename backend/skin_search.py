@@ -0,0 +1,164 @@
+import base64
+import json
+import os
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Set, Tuple
+
+from cache import TTLCache
+from market_prices import PriceMap, price_map
+from skins_database import SkinCatalog, skin_catalog
+
+# Query tokens need this share of their trigrams in a word to match it fuzzily
+MIN_TRIGRAM_OVERLAP = 0.5
+
+# Score of a query token matching a word exactly, as a prefix, or by trigrams (times overlap)
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+TRIGRAM_SCORE = 1.0
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercase words of a name; "ё" is folded into "е" so both spellings match"""
+    return _WORD.findall(text.casefold().replace("ё", "е"))
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def encode_cursor(key: Tuple[float, str]) -> str:
+    raw = json.dumps({"s": key[0], "n": key[1]}, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Decode a cursor from encode_cursor; raises ValueError if it is malformed"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(data["s"]), str(data["n"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class SkinSearchIndex:
+    """In-memory inverted index over skin names for type-ahead search.
+
+    Both the Russian display ``name`` and the English ``market_hash_name``
+    are indexed. Each query word matches a catalog word exactly, as a prefix
+    (bisect over the sorted vocabulary) or, to forgive typos and mixed
+    scripts, by trigram overlap. A skin must match every query word; skins
+    are ranked by the summed score and then by market_hash_name, which also
+    serves as the keyset for pagination.
+    """
+
+    def __init__(self, catalog: SkinCatalog, prices: PriceMap):
+        self.catalog = catalog
+        self.price_map = prices
+        self._postings: Dict[str, Set[int]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        for doc_id, skin in enumerate(catalog.skins):
+            for word in normalize(skin["name"]) + normalize(skin["market_hash_name"]):
+                self._postings.setdefault(word, set()).add(doc_id)
+        for word in self._postings:
+            for trigram in trigrams(word):
+                self._trigrams.setdefault(trigram, set()).add(word)
+        self._vocabulary = tuple(sorted(self._postings))
+        cache_size = int(os.environ.get('SKIN_SEARCH_CACHE_SIZE', '5000'))
+        cache_ttl = float(os.environ.get('SKIN_SEARCH_CACHE_TTL', '300'))
+        self._results = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Serialized pages keyed by every request parameter and the price version
+        self.response_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def _word_scores(self, query_word: str) -> Dict[str, float]:
+        """Catalog words matching one query word, with their score"""
+        scores = {}
+        low = bisect_left(self._vocabulary, query_word)
+        high = bisect_right(self._vocabulary, query_word + "￿")
+        for word in self._vocabulary[low:high]:
+            scores[word] = EXACT_SCORE if word == query_word else PREFIX_SCORE
+        query_trigrams = trigrams(query_word)
+        overlaps: Dict[str, int] = {}
+        for trigram in query_trigrams:
+            for word in self._trigrams.get(trigram, ()):
+                overlaps[word] = overlaps.get(word, 0) + 1
+        for word, overlap in overlaps.items():
+            ratio = overlap / len(query_trigrams)
+            if ratio >= MIN_TRIGRAM_OVERLAP and word not in scores:
+                scores[word] = TRIGRAM_SCORE * ratio
+        return scores
+
+    def _score(self, query: str) -> Dict[int, float]:
+        query_words = normalize(query)
+        if not query_words:
+            return {doc_id: 0.0 for doc_id in range(len(self.catalog.skins))}
+        totals: Optional[Dict[int, float]] = None
+        for query_word in query_words:
+            best: Dict[int, float] = {}
+            for word, score in self._word_scores(query_word).items():
+                for doc_id in self._postings[word]:
+                    if score > best.get(doc_id, 0):
+                        best[doc_id] = score
+            if totals is None:
+                totals = best
+            else:
+                totals = {doc_id: total + best[doc_id] for doc_id, total in totals.items() if doc_id in best}
+            if not totals:
+                return {}
+        return totals
+
+    def ranked(self, query: str = "", rarity: Optional[str] = None,
+               min_price: Optional[int] = None, max_price: Optional[int] = None) -> tuple:
+        """Matching skins at current prices as (keys, skins), best match first"""
+        cache_key = (" ".join(normalize(query)), rarity, min_price, max_price, self.price_map.version)
+        cached = self._results.get(cache_key)
+        if cached is not None:
+            return cached
+
+        matches = []
+        for doc_id, score in self._score(query).items():
+            skin = self.catalog.skins[doc_id]
+            if rarity and skin["rarity"] != rarity:
+                continue
+            price = self.price_map.price_of(skin)
+            if min_price is not None and price < min_price:
+                continue
+            if max_price is not None and price > max_price:
+                continue
+            matches.append(((-score, skin["market_hash_name"]), {**skin, "price": price, "score": round(score, 3)}))
+        matches.sort(key=lambda match: match[0])
+        result = (tuple(key for key, _ in matches), tuple(skin for _, skin in matches))
+        self._results.set(cache_key, result)
+        return result
+
+    def search(self, query: str = "", rarity: Optional[str] = None, min_price: Optional[int] = None,
+               max_price: Optional[int] = None, cursor: Optional[str] = None, limit: int = 20) -> dict:
+        """One page of results; pass next_cursor back to get the next one"""
+        keys, skins = self.ranked(query, rarity, min_price, max_price)
+        start = 0
+        if cursor:
+            score, name = decode_cursor(cursor)
+            start = bisect_right(keys, (-score, name))
+        page = skins[start:start + limit]
+        next_cursor = None
+        if start + limit < len(skins):
+            last_key = keys[start + limit - 1]
+            next_cursor = encode_cursor((-last_key[0], last_key[1]))
+        return {"items": list(page), "total": len(skins), "next_cursor": next_cursor}
+
+    def search_response(self, query: str = "", rarity: Optional[str] = None, min_price: Optional[int] = None,
+                        max_price: Optional[int] = None, cursor: Optional[str] = None, limit: int = 20) -> bytes:
+        """A page of results as JSON bytes, served from the response cache when possible"""
+        cache_key = (query, rarity, min_price, max_price, cursor, limit, self.price_map.version)
+        body = self.response_cache.get(cache_key)
+        if body is None:
+            page = self.search(query, rarity, min_price, max_price, cursor, limit)
+            body = json.dumps(page, ensure_ascii=False).encode()
+            self.response_cache.set(cache_key, body)
+        return body
+
+
+skin_search_index = SkinSearchIndex(skin_catalog, price_map)
@@ -1,6 +1,11 @@
 # Полная база данных скинов CS:GO для кейсов
 # Данные основаны на популярных скинах из Steam Community Market
 
+import logging
+from types import MappingProxyType
+
+from drop_sampler import build_rarity_sampler
+
 CSGO_SKINS_DATABASE = {
     # === НОЖИ (MYTHICAL) ===
     "knives": [
@@ -255,52 +260,94 @@ CSGO_SKINS_DATABASE = {
     ]
 }
 
+class SkinCatalog:
+    """Неизменяемый каталог скинов с заранее построенными индексами.
+
+    Строится один раз при импорте: скины хранятся как read-only mapping,
+    индексы по редкости, категории и market_hash_name - кортежи, а пулы для
+    get_skins_for_case запоминаются при первом запросе. Поиск по диапазону
+    цен - через upgrades.skin_price_index, он учитывает рыночные цены.
+    """
+
+    def __init__(self, database: dict):
+        skins = []
+        by_category = {}
+        by_rarity = {}
+        by_name = {}
+        for category, category_skins in database.items():
+            frozen = []
+            for skin in category_skins:
+                skin = MappingProxyType(dict(skin))
+                if skin["market_hash_name"] in by_name:
+                    logging.warning(f"Duplicate skin {skin['market_hash_name']} in category {category}, keeping the first")
+                    continue
+                by_name[skin["market_hash_name"]] = skin
+                by_rarity.setdefault(skin["rarity"], []).append(skin)
+                frozen.append(skin)
+            by_category[category] = tuple(frozen)
+            skins.extend(frozen)
+
+        self.skins = tuple(skins)
+        self.by_category = MappingProxyType(by_category)
+        self.by_rarity = MappingProxyType({rarity: tuple(items) for rarity, items in by_rarity.items()})
+        self.by_market_hash_name = MappingProxyType(by_name)
+
+        self._case_pools = {}
+
+    def rarity(self, rarity: str) -> tuple:
+        return self.by_rarity.get(rarity, ())
+
+    def get(self, market_hash_name: str):
+        return self.by_market_hash_name.get(market_hash_name)
+
+    def case_pool(self, case_price_range: str) -> tuple:
+        """Пул скинов для кейса данного ценового уровня (считается один раз)"""
+        pool = self._case_pools.get(case_price_range)
+        if pool is None:
+            if case_price_range == "low":  # Дешевые кейсы (до 5000 коп)
+                pool = self.rarity("common") + self.rarity("rare")[:3]
+            elif case_price_range == "medium":  # Средние кейсы (5000-50000 коп)
+                pool = (self.rarity("common")[:8] +
+                        self.rarity("rare")[:6] +
+                        self.rarity("epic")[:3])
+            elif case_price_range == "high":  # Дорогие кейсы (50000+ коп)
+                pool = (self.rarity("rare")[:5] +
+                        self.rarity("epic")[:5] +
+                        self.rarity("legendary")[:3] +
+                        self.rarity("mythical")[:2])
+            else:
+                pool = self.skins[:20]  # По умолчанию топ 20
+            self._case_pools[case_price_range] = pool
+        return pool
+
+
+skin_catalog = SkinCatalog(CSGO_SKINS_DATABASE)
+
 # Функции для работы с базой скинов
 def get_all_skins():
     """Получить все скины из базы"""
-    all_skins = []
-    for category, skins in CSGO_SKINS_DATABASE.items():
-        all_skins.extend(skins)
-    return all_skins
+    return skin_catalog.skins
 
 def get_skins_by_rarity(rarity):
     """Получить скины по редкости"""
-    all_skins = get_all_skins()
-    return [skin for skin in all_skins if skin['rarity'] == rarity]
+    return skin_catalog.rarity(rarity)
+
+# Веса редкости для случайного выпадения из всего каталога
+SKIN_RARITY_WEIGHTS = {
+    "mythical": 2,    # Ножи - самые редкие
+    "legendary": 5,   # Легендарные винтовки
+    "epic": 15,       # Эпические оружия  
+    "rare": 30,       # Редкие оружия
+    "common": 48      # Обычные оружия
+}
+
+# Сэмплер строится один раз для всего каталога
+_catalog_sampler = build_rarity_sampler(skin_catalog.skins, SKIN_RARITY_WEIGHTS)
 
 def get_random_skin_by_weight():
     """Получить случайный скин с учетом весов редкости"""
-    import random
-    
-    rarity_weights = {
-        "mythical": 2,    # Ножи - самые редкие
-        "legendary": 5,   # Легендарные винтовки
-        "epic": 15,       # Эпические оружия  
-        "rare": 30,       # Редкие оружия
-        "common": 48      # Обычные оружия
-    }
-    
-    all_skins = get_all_skins()
-    weighted_skins = []
-    
-    for skin in all_skins:
-        weight = rarity_weights.get(skin["rarity"], 1)
-        weighted_skins.extend([skin] * weight)
-    
-    return random.choice(weighted_skins)
+    return _catalog_sampler.draw()
 
 def get_skins_for_case(case_price_range="medium"):
     """Получить подходящие скины для кейса в зависимости от его цены"""
-    if case_price_range == "low":  # Дешевые кейсы (до 5000 коп)
-        return get_skins_by_rarity("common") + get_skins_by_rarity("rare")[:3]
-    elif case_price_range == "medium":  # Средние кейсы (5000-50000 коп)
-        return (get_skins_by_rarity("common")[:8] + 
-                get_skins_by_rarity("rare")[:6] + 
-                get_skins_by_rarity("epic")[:3])
-    elif case_price_range == "high":  # Дорогие кейсы (50000+ коп)
-        return (get_skins_by_rarity("rare")[:5] + 
-                get_skins_by_rarity("epic")[:5] + 
-                get_skins_by_rarity("legendary")[:3] + 
-                get_skins_by_rarity("mythical")[:2])
-    else:
-        return get_all_skins()[:20]  # По умолчанию топ 20
\ No newline at end of file
+    return skin_catalog.case_pool(case_price_range)
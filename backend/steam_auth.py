@@ -1,12 +1,15 @@
 import os
 import re
+import time
+import hashlib
 import urllib.parse
-import aiohttp
 from datetime import datetime, timedelta
 from jose import jwt
 from fastapi import HTTPException
 from dotenv import load_dotenv
 from pathlib import Path
+from cache import TTLCache
+from http_clients import http_clients
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
@@ -19,6 +22,19 @@ class SteamAuth:
         self.steam_api_key = os.environ.get('STEAM_API_KEY')
         self.callback_url = os.environ.get('CALLBACK_URL')
         self.base_url = "https://steamcommunity.com/openid/"
+        self.api_url = os.environ.get('STEAM_API_URL', 'https://api.steampowered.com')
+        
+        # Verified token payloads keyed by token hash, so hot paths skip the HS256 decode
+        self.token_cache = TTLCache(
+            maxsize=int(os.environ.get('JWT_CACHE_SIZE', '10000')),
+            ttl=float(os.environ.get('JWT_CACHE_TTL', '300'))
+        )
+        
+        # Steam profiles by Steam ID, so repeated logins don't hit the Web API
+        self.profile_cache = TTLCache(
+            maxsize=int(os.environ.get('STEAM_PROFILE_CACHE_SIZE', '10000')),
+            ttl=float(os.environ.get('STEAM_PROFILE_CACHE_TTL', '3600'))
+        )
         
         # Debug print to check if API key is loaded
         if not self.steam_api_key:
@@ -66,12 +82,11 @@ class SteamAuth:
         verify_params['openid.mode'] = 'check_authentication'
         
         # Make verification request to Steam
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}login",
-                data=verify_params
-            ) as response:
-                content = await response.text()
+        async with http_clients.steam.post(
+            f"{self.base_url}login",
+            data=verify_params
+        ) as response:
+            content = await response.text()
                 
         # Check if verification was successful
         if 'is_valid:true' not in content:
@@ -91,38 +106,43 @@ class SteamAuth:
         if not self.steam_api_key:
             raise HTTPException(status_code=500, detail="Steam API key not configured")
             
-        url = "https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/"
+        cached_profile = self.profile_cache.get(steam_id)
+        if cached_profile is not None:
+            return cached_profile
+        
+        url = f"{self.api_url}/ISteamUser/GetPlayerSummaries/v0002/"
         params = {
             'key': self.steam_api_key,
             'steamids': steam_id
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status != 200:
-                        print(f"Steam API error: {response.status}")
-                        # Return fallback profile if Steam API fails
-                        return {
-                            'steamid': steam_id,
-                            'personaname': f'Player_{steam_id[-4:]}',
-                            'avatarfull': 'https://avatars.mds.yandex.net/i?id=f282cbc5d89f99ce4f9a56ee9e8805be_l-7679814-images-thumbs&n=13',
-                            'profileurl': f'https://steamcommunity.com/profiles/{steam_id}'
-                        }
-                    
-                    data = await response.json()
-                    players = data.get('response', {}).get('players', [])
-                    
-                    if not players:
-                        # Return fallback profile if no player data
-                        return {
-                            'steamid': steam_id,
-                            'personaname': f'Player_{steam_id[-4:]}',
-                            'avatarfull': 'https://avatars.mds.yandex.net/i?id=f282cbc5d89f99ce4f9a56ee9e8805be_l-7679814-images-thumbs&n=13',
-                            'profileurl': f'https://steamcommunity.com/profiles/{steam_id}'
-                        }
-                    
-                    return players[0]
+            async with http_clients.steam.get(url, params=params) as response:
+                if response.status != 200:
+                    print(f"Steam API error: {response.status}")
+                    # Return fallback profile if Steam API fails
+                    return {
+                        'steamid': steam_id,
+                        'personaname': f'Player_{steam_id[-4:]}',
+                        'avatarfull': 'https://avatars.mds.yandex.net/i?id=f282cbc5d89f99ce4f9a56ee9e8805be_l-7679814-images-thumbs&n=13',
+                        'profileurl': f'https://steamcommunity.com/profiles/{steam_id}'
+                    }
+                
+                data = await response.json()
+                players = data.get('response', {}).get('players', [])
+                
+                if not players:
+                    # Return fallback profile if no player data
+                    return {
+                        'steamid': steam_id,
+                        'personaname': f'Player_{steam_id[-4:]}',
+                        'avatarfull': 'https://avatars.mds.yandex.net/i?id=f282cbc5d89f99ce4f9a56ee9e8805be_l-7679814-images-thumbs&n=13',
+                        'profileurl': f'https://steamcommunity.com/profiles/{steam_id}'
+                    }
+                
+                # Only real profiles are cached; fallbacks are retried on the next login
+                self.profile_cache.set(steam_id, players[0])
+                return players[0]
         except Exception as e:
             print(f"Exception in get_steam_profile: {e}")
             # Return fallback profile on any error
@@ -150,16 +170,25 @@ class SteamAuth:
     
     def verify_jwt_token(self, token: str):
         """Verify JWT token and return payload"""
+        token_hash = hashlib.sha256(token.encode()).digest()
+        payload = self.token_cache.get(token_hash)
+        if payload is not None:
+            return payload
+        
         secret = os.environ.get('SESSION_SECRET')
         if not secret:
             raise HTTPException(status_code=500, detail="Session secret not configured")
             
         try:
             payload = jwt.decode(token, secret, algorithms=['HS256'])
-            return payload
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=401, detail="Token expired")
         except jwt.JWTError:
             raise HTTPException(status_code=401, detail="Invalid token")
+        
+        # Never keep a payload cached past the token's own expiry
+        expires_in = payload.get('exp', 0) - time.time()
+        self.token_cache.set(token_hash, payload, ttl=expires_in)
+        return payload
 
 steam_auth = SteamAuth()
\ No newline at end of file
@@ -0,0 +1,128 @@
+import os
+import random
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+
+from database import db, inventory_summary_cache
+from market_prices import PriceMap, price_map
+from skins_database import get_all_skins
+
+# Targets must be worth at least this many times the stake...
+MIN_MULTIPLIER = 1.2
+# ...and at most this many times
+MAX_MULTIPLIER = 20.0
+
+# Highest win chance offered, whatever the price ratio
+MAX_WIN_CHANCE = 0.8
+
+
+def house_edge() -> float:
+    return float(os.environ.get('UPGRADE_HOUSE_EDGE', '0.05'))
+
+
+def win_chance(stake_price: int, target_price: int) -> float:
+    """Chance to win the target: the price ratio less the house edge"""
+    if stake_price <= 0 or target_price <= 0:
+        return 0.0
+    return min(MAX_WIN_CHANCE, stake_price / target_price * (1 - house_edge()))
+
+
+class SkinPriceIndex:
+    """Catalog skins sorted by current price, for range lookups with bisect.
+
+    Rebuilt lazily whenever the price map changes, so lookups always see
+    current market prices without rescanning the catalog per request.
+    """
+
+    def __init__(self, prices: PriceMap):
+        self.price_map = prices
+        self._version = None
+        self._prices: List[int] = []
+        self._skins: List[dict] = []
+        self._by_name = {}
+
+    def _ensure_current(self):
+        if self._version == self.price_map.version:
+            return
+        skins = sorted(
+            (self.price_map.priced(skin) for skin in get_all_skins()),
+            key=lambda skin: skin["price"]
+        )
+        self._skins = skins
+        self._prices = [skin["price"] for skin in skins]
+        self._by_name = {skin["market_hash_name"]: skin for skin in skins}
+        self._version = self.price_map.version
+
+    def get(self, market_hash_name: str) -> Optional[dict]:
+        self._ensure_current()
+        return self._by_name.get(market_hash_name)
+
+    def between(self, min_price: float, max_price: float) -> List[dict]:
+        """Skins priced within [min_price, max_price], cheapest first"""
+        self._ensure_current()
+        low = bisect_left(self._prices, min_price)
+        high = bisect_right(self._prices, max_price)
+        return self._skins[low:high]
+
+    def targets_for(self, stake_price: int, min_multiplier: float = MIN_MULTIPLIER,
+                    max_multiplier: float = MAX_MULTIPLIER) -> List[dict]:
+        """Skins a stake of ``stake_price`` can be upgraded to, with the win chance"""
+        min_multiplier = max(min_multiplier, MIN_MULTIPLIER)
+        max_multiplier = min(max_multiplier, MAX_MULTIPLIER)
+        return [
+            {**skin, "chance": round(win_chance(stake_price, skin["price"]), 4)}
+            for skin in self.between(stake_price * min_multiplier, stake_price * max_multiplier)
+        ]
+
+
+class UpgradeError(Exception):
+    """An upgrade that isn't allowed; the message is safe to show"""
+
+
+async def upgrade_item(user_id: str, item_id, target_market_hash_name: str) -> dict:
+    """Stake an inventory item for a pricier skin and resolve it at once.
+
+    The roll happens first; the stake is then swapped for the target (win)
+    or removed (loss) in one atomic operation on the stake's document, so
+    an item can only be staked once even with concurrent requests.
+    """
+    stake = await db.inventory.find_one({"_id": item_id, "user_id": user_id})
+    if stake is None:
+        raise LookupError("Item not found")
+    target = skin_price_index.get(target_market_hash_name)
+    if target is None:
+        raise UpgradeError("Unknown target skin")
+    ratio = target["price"] / stake["price"] if stake["price"] > 0 else 0
+    if not MIN_MULTIPLIER <= ratio <= MAX_MULTIPLIER:
+        raise UpgradeError(f"Target must be worth {MIN_MULTIPLIER} to {MAX_MULTIPLIER:g} times the item")
+
+    chance = win_chance(stake["price"], target["price"])
+    won = random.random() < chance
+    # Only the exact document we priced can be staked, and not while it is being sold
+    guard = {"_id": item_id, "user_id": user_id, "price": stake["price"], "sale_id": {"$exists": False}}
+    if won:
+        new_item = {
+            **target,
+            "user_id": user_id,
+            "obtained_at": datetime.utcnow(),
+            "upgraded_from": stake.get("market_hash_name")
+        }
+        resolved = await db.inventory.find_one_and_replace(
+            guard, new_item, return_document=ReturnDocument.AFTER
+        )
+    else:
+        resolved = await db.inventory.find_one_and_delete(guard)
+    if resolved is None:
+        raise LookupError("Item not found")
+    inventory_summary_cache.pop(user_id)
+
+    result = {"won": won, "chance": round(chance, 4), "stake_price": stake["price"], "target": target}
+    if won:
+        result["item"] = {"id": str(resolved.pop("_id")), **resolved}
+    return result
+
+
+skin_price_index = SkinPriceIndex(price_map)
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+
+from database import db
+
+# Give up on an event after this many failed attempts; it stays in the inbox as "failed"
+MAX_ATTEMPTS = 10
+
+# Longest delay before a failed event is retried
+MAX_RETRY_DELAY_SECONDS = 300
+
+
+class RetryLater(Exception):
+    """Raised by a handler whose event arrived before the data it applies to; the event is retried"""
+
+
+class WebhookInbox:
+    """Durable inbox for incoming webhooks, drained by background workers.
+
+    The webhook endpoint only appends the event and acknowledges it. Each
+    event is stored under a deduplication key, so a retried delivery of the
+    same event is dropped at insert time. Workers claim events with a lease;
+    an event whose worker died is picked up again once the lease expires.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def collection(self):
+        # Acknowledge only once the event is journaled on a majority of nodes
+        return db.get_collection("webhook_inbox", write_concern=WriteConcern(w="majority", j=True))
+
+    @property
+    def lease_seconds(self) -> float:
+        return float(os.environ.get('WEBHOOK_LEASE_SECONDS', '60'))
+
+    @property
+    def poll_interval(self) -> float:
+        return float(os.environ.get('WEBHOOK_POLL_SECONDS', '5'))
+
+    def register(self, source: str, handler: Callable[[dict], Awaitable[None]]):
+        """Set the coroutine that processes events from ``source``"""
+        self._handlers[source] = handler
+
+    async def append(self, source: str, dedup_key: str, payload: dict) -> bool:
+        """Store an event; returns False if an event with the same key was already received"""
+        now = datetime.utcnow()
+        try:
+            await self.collection.insert_one({
+                "_id": f"{source}:{dedup_key}",
+                "source": source,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "received_at": now,
+                "available_at": now
+            })
+        except DuplicateKeyError:
+            return False
+        self._wakeup.set()
+        return True
+
+    async def claim(self) -> Optional[dict]:
+        """Lease the oldest due event (or one whose lease expired)"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "available_at": {"$lte": now}},
+                    {"status": "processing", "lease_until": {"$lt": now}}
+                ]
+            },
+            {
+                "$set": {"status": "processing", "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def process(self, event: dict):
+        handler = self._handlers.get(event["source"])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for webhook source {event['source']}")
+            await handler(event["payload"])
+        except Exception as e:
+            log = logging.warning if isinstance(e, RetryLater) else logging.error
+            log(f"Webhook {event['_id']} failed (attempt {event['attempts']}): {e}")
+            status = "failed" if event["attempts"] >= MAX_ATTEMPTS else "pending"
+            retry_delay = min(MAX_RETRY_DELAY_SECONDS, 2 ** event["attempts"])
+            await self.collection.update_one(
+                {"_id": event["_id"]},
+                {
+                    "$set": {
+                        "status": status,
+                        "last_error": str(e),
+                        "available_at": datetime.utcnow() + timedelta(seconds=retry_delay)
+                    },
+                    "$unset": {"lease_until": ""}
+                }
+            )
+            return
+        await self.collection.update_one(
+            {"_id": event["_id"]},
+            {"$set": {"status": "processed", "processed_at": datetime.utcnow()}, "$unset": {"lease_until": ""}}
+        )
+
+    async def drain(self) -> int:
+        """Process events until the inbox is empty; returns how many were handled"""
+        handled = 0
+        while True:
+            event = await self.claim()
+            if event is None:
+                return handled
+            await self.process(event)
+            handled += 1
+
+    async def _worker(self):
+        while True:
+            # Clear before draining so an append that races with drain() still wakes us
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logging.error(f"Webhook worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        workers = int(os.environ.get('WEBHOOK_WORKERS', '2'))
+        while len(self._workers) < workers:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+webhook_inbox = WebhookInbox()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from database import db, save_case_results
+
+# Attempts to insert a batch before it is dropped (and logged)
+MAX_FLUSH_ATTEMPTS = 3
+
+# Queued by stop() to tell the flusher to finish
+_STOP = object()
+
+
+class WriteBehindBuffer:
+    """Queues documents in memory and inserts them in batches in the background.
+
+    Only for append-only data nobody reads back in the request path: a
+    batch is written with one ``insert_many`` when it reaches ``batch_size``
+    or ``flush_seconds`` after its first document. The queue is bounded, so
+    when the database falls behind ``add`` waits for room instead of
+    growing memory without limit. ``stop`` flushes whatever is queued.
+    """
+
+    def __init__(self, collection_name: str, env_prefix: str):
+        self.collection_name = collection_name
+        self.env_prefix = env_prefix
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def _env(self, name: str, default: str) -> str:
+        return os.environ.get(f'{self.env_prefix}_{name}', default)
+
+    @property
+    def enabled(self) -> bool:
+        return self._env('WRITE_BEHIND', 'false').lower() == 'true'
+
+    @property
+    def batch_size(self) -> int:
+        return int(self._env('BATCH_SIZE', '500'))
+
+    @property
+    def flush_seconds(self) -> float:
+        return float(self._env('FLUSH_SECONDS', '1'))
+
+    @property
+    def max_queue(self) -> int:
+        return int(self._env('MAX_QUEUE', '10000'))
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def add(self, documents: List[dict]):
+        """Queue documents for insertion; waits while the queue is full"""
+        for document in documents:
+            await self._queue.put(document)
+
+    async def _next_batch(self) -> List[dict]:
+        """Collect up to batch_size documents; an empty result means stop"""
+        batch = []
+        first = await self._queue.get()
+        if first is _STOP:
+            return batch
+        batch.append(first)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                document = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if document is _STOP:
+                # Put it back so the loop ends after this batch is written
+                self._queue.put_nowait(_STOP)
+                break
+            batch.append(document)
+        return batch
+
+    async def _flush(self, batch: List[dict]):
+        for attempt in range(1, MAX_FLUSH_ATTEMPTS + 1):
+            try:
+                # Unordered, so one bad document doesn't block the rest
+                await db[self.collection_name].insert_many(batch, ordered=False)
+                self.written += len(batch)
+                return
+            except Exception as e:
+                logging.error(f"Write-behind flush to {self.collection_name} failed (attempt {attempt}): {e}")
+                if attempt < MAX_FLUSH_ATTEMPTS:
+                    await asyncio.sleep(attempt)
+        self.dropped += len(batch)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                return
+            await self._flush(batch)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything queued so far, then stop the flusher"""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        # Behind every queued document, so nothing accepted before stop is lost
+        await self._queue.put(_STOP)
+        await task
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "dropped": self.dropped
+        }
+
+
+class CaseResultsWriter(WriteBehindBuffer):
+    """Case opening history, written behind when CASE_RESULTS_WRITE_BEHIND=true"""
+
+    def __init__(self):
+        super().__init__("case_results", "CASE_RESULTS")
+
+    async def save(self, user_id: str, case_id: str, items: List[dict]):
+        if not self.running:
+            await save_case_results(user_id, case_id, items)
+            return
+        opened_at = datetime.utcnow()
+        await self.add([
+            {"user_id": user_id, "case_id": case_id, "item": dict(item_data), "opened_at": opened_at}
+            for item_data in items
+        ])
+
+
+case_results_writer = CaseResultsWriter()
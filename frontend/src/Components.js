@@ -510,7 +510,10 @@ export const CaseOpeningModal = ({ isOpen, onClose, caseData, balance, setBalanc
 // Inventory Page Component
 export const InventoryPage = () => {
   const [inventory, setInventory] = useState([]);
+  const [summary, setSummary] = useState({ total_count: 0, total_value: 0 });
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchInventory();
@@ -518,8 +521,14 @@ export const InventoryPage = () => {
 
   const fetchInventory = async () => {
     try {
-      const response = await steamAPI.getInventory();
-      setInventory(response.data.items || []);
+      // The list is paginated, so totals come from the server-side summary
+      const [pageResponse, summaryResponse] = await Promise.all([
+        steamAPI.getInventory(),
+        steamAPI.getInventorySummary()
+      ]);
+      setInventory(pageResponse.data.items || []);
+      setNextCursor(pageResponse.data.next_cursor || null);
+      setSummary(summaryResponse.data);
     } catch (error) {
       console.error('Inventory error:', error);
     } finally {
@@ -527,12 +536,21 @@ export const InventoryPage = () => {
     }
   };
 
-  const formatPrice = (price) => {
-    return (price / 100).toFixed(0);
+  const fetchMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await steamAPI.getInventory(nextCursor);
+      setInventory((items) => [...items, ...(response.data.items || [])]);
+      setNextCursor(response.data.next_cursor || null);
+    } catch (error) {
+      console.error('Inventory error:', error);
+    } finally {
+      setLoadingMore(false);
+    }
   };
 
-  const calculateTotalValue = () => {
-    return inventory.reduce((total, item) => total + item.price, 0);
+  const formatPrice = (price) => {
+    return (price / 100).toFixed(0);
   };
 
   if (loading) {
@@ -553,7 +571,7 @@ export const InventoryPage = () => {
         <div className="text-center mb-8">
           <h1 className="text-4xl font-bold text-gray-800 mb-4">Инвентарь</h1>
           <p className="text-gray-600 text-lg">
-            Предметов: {inventory.length} | Общая стоимость: {formatPrice(calculateTotalValue())} ₽
+            Предметов: {summary.total_count} | Общая стоимость: {formatPrice(summary.total_value)} ₽
           </p>
         </div>
 
@@ -564,8 +582,8 @@ export const InventoryPage = () => {
           </div>
         ) : (
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-            {inventory.map((item, index) => (
-              <div key={index} className="bg-white rounded-xl border border-gray-200 p-4 hover:shadow-lg transition-all">
+            {inventory.map((item) => (
+              <div key={item.id} className="bg-white rounded-xl border border-gray-200 p-4 hover:shadow-lg transition-all">
                 <div className="mb-4">
                   <img 
                     src={item.image_url} 
@@ -582,6 +600,18 @@ export const InventoryPage = () => {
             ))}
           </div>
         )}
+
+        {nextCursor && (
+          <div className="text-center mt-8">
+            <button
+              onClick={fetchMore}
+              disabled={loadingMore}
+              className="bg-black text-white py-3 px-8 rounded-lg font-semibold hover:bg-gray-800 disabled:bg-gray-400 disabled:cursor-not-allowed transition-colors"
+            >
+              {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
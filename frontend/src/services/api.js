@@ -40,7 +40,8 @@ export const steamAPI = {
   getProfile: () => axios.get('/api/user/profile'),
   
   // Inventory
-  getInventory: () => axios.get('/api/user/inventory'),
+  getInventory: (cursor) => axios.get('/api/user/inventory', { params: cursor ? { cursor } : {} }),
+  getInventorySummary: () => axios.get('/api/user/inventory/summary'),
   
   // Balance
   addBalance: (amount) => axios.post('/api/user/balance/add', { amount }),
@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other by bare name, as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture
+def mongo():
+    """An in-memory MongoDB standing in for the shared client (no transactions)"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    import database
+
+    client = AsyncMongoMockClient()
+    database.mongo.client = client
+    database.mongo.database = client["test_database"]
+    database.mongo.transactions_supported = False
+    database.user_cache.clear()
+    database.inventory_summary_cache.clear()
+    yield database.mongo.database
+    database.mongo.client = None
+    database.mongo.database = None
+    database.mongo.transactions_supported = None
+
+
+class SessionRecordingCollection:
+    """Collection that records the session of every call and drops it, as mongomock has none"""
+
+    def __init__(self, collection, calls: list):
+        self._collection = collection
+        self._calls = calls
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+        if not callable(method):
+            return method
+
+        def call(*args, session=None, **kwargs):
+            self._calls.append((self._collection.name, name, session))
+            return method(*args, **kwargs)
+        return call
+
+
+class SessionRecordingDb:
+    def __init__(self, database, calls: list):
+        self._database = database
+        self._calls = calls
+
+    def __getattr__(self, name):
+        return SessionRecordingCollection(getattr(self._database, name), self._calls)
+
+    def __getitem__(self, name):
+        return SessionRecordingCollection(self._database[name], self._calls)
+
+
+@pytest.fixture
+def fake_transactions(mongo, monkeypatch):
+    """Pretend the deployment supports transactions.
+
+    ``run_in_transaction`` hands its callback ``fake_transactions.session``
+    and every collection call made by the database module is recorded in
+    ``fake_transactions.calls`` as (collection, method, session). Nothing is
+    actually rolled back.
+    """
+    from types import SimpleNamespace
+
+    import database
+
+    state = SimpleNamespace(session=object(), calls=[])
+
+    async def run_in_transaction(callback):
+        return await callback(state.session)
+
+    database.mongo.transactions_supported = True
+    monkeypatch.setattr(database, "db", SessionRecordingDb(mongo, state.calls))
+    monkeypatch.setattr(database, "run_in_transaction", run_in_transaction)
+    return state
@@ -0,0 +1,188 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import battles
+from battles import BattleError, BattleManager, InsufficientBalanceError
+from case_catalog import case_catalog
+from models import BalanceReason
+
+CASE_IDS = ["1", "2"]
+PRICE = sum(case_catalog.get(case_id)["price"] for case_id in CASE_IDS)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setenv("BATTLE_ROUND_SECONDS", "0")
+    return BattleManager()
+
+
+async def add_users(mongo, balances: dict) -> dict:
+    """Insert users by Steam ID and return their documents as the API would pass them"""
+    await mongo.users.insert_many([
+        {"steam_id": steam_id, "username": f"player {steam_id}", "balance": balance}
+        for steam_id, balance in balances.items()
+    ])
+    return {user["steam_id"]: user async for user in mongo.users.find()}
+
+
+async def balances(mongo) -> dict:
+    return {user["steam_id"]: user["balance"] async for user in mongo.users.find()}
+
+
+async def battle_entries(mongo) -> list:
+    return await mongo.ledger_entries.find(
+        {"reason": BalanceReason.BATTLE.value}, {"_id": False, "user_steam_id": True, "amount": True}
+    ).to_list(length=None)
+
+
+def test_settlement_debits_once_and_gives_the_winner_every_drop(mongo, manager, monkeypatch):
+    inserts = []
+    add_items = battles.add_items_to_inventory
+
+    async def counting_add_items(user_id, items, session=None):
+        inserts.append((user_id, len(items)))
+        return await add_items(user_id, items, session=session)
+
+    monkeypatch.setattr(battles, "add_items_to_inventory", counting_add_items)
+
+    async def main():
+        users = await add_users(mongo, {"a": PRICE + 100, "b": PRICE, "c": PRICE * 3})
+        room = manager.create(users["a"], CASE_IDS, 3)
+        await manager.join(room.id, users["b"])
+        assert room.status == "waiting"
+        await manager.join(room.id, users["c"])
+        assert room.status in ("running", "finished")
+        await asyncio.gather(*manager._tasks)
+        result = {
+            "room": room,
+            "balances": await balances(mongo),
+            "entries": await battle_entries(mongo),
+            "inventory": await mongo.inventory.find().to_list(length=None),
+            "document": await mongo.battles.find_one({"_id": room.id})
+        }
+        await manager.stop()
+        return result
+
+    result = asyncio.run(main())
+    room = result["room"]
+    assert room.status == "finished"
+    assert result["balances"] == {"a": 100, "b": 0, "c": PRICE * 2}
+    assert sorted((e["user_steam_id"], e["amount"]) for e in result["entries"]) == [
+        ("a", -PRICE), ("b", -PRICE), ("c", -PRICE)
+    ]
+
+    winner = room.winner
+    assert inserts == [(winner["user_id"], 3 * len(CASE_IDS))]
+    assert {item["user_id"] for item in result["inventory"]} == {winner["user_id"]}
+    assert len(result["inventory"]) == 3 * len(CASE_IDS)
+
+    document = result["document"]
+    assert document["winner_steam_id"] == winner["steam_id"]
+    assert document["totals"] == room.totals
+    assert room.totals[winner["steam_id"]] == max(room.totals.values())
+    assert sum(room.totals.values()) == sum(item["price"] for item in result["inventory"])
+    assert [len(drops) for drops in document["rounds"]] == [3] * len(CASE_IDS)
+
+
+def test_failed_debit_refunds_players_already_debited(mongo, manager):
+    async def main():
+        users = await add_users(mongo, {"a": PRICE, "b": PRICE, "c": PRICE})
+        room = manager.create(users["a"], CASE_IDS, 3)
+        await manager.join(room.id, users["b"])
+        # "c" spends the balance elsewhere after passing the early check
+        await mongo.users.update_one({"steam_id": "c"}, {"$set": {"balance": PRICE - 1}})
+        with pytest.raises(InsufficientBalanceError) as error:
+            await manager.join(room.id, users["c"])
+        result = {
+            "room": room,
+            "error": error.value,
+            "balances": await balances(mongo),
+            "entries": await battle_entries(mongo),
+            "inventory": await mongo.inventory.count_documents({}),
+            "battles": await mongo.battles.count_documents({})
+        }
+        await manager.stop()
+        return result
+
+    result = asyncio.run(main())
+    assert result["error"].steam_id == "c"
+    assert result["balances"] == {"a": PRICE, "b": PRICE, "c": PRICE - 1}
+    # One debit and one refund for each player debited before "c" failed
+    assert sorted((e["user_steam_id"], e["amount"]) for e in result["entries"]) == [
+        ("a", -PRICE), ("a", PRICE), ("b", -PRICE), ("b", PRICE)
+    ]
+    assert result["inventory"] == 0
+    assert result["battles"] == 0
+
+    room = result["room"]
+    assert room.status == "waiting"
+    assert [player["steam_id"] for player in room.players] == ["a", "b"]
+    assert room.rounds == [] and room.winner is None
+
+
+def test_creator_who_cannot_pay_cancels_the_battle(mongo, manager):
+    async def main():
+        users = await add_users(mongo, {"a": PRICE, "b": PRICE})
+        room = manager.create(users["a"], CASE_IDS, 2)
+        await mongo.users.update_one({"steam_id": "a"}, {"$set": {"balance": 0}})
+        with pytest.raises(InsufficientBalanceError):
+            await manager.join(room.id, users["b"])
+        return room, await balances(mongo)
+
+    room, final_balances = asyncio.run(main())
+    assert room.status == "cancelled"
+    assert room.id not in manager.rooms
+    assert final_balances == {"a": 0, "b": PRICE}
+
+
+class FailingBattlesDb:
+    """The database, except that recording a battle fails"""
+
+    def __init__(self, database):
+        self._database = database
+
+    @property
+    def battles(self):
+        class Battles:
+            async def insert_one(self, *args, **kwargs):
+                raise OperationFailure("battles unavailable")
+        return Battles()
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+@pytest.mark.parametrize("failing_write", ["add_items_to_inventory", "battles.insert_one"])
+def test_failed_settlement_refunds_every_debited_player(mongo, manager, monkeypatch, failing_write):
+    if failing_write == "add_items_to_inventory":
+        async def broken_add_items(*args, **kwargs):
+            raise OperationFailure("inventory unavailable")
+        monkeypatch.setattr(battles, "add_items_to_inventory", broken_add_items)
+    else:
+        monkeypatch.setattr(battles, "db", FailingBattlesDb(mongo))
+
+    async def main():
+        users = await add_users(mongo, {"a": PRICE, "b": PRICE})
+        room = manager.create(users["a"], CASE_IDS, 2)
+        with pytest.raises(BattleError, match="could not be settled"):
+            await manager.join(room.id, users["b"])
+        return {
+            "room": room,
+            "balances": await balances(mongo),
+            "entries": await battle_entries(mongo),
+            "inventory": await mongo.inventory.count_documents({}),
+            "battles": await mongo.battles.count_documents({})
+        }
+
+    result = asyncio.run(main())
+    assert result["room"].status == "cancelled"
+    assert result["room"].id not in manager.rooms
+    assert result["balances"] == {"a": PRICE, "b": PRICE}
+    assert sorted((e["user_steam_id"], e["amount"]) for e in result["entries"]) == [
+        ("a", -PRICE), ("a", PRICE), ("b", -PRICE), ("b", PRICE)
+    ]
+    # Items already given to the winner are taken back
+    assert result["inventory"] == 0
+    assert result["battles"] == 0
@@ -0,0 +1,118 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from drop_sampler import CaseSamplerRegistry, WeightedSampler, build_rarity_sampler
+
+
+def table_probabilities(sampler: WeightedSampler) -> list:
+    """Drop probability of every item implied by the alias tables"""
+    size = len(sampler)
+    mass = [0.0] * size
+    for i in range(size):
+        mass[i] += sampler._prob[i] / size
+        mass[sampler._alias[i]] += (1 - sampler._prob[i]) / size
+    return mass
+
+
+@pytest.mark.parametrize("weights", [
+    [1, 1, 1, 1],
+    [79.92, 15.98, 3.2, 0.64, 0.26],
+    [0.001, 1000, 3, 0.5],
+    [5],
+])
+def test_alias_tables_match_weights(weights):
+    sampler = WeightedSampler(list(range(len(weights))), weights)
+    assert table_probabilities(sampler) == pytest.approx(sampler.probabilities(), abs=1e-12)
+    assert sum(sampler.probabilities()) == pytest.approx(1.0)
+
+
+def test_seeded_draws_follow_weights():
+    weights = [50, 30, 15, 4, 1]
+    sampler = WeightedSampler("abcde", weights)
+    draws = 200_000
+    counts = Counter(sampler.draw_many(draws, random.Random(1234)))
+    for item, probability in zip("abcde", sampler.probabilities()):
+        # Within five standard deviations of the binomial count
+        sigma = math.sqrt(draws * probability * (1 - probability))
+        assert abs(counts[item] - draws * probability) < 5 * sigma
+
+
+def test_draw_and_draw_many_agree_for_the_same_seed():
+    sampler = WeightedSampler("abc", [1, 2, 3])
+    rng = random.Random(42)
+    single = [sampler.draw(rng) for _ in range(1000)]
+    assert sampler.draw_many(1000, random.Random(42)) == single
+
+
+def test_zero_weight_items_are_never_drawn():
+    sampler = WeightedSampler(["never", "always", "also never"], [0, 3.5, 0])
+    assert set(sampler.draw_many(10_000, random.Random(7))) == {"always"}
+    assert sampler.probabilities() == [0.0, 1.0, 0.0]
+
+
+def test_single_item_pool():
+    sampler = WeightedSampler(["only"], [0.25])
+    assert len(sampler) == 1
+    assert sampler.draw(random.Random(0)) == "only"
+    assert set(sampler.draw_many(100)) == {"only"}
+
+
+@pytest.mark.parametrize("items, weights", [
+    ([], []),
+    (["a"], [1, 2]),
+    (["a", "b"], [1, -1]),
+    (["a", "b"], [0, 0]),
+])
+def test_invalid_pools_are_rejected(items, weights):
+    with pytest.raises(ValueError):
+        WeightedSampler(items, weights)
+
+
+def test_rarity_sampler_uses_default_weight_for_unknown_rarities():
+    items = [{"rarity": "covert"}, {"rarity": "mystery"}]
+    sampler = build_rarity_sampler(items, {"covert": 3}, default_weight=1)
+    assert sampler.probabilities() == [0.75, 0.25]
+
+
+def test_registry_reuses_sampler_for_the_same_objects():
+    registry = CaseSamplerRegistry()
+    items = [{"rarity": "mil-spec"}, {"rarity": "covert"}]
+    odds = {"mil-spec": 9, "covert": 1}
+    sampler = registry.get_or_build("case", items, odds)
+    assert registry.get_or_build("case", items, odds) is sampler
+    assert registry.get("case") is sampler
+
+
+def test_registry_rebuilds_when_pool_or_odds_change_identity():
+    registry = CaseSamplerRegistry()
+    items = [{"rarity": "mil-spec"}, {"rarity": "covert"}]
+    odds = {"mil-spec": 9, "covert": 1}
+    sampler = registry.get_or_build("case", items, odds)
+
+    # An equal but distinct pool is a new definition
+    rebuilt = registry.get_or_build("case", list(items), odds)
+    assert rebuilt is not sampler
+
+    new_odds = {"mil-spec": 1, "covert": 1}
+    assert registry.get_or_build("case", items, new_odds).probabilities() == [0.5, 0.5]
+
+
+def test_registry_invalidate_after_in_place_mutation():
+    registry = CaseSamplerRegistry()
+    items = [{"rarity": "mil-spec"}]
+    odds = {"mil-spec": 1}
+    sampler = registry.get_or_build("a", items, odds)
+    registry.get_or_build("b", items, odds)
+
+    items.append({"rarity": "covert"})
+    # Same objects, so the stale sampler is still served until invalidated
+    assert registry.get_or_build("a", items, odds) is sampler
+    registry.invalidate("a")
+    assert len(registry.get_or_build("a", items, odds)) == 2
+    assert registry.get("b") is not None
+
+    registry.invalidate()
+    assert registry.get("a") is None and registry.get("b") is None
@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import get_user_inventory_page
+
+USER_ID = "user-1"
+
+
+def copy(document: dict, **changes) -> dict:
+    """A new document (no _id) like ``document`` with some fields changed"""
+    return {**{key: value for key, value in document.items() if key != "_id"}, **changes}
+
+
+async def add_inventory(mongo, count: int) -> list:
+    """Items with heavy ties: three share each obtained_at and five share each price"""
+    start = datetime(2024, 1, 1)
+    documents = [
+        {
+            "user_id": USER_ID,
+            "name": f"item {i}",
+            "rarity": "rare" if i % 2 else "common",
+            "price": 100 * (i // 5),
+            "market_hash_name": f"Item {i}",
+            "obtained_at": start + timedelta(minutes=i // 3)
+        }
+        for i in range(count)
+    ]
+    await mongo.inventory.insert_many(documents)
+    # Another user's items must never leak into the pages
+    await mongo.inventory.insert_many([copy(document, user_id="other") for document in documents[:5]])
+    return documents
+
+
+async def all_pages(limit: int, sort: str, **filters) -> list:
+    pages = []
+    after = None
+    while True:
+        items, after = await get_user_inventory_page(USER_ID, limit=limit, after=after, sort=sort, **filters)
+        pages.append(items)
+        if after is None:
+            return pages
+
+
+def expected_order(documents: list, sort: str) -> list:
+    field = "price" if sort.startswith("price") else "obtained_at"
+    descending = sort in ("newest", "price_desc")
+    return [d["_id"] for d in sorted(documents, key=lambda d: (d[field], d["_id"]), reverse=descending)]
+
+
+@pytest.mark.parametrize("sort", ["newest", "oldest", "price_desc", "price_asc"])
+@pytest.mark.parametrize("limit", [1, 4, 7, 50])
+def test_inventory_pages_are_gap_free_across_ties(mongo, sort, limit):
+    async def main():
+        documents = await add_inventory(mongo, 23)
+        return documents, await all_pages(limit, sort)
+
+    documents, pages = asyncio.run(main())
+    ids = [item["_id"] for page in pages for item in page]
+    assert ids == expected_order(documents, sort)
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+
+def test_inventory_pages_with_filters(mongo):
+    async def main():
+        documents = await add_inventory(mongo, 30)
+        pages = await all_pages(4, "price_desc", rarities=["rare"], min_price=100, max_price=400)
+        return documents, pages
+
+    documents, pages = asyncio.run(main())
+    matching = [d for d in documents if d["rarity"] == "rare" and 100 <= d["price"] <= 400]
+    assert [item["_id"] for page in pages for item in page] == expected_order(matching, "price_desc")
+
+
+def test_inventory_cursor_is_stable_when_items_change_between_pages(mongo):
+    async def main():
+        documents = await add_inventory(mongo, 12)
+        first, after = await get_user_inventory_page(USER_ID, limit=5, sort="newest")
+        # A new drop and the sale of an item already shown must not shift the next page
+        await mongo.inventory.insert_one(copy(documents[0], obtained_at=datetime(2030, 1, 1)))
+        await mongo.inventory.delete_one({"_id": first[0]["_id"]})
+        rest = []
+        while after is not None:
+            items, after = await get_user_inventory_page(USER_ID, limit=5, after=after, sort="newest")
+            rest.extend(items)
+        return documents, first, rest
+
+    documents, first, rest = asyncio.run(main())
+    order = expected_order(documents, "newest")
+    assert [item["_id"] for item in first] == order[:5]
+    assert [item["_id"] for item in rest] == order[5:]
+
+
+def test_inventory_page_projection_keeps_the_sort_key(mongo):
+    async def main():
+        await add_inventory(mongo, 3)
+        return await get_user_inventory_page(USER_ID, limit=2, sort="price_asc", fields=["name"])
+
+    items, after = asyncio.run(main())
+    assert set(items[0]) == {"_id", "name", "price"}
+    assert after == {"value": items[-1]["price"], "id": items[-1]["_id"]}
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+import upgrades
+from database import (
+    INVENTORY_SUMMARY_TOP, add_item_to_inventory, add_items_to_inventory, get_inventory_summary,
+    inventory_summary_cache, sell_inventory_items
+)
+from market_prices import price_map
+from skins_database import get_all_skins
+
+USER_ID = "user-1"
+
+ITEMS = [
+    {"name": "a", "market_hash_name": "A", "rarity": "covert", "price": 5000},
+    {"name": "b", "market_hash_name": "B", "rarity": "mil-spec", "price": 30},
+    {"name": "c", "market_hash_name": "C", "rarity": "mil-spec", "price": 20},
+    {"name": "d", "market_hash_name": "D", "rarity": "restricted", "price": 700},
+]
+
+
+def expected(items: list) -> dict:
+    """Totals and per-rarity rows computed the slow way"""
+    by_rarity = {}
+    for item in items:
+        row = by_rarity.setdefault(item["rarity"], {"rarity": item["rarity"], "count": 0, "value": 0})
+        row["count"] += 1
+        row["value"] += item["price"]
+    return {
+        "total_count": len(items),
+        "total_value": sum(item["price"] for item in items),
+        "by_rarity": sorted(by_rarity.values(), key=lambda row: -row["value"])
+    }
+
+
+def totals(summary: dict) -> dict:
+    return {key: summary[key] for key in ("total_count", "total_value", "by_rarity")}
+
+
+def test_summary_matches_the_inserted_items(mongo):
+    many = [{**ITEMS[i % len(ITEMS)], "price": ITEMS[i % len(ITEMS)]["price"] + i} for i in range(25)]
+
+    async def main():
+        await add_items_to_inventory(USER_ID, [dict(item) for item in many])
+        await add_items_to_inventory("someone else", [dict(item) for item in ITEMS])
+        return await get_inventory_summary(USER_ID)
+
+    summary = asyncio.run(main())
+    assert totals(summary) == expected(many)
+    top = sorted(many, key=lambda item: -item["price"])[:INVENTORY_SUMMARY_TOP]
+    assert [item["price"] for item in summary["top_items"]] == [item["price"] for item in top]
+    assert all(isinstance(item["id"], str) and "user_id" not in item for item in summary["top_items"])
+
+
+def test_empty_inventory(mongo):
+    summary = asyncio.run(get_inventory_summary(USER_ID))
+    assert summary == {"total_count": 0, "total_value": 0, "by_rarity": [], "top_items": []}
+
+
+def test_summary_is_cached_until_the_inventory_changes(mongo):
+    async def main():
+        await add_items_to_inventory(USER_ID, [dict(item) for item in ITEMS])
+        first = await get_inventory_summary(USER_ID)
+        # A write that bypasses this module is not seen while the summary is cached
+        await mongo.inventory.delete_many({"user_id": USER_ID})
+        return first, await get_inventory_summary(USER_ID)
+
+    first, second = asyncio.run(main())
+    assert second is first
+    assert first["total_count"] == len(ITEMS)
+
+
+def test_adding_items_drops_the_cached_summary(mongo):
+    async def main():
+        await add_items_to_inventory(USER_ID, [dict(item) for item in ITEMS[:2]])
+        before = await get_inventory_summary(USER_ID)
+        await add_item_to_inventory(USER_ID, dict(ITEMS[2]))
+        one_more = await get_inventory_summary(USER_ID)
+        await add_items_to_inventory(USER_ID, [dict(ITEMS[3])])
+        return before, one_more, await get_inventory_summary(USER_ID)
+
+    before, one_more, all_items = asyncio.run(main())
+    assert totals(before) == expected(ITEMS[:2])
+    assert totals(one_more) == expected(ITEMS[:3])
+    assert totals(all_items) == expected(ITEMS)
+
+
+def test_selling_drops_the_cached_summary(mongo):
+    async def main():
+        await mongo.users.insert_one({"steam_id": "1", "balance": 0})
+        await add_items_to_inventory(USER_ID, [dict(item) for item in ITEMS])
+        await get_inventory_summary(USER_ID)
+        await sell_inventory_items("1", USER_ID, {"price": {"$lt": 100}}, lambda name: None, 0.5)
+        return await get_inventory_summary(USER_ID)
+
+    summary = asyncio.run(main())
+    assert totals(summary) == expected([ITEMS[0], ITEMS[3]])
+
+
+def test_upgrading_drops_the_cached_summary(mongo, monkeypatch):
+    for skin in sorted(get_all_skins(), key=lambda skin: skin["price"]):
+        targets = upgrades.skin_price_index.targets_for(price_map.price_of(skin))
+        if targets:
+            stake, target = price_map.priced(skin), targets[0]
+            break
+    else:
+        pytest.fail("No skin in the catalog can be upgraded")
+    monkeypatch.setattr(upgrades.random, "random", lambda: 0.0)
+
+    async def main():
+        (item_id,) = await add_items_to_inventory(USER_ID, [dict(stake)])
+        before = await get_inventory_summary(USER_ID)
+        await upgrades.upgrade_item(USER_ID, ObjectId(item_id), target["market_hash_name"])
+        return before, USER_ID in inventory_summary_cache, await get_inventory_summary(USER_ID)
+
+    before, cached, after = asyncio.run(main())
+    assert before["total_value"] == stake["price"]
+    assert not cached
+    assert after["total_count"] == 1
+    assert after["total_value"] == target["price"]
+    assert after["top_items"][0]["market_hash_name"] == target["market_hash_name"]
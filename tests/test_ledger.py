@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+import database
+import ledger
+from database import INDEXES, debit_user_balance, update_user_balance, user_cache
+from models import BalanceReason
+
+_counter = itertools.count(1)
+
+
+def entry_id(seconds_ago: float) -> ObjectId:
+    """A unique ObjectId whose timestamp lies the given number of seconds back"""
+    timestamp = ObjectId.from_datetime(datetime.utcnow() - timedelta(seconds=seconds_ago)).binary[:4]
+    return ObjectId(timestamp + next(_counter).to_bytes(8, "big"))
+
+
+async def add_entry(mongo, steam_id: str, amount: int, seconds_ago: float):
+    """Apply a balance change and its ledger entry as if made seconds_ago"""
+    user = await mongo.users.find_one_and_update(
+        {"steam_id": steam_id}, {"$inc": {"balance": amount}}, return_document=True
+    )
+    await mongo.ledger_entries.insert_one({
+        "_id": entry_id(seconds_ago),
+        "user_steam_id": steam_id,
+        "amount": amount,
+        "reason": BalanceReason.MANUAL.value,
+        "reference": None,
+        "balance_after": user["balance"],
+        "created_at": datetime.utcnow()
+    })
+
+
+async def setup(mongo, steam_id: str = "1"):
+    await mongo.ledger_snapshots.create_indexes(INDEXES["ledger_snapshots"])
+    await mongo.users.insert_one({"steam_id": steam_id, "balance": 0})
+
+
+def test_compaction_keeps_unsettled_entries_and_the_balance(mongo):
+    async def main():
+        await setup(mongo)
+        settled = ledger.SETTLE_SECONDS + 30
+        for amount in (1000, -300, 250):
+            await add_entry(mongo, "1", amount, settled)
+        # Too fresh to be folded yet
+        await add_entry(mongo, "1", -100, 0)
+
+        before = await ledger.get_ledger_balance("1")
+        snapshot = await ledger.compact("1")
+        after = await ledger.get_ledger_balance("1")
+        return before, snapshot, after
+
+    before, snapshot, after = asyncio.run(main())
+    assert before == {"balance": 850, "snapshot_at": None, "entries_after_snapshot": 4}
+    assert (snapshot["balance"], snapshot["entry_count"]) == (950, 3)
+    assert after["balance"] == 850
+    assert after["entries_after_snapshot"] == 1
+
+
+def test_compaction_chains_snapshots_across_settle_window(mongo):
+    async def main():
+        await setup(mongo)
+        await add_entry(mongo, "1", 500, ledger.SETTLE_SECONDS + 120)
+        first = await ledger.compact("1")
+        # Nothing new has settled since
+        again = await ledger.compact("1")
+        await add_entry(mongo, "1", 200, ledger.SETTLE_SECONDS + 10)
+        await add_entry(mongo, "1", 50, 0)
+        second = await ledger.compact("1")
+        return first, again, second, await ledger.reconcile("1")
+
+    first, again, second, report = asyncio.run(main())
+    assert (first["balance"], first["entry_count"]) == (500, 1)
+    assert again is None
+    assert (second["balance"], second["entry_count"]) == (700, 2)
+    assert second["through_id"] > first["through_id"]
+    assert (report["ledger_balance"], report["drift"], report["entries_after_snapshot"]) == (750, 0, 1)
+
+
+def test_compactor_only_revisits_users_with_new_entries(mongo, monkeypatch):
+    async def main():
+        await setup(mongo, "1")
+        await setup(mongo, "2")
+        await add_entry(mongo, "1", 100, ledger.SETTLE_SECONDS + 60)
+        await add_entry(mongo, "2", 300, ledger.SETTLE_SECONDS + 60)
+        compactor = ledger.LedgerCompactor()
+        written = [await compactor.compact_all()]
+        await add_entry(mongo, "2", 5, 2)
+        # Still inside the settle window
+        written.append(await compactor.compact_all())
+        monkeypatch.setattr(ledger, "SETTLE_SECONDS", 0)
+        written.append(await compactor.compact_all())
+        snapshots = await mongo.ledger_snapshots.count_documents({})
+        balances = [(await ledger.get_ledger_balance(steam_id))["balance"] for steam_id in ("1", "2")]
+        return written, snapshots, balances
+
+    written, snapshots, balances = asyncio.run(main())
+    assert written == [2, 0, 1]
+    assert snapshots == 3
+    assert balances == [100, 305]
+
+
+def test_reconcile_flags_drifted_balance(mongo):
+    async def main():
+        await setup(mongo)
+        await update_user_balance("1", 1000, BalanceReason.MANUAL.value)
+        await update_user_balance("1", -400, BalanceReason.CASE_OPEN.value)
+        clean = await ledger.reconcile("1")
+        # A write that bypassed the ledger
+        await mongo.users.update_one({"steam_id": "1"}, {"$inc": {"balance": 77}})
+        drifted = await ledger.reconcile("1")
+        return clean, drifted
+
+    clean, drifted = asyncio.run(main())
+    assert (clean["cached_balance"], clean["ledger_balance"], clean["drift"]) == (600, 600, 0)
+    assert (drifted["cached_balance"], drifted["ledger_balance"], drifted["drift"]) == (677, 600, 77)
+
+
+def test_reconcile_unknown_user(mongo):
+    report = asyncio.run(ledger.reconcile("404"))
+    assert report["cached_balance"] is None and report["drift"] is None
+
+
+def test_open_missing_accounts_gives_existing_balances_an_opening_entry(mongo):
+    async def main():
+        await mongo.users.insert_many([
+            {"steam_id": "old", "balance": 1234},
+            {"steam_id": "new", "balance": 0}
+        ])
+        await update_user_balance("new", 10, BalanceReason.MANUAL.value)
+        opened = await ledger.open_missing_accounts()
+        return opened, await ledger.reconcile("old"), await ledger.reconcile("new")
+
+    opened, old, new = asyncio.run(main())
+    assert opened == 1
+    assert old["drift"] == 0 and old["ledger_balance"] == 1234
+    assert new["drift"] == 0 and new["ledger_balance"] == 10
+
+
+def test_balance_change_and_entry_share_one_transaction(mongo, fake_transactions):
+    async def main():
+        await mongo.users.insert_one({"steam_id": "1", "balance": 0})
+        await update_user_balance("1", 500, BalanceReason.MANUAL.value)
+        new_balance = await debit_user_balance("1", 200, BalanceReason.CASE_OPEN.value)
+        return new_balance, await ledger.reconcile("1")
+
+    new_balance, report = asyncio.run(main())
+    assert new_balance == 300 and report["drift"] == 0
+    writes = [(collection, method) for collection, method, _ in fake_transactions.calls
+              if method in ("find_one_and_update", "insert_one")]
+    assert writes == [("users", "find_one_and_update"), ("ledger_entries", "insert_one")] * 2
+    assert all(session is fake_transactions.session for _, _, session in fake_transactions.calls)
+    # The transaction committed, so the new balance is written through
+    assert user_cache.get("1")["balance"] == 300
+
+
+def test_failed_ledger_insert_fails_the_balance_change(mongo, fake_transactions, monkeypatch):
+    async def broken_entry(*args, **kwargs):
+        raise OperationFailure("ledger unavailable")
+
+    monkeypatch.setattr(database, "record_ledger_entry", broken_entry)
+
+    async def main():
+        await mongo.users.insert_one({"steam_id": "1", "balance": 0})
+        user_cache.set("1", {"steam_id": "1", "balance": 0})
+        with pytest.raises(OperationFailure):
+            await update_user_balance("1", 500, BalanceReason.MANUAL.value)
+
+    asyncio.run(main())
+    # The transaction would roll the $inc back, so nothing may be cached meanwhile
+    assert "1" not in user_cache
@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from http_clients import http_clients
+from market_prices import PriceMap, SteamPriceRefresher, parse_market_price
+
+
+@pytest.mark.parametrize("text, kopecks", [
+    ("1 234,56 pуб.", 123456),
+    ("1\xa0234 pуб.", 123400),
+    ("12,5 pуб.", 1250),
+    ("0,03 pуб.", 3),
+    ("$1,234.56", 123456),
+    ("1.234,56€", 123456),
+    ("pуб.", None),
+    ("", None),
+])
+def test_parse_market_price(text, kopecks):
+    assert parse_market_price(text) == kopecks
+
+
+class FakePriceOverview:
+    """Local stand-in for Steam's priceoverview endpoint.
+
+    The first ``rate_limited`` requests get a 429, with ``retry_after`` as
+    the Retry-After header if given. Every request is recorded with its time.
+    """
+
+    def __init__(self, prices: dict, rate_limited: int = 0, retry_after: str = None):
+        self.prices = prices
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.requests = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        name = request.query["market_hash_name"]
+        self.requests.append((name, time.monotonic()))
+        assert request.query["appid"] == "730"
+        if self.rate_limited > 0:
+            self.rate_limited -= 1
+            headers = {"Retry-After": self.retry_after} if self.retry_after else {}
+            return web.Response(status=429, headers=headers)
+        if name not in self.prices:
+            return web.json_response({"success": False})
+        return web.json_response({"success": True, "lowest_price": self.prices[name]})
+
+
+@pytest.fixture
+def steam_market(monkeypatch):
+    """Runs a refresh against a FakePriceOverview with a generous request budget"""
+    monkeypatch.setenv("MARKET_PRICE_REQUESTS_PER_MINUTE", "6000")
+    monkeypatch.setenv("MARKET_PRICE_CONCURRENCY", "2")
+    monkeypatch.setenv("MARKET_PRICE_MAX_RETRIES", "3")
+    monkeypatch.setenv("MARKET_PRICE_WRITE_BATCH", "2")
+
+    def refresh(fake: FakePriceOverview, names: list):
+        async def main():
+            app = web.Application()
+            app.router.add_get("/market/priceoverview/", fake.handle)
+            server = TestServer(app)
+            await server.start_server()
+            monkeypatch.setenv("STEAM_MARKET_URL", str(server.make_url("/market/priceoverview/")))
+            refresher = SteamPriceRefresher(PriceMap())
+            try:
+                stats = await refresher.refresh(names)
+            finally:
+                await http_clients.close()
+                await server.close()
+            return refresher, stats
+
+        return asyncio.run(main())
+
+    return refresh
+
+
+def test_refresh_updates_price_map_and_collection(mongo, steam_market):
+    fake = FakePriceOverview({"A": "1 234,56 pуб.", "B": "10 pуб.", "C": "0,5 pуб."})
+    refresher, stats = steam_market(fake, ["A", "B", "C", "missing", "A"])
+
+    assert stats["requested"] == 4
+    assert (stats["updated"], stats["failed"]) == (3, 1)
+    assert refresher.price_map.market_price("A") == 123456
+    assert refresher.price_map.price_of({"market_hash_name": "missing", "price": 7}) == 7
+    assert refresher.last_run is stats
+
+    documents = asyncio.run(mongo.skin_prices.find({}, {"_id": False}).to_list(length=None))
+    assert {d["market_hash_name"]: d["price"] for d in documents} == {"A": 123456, "B": 1000, "C": 50}
+
+
+def test_prices_are_applied_once_per_written_batch(mongo, steam_market):
+    names = ["A", "B", "C", "D", "E"]
+    fake = FakePriceOverview({name: "1 pуб." for name in names})
+    refresher, stats = steam_market(fake, names)
+
+    assert stats["updated"] == 5
+    # Batches of two: A+B, C+D, then E when the run ends
+    assert refresher.price_map.version == 3
+    assert len(refresher.price_map) == 5
+
+
+def test_rate_limit_honours_retry_after(mongo, steam_market):
+    fake = FakePriceOverview({"A": "10 pуб."}, rate_limited=1, retry_after="1")
+    started = time.monotonic()
+    refresher, stats = steam_market(fake, ["A"])
+
+    assert stats["updated"] == 1
+    assert [name for name, _ in fake.requests] == ["A", "A"]
+    assert fake.requests[1][1] - fake.requests[0][1] >= 1.0
+    assert time.monotonic() - started >= 1.0
+
+
+def test_rate_limit_backs_off_exponentially(mongo, steam_market):
+    fake = FakePriceOverview({"A": "10 pуб."}, rate_limited=3)
+    refresher, stats = steam_market(fake, ["A"])
+
+    assert stats["updated"] == 1
+    times = [at for _, at in fake.requests]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    # Interval is 10ms: pauses of 20, 40 and 80ms, each plus up to 10ms of jitter
+    assert len(gaps) == 3
+    assert gaps[0] >= 0.02 and gaps[1] >= 0.04 and gaps[2] >= 0.08
+
+
+def test_rate_limit_gives_up_after_max_retries(mongo, steam_market):
+    fake = FakePriceOverview({"A": "10 pуб."}, rate_limited=10)
+    refresher, stats = steam_market(fake, ["A"])
+
+    assert (stats["updated"], stats["failed"]) == (0, 1)
+    assert len(fake.requests) == 4
+    assert refresher.price_map.market_price("A") is None
+
+
+def test_request_budget_spaces_requests(mongo, steam_market, monkeypatch):
+    monkeypatch.setenv("MARKET_PRICE_REQUESTS_PER_MINUTE", "600")
+    monkeypatch.setenv("MARKET_PRICE_CONCURRENCY", "4")
+    names = ["A", "B", "C", "D"]
+    fake = FakePriceOverview({name: "1 pуб." for name in names})
+    refresher, stats = steam_market(fake, names)
+
+    assert stats["updated"] == 4
+    times = sorted(at for _, at in fake.requests)
+    # 600 per minute is one request every 100ms, whatever the concurrency
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:]))
+
+
+def test_refresh_now_requires_refresh_enabled(monkeypatch):
+    monkeypatch.setenv("MARKET_PRICE_REFRESH_ENABLED", "false")
+    with pytest.raises(RuntimeError, match="disabled"):
+        SteamPriceRefresher(PriceMap()).refresh_now()
+
+
+def test_refresh_now_runs_one_owned_task(monkeypatch):
+    monkeypatch.setenv("MARKET_PRICE_REFRESH_ENABLED", "true")
+    refresher = SteamPriceRefresher(PriceMap())
+    cancelled = []
+
+    async def refresh(names):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(len(names))
+            raise
+
+    refresher.refresh = refresh
+
+    async def main():
+        items = refresher.refresh_now()
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError, match="already running"):
+            refresher.refresh_now()
+        await refresher.stop()
+        return items
+
+    items = asyncio.run(main())
+    assert items > 0
+    assert cancelled == [items]
@@ -0,0 +1,215 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+import database
+import server
+from case_simulator import expected_value
+from case_catalog import case_catalog
+from database import release_abandoned_sales, sell_inventory_items
+from market_prices import PriceMap
+from models import BalanceReason
+
+STEAM_ID = "1"
+# Inventory items refer to their owner by the string form of the user's _id
+USER_OBJECT_ID = ObjectId()
+USER_ID = str(USER_OBJECT_ID)
+
+ITEMS = [
+    {"name": "a", "market_hash_name": "A", "rarity": "common", "price": 100},
+    {"name": "b", "market_hash_name": "B", "rarity": "common", "price": 100},
+    {"name": "c", "market_hash_name": "C", "rarity": "rare", "price": 555},
+]
+
+
+def recorded_price(name):
+    return None
+
+
+async def setup(mongo, items=ITEMS) -> list:
+    await mongo.users.insert_one({"_id": USER_OBJECT_ID, "steam_id": STEAM_ID, "balance": 0})
+    result = await mongo.inventory.insert_many([{**item, "user_id": USER_ID} for item in items])
+    return result.inserted_ids
+
+
+async def balance(mongo) -> int:
+    return (await mongo.users.find_one({"steam_id": STEAM_ID}))["balance"]
+
+
+class FailingInventoryDb:
+    """The database, except that inventory.delete_many runs ``before`` first, or fails without it"""
+
+    def __init__(self, database, before=None):
+        self._database = database
+        self._before = before
+
+    @property
+    def inventory(self):
+        collection = self._database.inventory
+        before = self._before
+
+        class Inventory:
+            async def delete_many(self, *args, **kwargs):
+                if before is None:
+                    raise OperationFailure("inventory unavailable")
+                await before()
+                return await collection.delete_many(*args, **kwargs)
+
+            def __getattr__(self, name):
+                return getattr(collection, name)
+
+        return Inventory()
+
+    def __getattr__(self, name):
+        return getattr(self._database, name)
+
+
+def test_payout_applies_the_sell_back_rate(mongo):
+    async def main():
+        await setup(mongo)
+        sold = await sell_inventory_items(STEAM_ID, USER_ID, {}, {"A": 1000}.get, 0.7)
+        entries = await mongo.ledger_entries.find({"reason": BalanceReason.SELL.value}).to_list(length=None)
+        return sold, await balance(mongo), entries, await mongo.inventory.count_documents({})
+
+    sold, new_balance, entries, remaining = asyncio.run(main())
+    # 1000 at market for A, the recorded 100 + 555 for the rest, rounded down
+    assert sold == (3, int(1655 * 0.7))
+    assert new_balance == 1158
+    assert [entry["amount"] for entry in entries] == [1158]
+    assert remaining == 0
+
+
+def test_items_claimed_by_another_sale_are_not_sold(mongo):
+    async def main():
+        ids = await setup(mongo)
+        await mongo.inventory.update_one({"_id": ids[2]}, {"$set": {"sale_id": "other"}})
+        sold = await sell_inventory_items(STEAM_ID, USER_ID, {}, recorded_price, 1.0)
+        return sold, await mongo.inventory.find().to_list(length=None)
+
+    sold, remaining = asyncio.run(main())
+    assert sold == (2, 200)
+    assert [item["sale_id"] for item in remaining] == ["other"]
+
+
+def test_failed_delete_releases_the_claim(mongo, monkeypatch):
+    monkeypatch.setattr(database, "db", FailingInventoryDb(mongo))
+
+    async def main():
+        await setup(mongo)
+        with pytest.raises(OperationFailure):
+            await sell_inventory_items(STEAM_ID, USER_ID, {}, recorded_price, 1.0)
+        return await mongo.inventory.find().to_list(length=None), await balance(mongo)
+
+    items, new_balance = asyncio.run(main())
+    assert len(items) == 3
+    assert not any("sale_id" in item or "sale_claimed_at" in item for item in items)
+    assert new_balance == 0
+
+
+def test_inventory_change_during_sale_restores_the_items(mongo, monkeypatch):
+    async def main():
+        ids = await setup(mongo)
+
+        async def admin_removes_one():
+            await mongo.inventory.delete_one({"_id": ids[0]})
+
+        monkeypatch.setattr(database, "db", FailingInventoryDb(mongo, admin_removes_one))
+        with pytest.raises(RuntimeError):
+            await sell_inventory_items(STEAM_ID, USER_ID, {}, recorded_price, 1.0)
+        return ids, await mongo.inventory.find().to_list(length=None), await balance(mongo)
+
+    ids, items, new_balance = asyncio.run(main())
+    # Everything the sale deleted is back and unclaimed; nothing was paid
+    assert sorted(item["_id"] for item in items) == sorted(ids)
+    assert not any("sale_id" in item for item in items)
+    assert new_balance == 0
+
+
+def test_unknown_user_gets_the_items_back(mongo):
+    async def main():
+        ids = await setup(mongo)
+        with pytest.raises(LookupError):
+            await sell_inventory_items("404", USER_ID, {}, recorded_price, 1.0)
+        return ids, await mongo.inventory.find().to_list(length=None)
+
+    ids, items = asyncio.run(main())
+    assert sorted(item["_id"] for item in items) == sorted(ids)
+    assert not any("sale_id" in item or "sale_claimed_at" in item for item in items)
+    assert {item["user_id"] for item in items} == {USER_ID}
+
+
+def test_abandoned_claims_are_released(mongo):
+    async def main():
+        ids = await setup(mongo)
+        now = datetime.utcnow()
+        await mongo.inventory.update_one(
+            {"_id": ids[0]}, {"$set": {"sale_id": "dead", "sale_claimed_at": now - timedelta(hours=1)}}
+        )
+        await mongo.inventory.update_one({"_id": ids[1]}, {"$set": {"sale_id": "live", "sale_claimed_at": now}})
+        released = await release_abandoned_sales(600)
+        return released, {item["name"]: item.get("sale_id") async for item in mongo.inventory.find()}
+
+    released, claims = asyncio.run(main())
+    assert released == 1
+    assert claims == {"a": None, "b": "live", "c": None}
+
+
+@pytest.fixture
+def client(mongo):
+    """Calls the API as the test user"""
+    async def current_user():
+        return await mongo.users.find_one({"steam_id": STEAM_ID})
+
+    server.app.dependency_overrides[server.get_current_user] = current_user
+
+    async def post(path: str, body: dict) -> httpx.Response:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return await http.post(path, json=body)
+
+    yield post
+    server.app.dependency_overrides.clear()
+
+
+def highest_case_return() -> float:
+    """Highest expected drop value of any case as a share of its price"""
+    return max(expected_value(case_catalog.sampler_for(case)) / case["price"] for case in case_catalog)
+
+
+def test_sell_is_unavailable_while_open_then_sell_pays(mongo, client, monkeypatch):
+    monkeypatch.setattr(server, "SELL_BACK_RATE", 1.01 / highest_case_return())
+
+    async def main():
+        await setup(mongo)
+        response = await client("/api/user/inventory/sell", {"below_price": 10 ** 9})
+        return response, await mongo.inventory.count_documents({})
+
+    response, remaining = asyncio.run(main())
+    assert response.status_code == 503
+    assert remaining == len(ITEMS)
+
+
+def test_below_price_selects_and_pays_by_the_same_price(mongo, client, monkeypatch):
+    rate = 0.99 / highest_case_return()
+    monkeypatch.setattr(server, "SELL_BACK_RATE", rate)
+    prices = PriceMap()
+    # A has become expensive and C cheap; B has no market price and keeps its recorded 100
+    prices.update({"A": 5000, "C": 150})
+    monkeypatch.setattr(server, "price_map", prices)
+
+    async def main():
+        await setup(mongo)
+        response = await client("/api/user/inventory/sell", {"below_price": 200})
+        names = [item["market_hash_name"] async for item in mongo.inventory.find()]
+        return response, names, await balance(mongo)
+
+    response, names, new_balance = asyncio.run(main())
+    assert response.status_code == 200
+    assert names == ["A"]
+    body = response.json()
+    assert body["sold_count"] == 2
+    assert body["payout"] == int((100 + 150) * rate) == new_balance == body["new_balance"]
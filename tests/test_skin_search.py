@@ -0,0 +1,86 @@
+import pytest
+
+from market_prices import PriceMap
+from skin_search import SkinSearchIndex, decode_cursor, encode_cursor
+from skins_database import SkinCatalog
+
+
+@pytest.fixture
+def search_index():
+    """A small catalog where many skins tie on score and on price"""
+    skins = [
+        {"name": f"АК-47 | Узор {i}", "market_hash_name": f"AK-47 | Pattern {i:02d}", "rarity": "rare", "price": 1000}
+        for i in range(11)
+    ] + [
+        {"name": f"АК-74 | Узор {i}", "market_hash_name": f"AK-74 | Pattern {i}", "rarity": "epic", "price": 5000}
+        for i in range(3)
+    ] + [
+        {"name": "Нож | Узор", "market_hash_name": "Knife | Pattern", "rarity": "mythical", "price": 90000},
+    ]
+    return SkinSearchIndex(SkinCatalog({"weapons": skins}), PriceMap())
+
+
+def search_all(index: SkinSearchIndex, limit: int, **params) -> list:
+    pages = []
+    cursor = None
+    while True:
+        page = index.search(cursor=cursor, limit=limit, **params)
+        pages.append(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("query", ["", "pattern", "ak 47", "узор"])
+@pytest.mark.parametrize("limit", [1, 2, 5, 100])
+def test_search_pages_are_gap_free_across_score_ties(search_index, query, limit):
+    pages = search_all(search_index, limit, query=query)
+    names = [item["market_hash_name"] for page in pages for item in page["items"]]
+    full = search_index.ranked(query)[1]
+
+    assert names == [skin["market_hash_name"] for skin in full]
+    assert len(names) == len(set(names)) == pages[0]["total"]
+    keys = [(-item["score"], item["market_hash_name"]) for page in pages for item in page["items"]]
+    assert keys == sorted(keys)
+
+
+def test_search_ranks_exact_words_before_prefixes(search_index):
+    assert {item["score"] for item in search_index.search("patt", limit=100)["items"]} == {2.0}
+    assert {item["score"] for item in search_index.search("pattern", limit=100)["items"]} == {3.0}
+
+    # "1" is a whole word of "Узор 1" in both series but only a prefix of "Узор 10"
+    items = search_index.search("узор 1", limit=100)["items"]
+    assert [(item["market_hash_name"], item["score"]) for item in items] == [
+        ("AK-47 | Pattern 01", 6.0), ("AK-74 | Pattern 1", 6.0), ("AK-47 | Pattern 10", 5.0)
+    ]
+
+
+def test_search_cursor_survives_the_item_it_points_at_leaving(search_index):
+    first = search_index.search("pattern", limit=4)
+    score, name = decode_cursor(first["next_cursor"])
+    # A cursor for a key between two results resumes right after that key
+    cursor = encode_cursor((score, name + " (gone)"))
+    resumed = search_index.search("pattern", limit=4, cursor=cursor)
+    expected = search_index.search("pattern", limit=4, cursor=first["next_cursor"])
+    assert resumed["items"] == expected["items"]
+
+
+def test_search_cursor_round_trips_fractional_scores():
+    key = (3.857, "★ Karambit | Doppler (Factory New)")
+    assert decode_cursor(encode_cursor(key)) == key
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "e30=", "bnVsbA=="])
+def test_malformed_search_cursor_is_rejected(search_index, cursor):
+    with pytest.raises(ValueError):
+        search_index.search("pattern", cursor=cursor)
+
+
+def test_search_filters_and_price_version(search_index):
+    assert search_index.search(rarity="epic")["total"] == 3
+    assert search_index.search(min_price=5000, max_price=90000)["total"] == 4
+
+    search_index.price_map.update({"Knife | Pattern": 100})
+    cheap = search_index.search(max_price=1000, limit=100)
+    assert "Knife | Pattern" in {item["market_hash_name"] for item in cheap["items"]}
+    assert cheap["total"] == 12
@@ -0,0 +1,75 @@
+import ast
+from pathlib import Path
+
+import pytest
+
+import skins_database
+from skins_database import CSGO_SKINS_DATABASE, SkinCatalog, get_skins_for_case, skin_catalog
+
+SOURCE = Path(skins_database.__file__)
+
+
+def duplicate_keys(source: str) -> list:
+    """(line, key) of every repeated constant key in a dict literal.
+
+    Python silently keeps the last value of a repeated key, so such data
+    errors only show in the source, not in the loaded dicts.
+    """
+    duplicates = []
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Dict):
+            seen = set()
+            for key in node.keys:
+                if isinstance(key, ast.Constant):
+                    if key.value in seen:
+                        duplicates.append((key.lineno, key.value))
+                    seen.add(key.value)
+    return duplicates
+
+
+def test_duplicate_key_check_finds_repeated_keys():
+    source = 'DATA = [{"name": "a", "price": 1, "name": "b"}, {"name": "c"}]'
+    assert duplicate_keys(source) == [(1, "name")]
+
+
+def test_skins_source_has_no_duplicate_keys():
+    assert duplicate_keys(SOURCE.read_text(encoding="utf-8")) == []
+
+
+def test_market_hash_names_are_unique():
+    names = [skin["market_hash_name"] for skins in CSGO_SKINS_DATABASE.values() for skin in skins]
+    assert len(names) == len(set(names)) == len(skin_catalog.skins)
+
+
+def test_catalog_is_immutable():
+    skin = skin_catalog.skins[0]
+    with pytest.raises(TypeError):
+        skin["price"] = 0
+    with pytest.raises(TypeError):
+        skin_catalog.by_rarity["common"] = ()
+    assert isinstance(skin_catalog.rarity("common"), tuple)
+
+
+def test_indexes_agree_with_the_source_data():
+    for category, skins in CSGO_SKINS_DATABASE.items():
+        assert [dict(skin) for skin in skin_catalog.by_category[category]] == skins
+    for rarity, skins in skin_catalog.by_rarity.items():
+        assert all(skin["rarity"] == rarity for skin in skins)
+    assert sum(len(skins) for skins in skin_catalog.by_rarity.values()) == len(skin_catalog.skins)
+    for skin in skin_catalog.skins:
+        assert skin_catalog.get(skin["market_hash_name"]) is skin
+    assert skin_catalog.rarity("no such rarity") == ()
+
+
+def test_case_pools_are_computed_once():
+    for tier in ("low", "medium", "high", "other"):
+        pool = get_skins_for_case(tier)
+        assert pool and get_skins_for_case(tier) is pool
+
+
+def test_repeated_market_hash_name_keeps_the_first_skin():
+    first = {"name": "A", "market_hash_name": "Same", "rarity": "rare", "price": 1}
+    second = {**first, "name": "B"}
+    catalog = SkinCatalog({"one": [first], "two": [second]})
+    assert [skin["name"] for skin in catalog.skins] == ["A"]
+    assert catalog.by_category["two"] == ()
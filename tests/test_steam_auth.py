@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+import steam_auth
+from steam_auth import SteamAuth
+
+SECRET = "test secret"
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    """A SteamAuth whose jwt.decode calls are counted"""
+    monkeypatch.setenv("SESSION_SECRET", SECRET)
+    decoded = []
+    decode = steam_auth.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decoded.append(args[0])
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(steam_auth.jwt, "decode", counting_decode)
+    instance = SteamAuth()
+    instance.decoded = decoded
+    return instance
+
+
+def token(exp: int, steam_id: str = "1") -> str:
+    return jwt.encode({"steam_id": steam_id, "exp": exp}, SECRET, algorithm="HS256")
+
+
+def test_verified_payload_is_cached(auth):
+    valid = auth.generate_jwt_token("1", {"personaname": "player"})
+    first = auth.verify_jwt_token(valid)
+    assert auth.verify_jwt_token(valid) is first
+    assert first["steam_id"] == "1"
+    assert auth.decoded == [valid]
+
+
+def test_invalid_tokens_are_not_cached(auth):
+    forged = jwt.encode({"steam_id": "1", "exp": int(time.time()) + 60}, "other secret", algorithm="HS256")
+    for _ in range(2):
+        with pytest.raises(HTTPException) as error:
+            auth.verify_jwt_token(forged)
+        assert error.value.status_code == 401
+    assert auth.decoded == [forged, forged]
+    assert len(auth.token_cache) == 0
+
+
+def test_payload_is_never_served_past_exp(auth):
+    # The cache TTL (300s by default) is far longer than the token lives
+    exp = int(time.time()) + 1
+    short_lived = token(exp)
+    assert auth.verify_jwt_token(short_lived)["exp"] == exp
+    assert auth.verify_jwt_token(short_lived)["exp"] == exp
+    assert len(auth.decoded) == 1
+
+    # jose compares exp with whole seconds, so the token is refused a second later
+    time.sleep(max(0.0, exp + 1 - time.time()) + 0.1)
+    with pytest.raises(HTTPException) as error:
+        auth.verify_jwt_token(short_lived)
+    assert error.value.status_code == 401
+    assert error.value.detail == "Token expired"
+    assert len(auth.decoded) == 2
+
+
+def test_expired_token_is_refused(auth):
+    with pytest.raises(HTTPException) as error:
+        auth.verify_jwt_token(token(int(time.time()) - 10))
+    assert error.value.detail == "Token expired"
+    assert len(auth.token_cache) == 0
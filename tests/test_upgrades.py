@@ -0,0 +1,234 @@
+import asyncio
+
+import pytest
+
+import upgrades
+from database import sell_inventory_items
+from market_prices import PriceMap, price_map
+from skins_database import get_all_skins
+from upgrades import SkinPriceIndex, UpgradeError, upgrade_item
+
+USER_ID = "user-1"
+
+
+class InterleavedInventory:
+    """Inventory collection that lets another writer act right after the stake is read"""
+
+    def __init__(self, collection, action):
+        self._collection = collection
+        self._action = action
+
+    async def find_one(self, *args, **kwargs):
+        document = await self._collection.find_one(*args, **kwargs)
+        if self._action is not None:
+            action, self._action = self._action, None
+            await action()
+        return document
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class InterleavedDb:
+    def __init__(self, inventory: InterleavedInventory):
+        self.inventory = inventory
+
+
+@pytest.fixture
+def interleave(mongo, monkeypatch):
+    """interleave(action): run ``action`` between upgrade_item's read and its guarded write"""
+    def install(action):
+        monkeypatch.setattr(upgrades, "db", InterleavedDb(InterleavedInventory(mongo.inventory, action)))
+    return install
+
+
+@pytest.fixture
+def stake_and_target():
+    """A catalog skin to stake and a target between 1.2x and 20x its price"""
+    for skin in sorted(get_all_skins(), key=lambda skin: skin["price"]):
+        targets = upgrades.skin_price_index.targets_for(price_map.price_of(skin))
+        if targets:
+            return price_map.priced(skin), targets[0]
+    pytest.fail("No skin in the catalog can be upgraded")
+
+
+@pytest.fixture
+def roll(monkeypatch):
+    """Fix the upgrade roll: roll(True) always wins, roll(False) always loses"""
+    def set_outcome(won: bool):
+        monkeypatch.setattr(upgrades.random, "random", lambda: 0.0 if won else 0.999999)
+    return set_outcome
+
+
+async def add_stake(mongo, stake: dict):
+    result = await mongo.inventory.insert_one({**stake, "user_id": USER_ID})
+    return result.inserted_id
+
+
+def test_win_swaps_the_stake_for_the_target(mongo, stake_and_target, roll):
+    stake, target = stake_and_target
+    roll(True)
+
+    async def main():
+        item_id = await add_stake(mongo, stake)
+        result = await upgrade_item(USER_ID, item_id, target["market_hash_name"])
+        return item_id, result, await mongo.inventory.find().to_list(length=None)
+
+    item_id, result, inventory = asyncio.run(main())
+    assert result["won"] is True
+    assert result["chance"] == pytest.approx(upgrades.win_chance(stake["price"], target["price"]), abs=1e-4)
+    assert len(inventory) == 1
+    assert inventory[0]["_id"] == item_id
+    assert inventory[0]["market_hash_name"] == target["market_hash_name"]
+    assert inventory[0]["upgraded_from"] == stake["market_hash_name"]
+
+
+def test_loss_removes_the_stake(mongo, stake_and_target, roll):
+    stake, target = stake_and_target
+    roll(False)
+
+    async def main():
+        item_id = await add_stake(mongo, stake)
+        result = await upgrade_item(USER_ID, item_id, target["market_hash_name"])
+        return result, await mongo.inventory.count_documents({})
+
+    result, remaining = asyncio.run(main())
+    assert result["won"] is False and "item" not in result
+    assert remaining == 0
+
+
+def test_invalid_targets_are_refused(mongo, stake_and_target):
+    stake, _ = stake_and_target
+
+    async def main():
+        item_id = await add_stake(mongo, stake)
+        with pytest.raises(UpgradeError):
+            await upgrade_item(USER_ID, item_id, stake["market_hash_name"])
+        with pytest.raises(UpgradeError):
+            await upgrade_item(USER_ID, item_id, "No Such Skin")
+        with pytest.raises(LookupError):
+            await upgrade_item("someone else", item_id, stake["market_hash_name"])
+        return await mongo.inventory.count_documents({})
+
+    assert asyncio.run(main()) == 1
+
+
+@pytest.mark.parametrize("won", [True, False])
+def test_concurrent_upgrade_of_the_same_item_resolves_once(mongo, stake_and_target, roll, interleave, won):
+    stake, target = stake_and_target
+    roll(won)
+    results = []
+
+    async def main():
+        item_id = await add_stake(mongo, stake)
+
+        async def other_upgrade():
+            results.append(await upgrade_item(USER_ID, item_id, target["market_hash_name"]))
+
+        interleave(other_upgrade)
+        with pytest.raises(LookupError):
+            await upgrade_item(USER_ID, item_id, target["market_hash_name"])
+        return await mongo.inventory.find().to_list(length=None)
+
+    inventory = asyncio.run(main())
+    assert len(results) == 1
+    if won:
+        assert [item["market_hash_name"] for item in inventory] == [target["market_hash_name"]]
+    else:
+        assert inventory == []
+
+
+def test_concurrent_sell_wins_over_the_upgrade(mongo, stake_and_target, roll, interleave):
+    stake, target = stake_and_target
+    roll(True)
+    sales = []
+
+    async def main():
+        await mongo.users.insert_one({"steam_id": "1", "balance": 0})
+        item_id = await add_stake(mongo, stake)
+
+        async def sell():
+            sales.append(await sell_inventory_items("1", USER_ID, {"_id": item_id}, price_map.market_price, 1.0))
+
+        interleave(sell)
+        with pytest.raises(LookupError):
+            await upgrade_item(USER_ID, item_id, target["market_hash_name"])
+        user = await mongo.users.find_one({"steam_id": "1"})
+        return user["balance"], await mongo.inventory.count_documents({})
+
+    balance, remaining = asyncio.run(main())
+    assert sales == [(1, stake["price"])]
+    assert balance == stake["price"]
+    assert remaining == 0
+
+
+def test_item_claimed_by_an_unfinished_sale_cannot_be_staked(mongo, stake_and_target, roll, interleave):
+    stake, target = stake_and_target
+    roll(False)
+
+    async def main():
+        item_id = await add_stake(mongo, stake)
+
+        async def claim():
+            await mongo.inventory.update_one({"_id": item_id}, {"$set": {"sale_id": "sale"}})
+
+        interleave(claim)
+        with pytest.raises(LookupError):
+            await upgrade_item(USER_ID, item_id, target["market_hash_name"])
+        return await mongo.inventory.find_one({"_id": item_id})
+
+    item = asyncio.run(main())
+    assert item is not None and item["sale_id"] == "sale"
+
+
+def test_item_whose_price_changed_is_not_resolved_at_the_old_price(mongo, stake_and_target, roll, interleave):
+    stake, target = stake_and_target
+    roll(True)
+
+    async def main():
+        item_id = await add_stake(mongo, stake)
+
+        async def reprice():
+            await mongo.inventory.update_one({"_id": item_id}, {"$set": {"price": stake["price"] * 2}})
+
+        interleave(reprice)
+        with pytest.raises(LookupError):
+            await upgrade_item(USER_ID, item_id, target["market_hash_name"])
+        return await mongo.inventory.find_one({"_id": item_id})
+
+    item = asyncio.run(main())
+    assert item["market_hash_name"] == stake["market_hash_name"]
+    assert item["price"] == stake["price"] * 2
+
+
+def test_price_index_rebuilds_on_price_map_version_bump():
+    prices = PriceMap()
+    index = SkinPriceIndex(prices)
+    skins = sorted(get_all_skins(), key=lambda skin: skin["price"])
+    cheapest, priciest = skins[0], skins[-1]
+
+    assert index.get(cheapest["market_hash_name"])["price"] == cheapest["price"]
+    built = index._skins
+    index.between(0, 10 ** 12)
+    assert index._skins is built
+
+    prices.update({cheapest["market_hash_name"]: priciest["price"] + 1})
+    assert index.get(cheapest["market_hash_name"])["price"] == priciest["price"] + 1
+    assert index._skins is not built
+    # Now the most expensive skin, so it sorts last
+    assert index.between(0, 10 ** 12)[-1]["market_hash_name"] == cheapest["market_hash_name"]
+    assert cheapest["market_hash_name"] not in {
+        skin["market_hash_name"] for skin in index.between(0, priciest["price"])
+    }
+
+
+def test_targets_carry_the_win_chance():
+    index = SkinPriceIndex(PriceMap())
+    stake_price = 100000
+    targets = index.targets_for(stake_price)
+    assert targets
+    assert all(120000 <= skin["price"] <= 2000000 for skin in targets)
+    assert [skin["price"] for skin in targets] == sorted(skin["price"] for skin in targets)
+    for skin in targets:
+        assert skin["chance"] == round(upgrades.win_chance(stake_price, skin["price"]), 4)
+        assert skin["chance"] <= upgrades.MAX_WIN_CHANCE
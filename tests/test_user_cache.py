@@ -0,0 +1,79 @@
+import asyncio
+
+import database
+from database import debit_user_balance, get_user_by_steam_id, update_user_balance, user_cache
+from models import BalanceReason
+
+
+async def add_user(mongo, steam_id: str = "1", balance: int = 1000) -> dict:
+    await mongo.users.insert_one({"steam_id": steam_id, "balance": balance})
+    # Warm the cache the way get_current_user does
+    return await get_user_by_steam_id(steam_id)
+
+
+def test_reads_are_served_from_the_cache(mongo, monkeypatch):
+    async def main():
+        user = await add_user(mongo)
+        # A write that bypasses this module is only seen once the entry expires
+        await mongo.users.update_one({"steam_id": "1"}, {"$set": {"balance": 5}})
+        cached = await get_user_by_steam_id("1")
+        user_cache.clear()
+        return user, cached, await get_user_by_steam_id("1")
+
+    user, cached, fresh = asyncio.run(main())
+    assert cached is user and cached["balance"] == 1000
+    assert fresh["balance"] == 5
+    assert asyncio.run(get_user_by_steam_id("404")) is None
+    assert "404" not in user_cache
+
+
+def test_balance_changes_write_the_new_document_through(mongo):
+    async def main():
+        await add_user(mongo)
+        await update_user_balance("1", 250, BalanceReason.MANUAL.value)
+        credited = user_cache.get("1")
+        new_balance = await debit_user_balance("1", 1200, BalanceReason.CASE_OPEN.value)
+        return credited, new_balance, user_cache.get("1"), await mongo.users.find_one({"steam_id": "1"})
+
+    credited, new_balance, debited, stored = asyncio.run(main())
+    assert credited["balance"] == 1250
+    assert new_balance == 50
+    assert debited == stored and debited["balance"] == 50
+
+
+def test_failed_debit_evicts_the_cached_user(mongo):
+    async def main():
+        await add_user(mongo, balance=100)
+        # Another worker spent the balance; only the cache still shows it
+        await mongo.users.update_one({"steam_id": "1"}, {"$set": {"balance": 0}})
+        debited = await debit_user_balance("1", 100, BalanceReason.CASE_OPEN.value)
+        return debited, "1" in user_cache, await get_user_by_steam_id("1")
+
+    debited, cached, user = asyncio.run(main())
+    assert debited is None
+    assert not cached
+    assert user["balance"] == 0
+
+
+def test_balance_change_of_a_missing_user_caches_nothing(mongo):
+    async def main():
+        user_cache.set("404", {"steam_id": "404", "balance": 10})
+        return await update_user_balance("404", 10, BalanceReason.MANUAL.value)
+
+    assert asyncio.run(main()) is False
+    assert "404" not in user_cache
+
+
+def test_write_inside_a_caller_transaction_evicts(mongo, fake_transactions):
+    async def main():
+        await add_user(mongo)
+        # The caller's transaction may still abort, so the new balance must not be cached
+        await update_user_balance("1", 100, BalanceReason.BATTLE.value, session=fake_transactions.session)
+        credited = "1" in user_cache
+        await add_user(mongo, "2")
+        await debit_user_balance("2", 100, BalanceReason.BATTLE.value, session=fake_transactions.session)
+        return credited, "2" in user_cache
+
+    assert asyncio.run(main()) == (False, False)
+    users = [call for call in fake_transactions.calls if call[0] == "users" and call[1] == "find_one_and_update"]
+    assert users and all(session is fake_transactions.session for _, _, session in users)
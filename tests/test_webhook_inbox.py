@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import server
+from models import BalanceReason
+from webhook_inbox import webhook_inbox
+
+INVOICE_ID = "1001"
+
+
+def invoice_paid(update_id: str = "u1", invoice_id=INVOICE_ID) -> dict:
+    return {"update_id": update_id, "update_type": "invoice_paid", "payload": {"invoice_id": invoice_id}}
+
+
+async def add_user_and_transaction(mongo, status: str = "pending", amount_rub: float = 12.5):
+    await mongo.users.insert_one({"steam_id": "1", "balance": 0})
+    await mongo.payment_transactions.insert_one({
+        "invoice_id": INVOICE_ID, "user_steam_id": "1", "amount_rub": amount_rub, "status": status
+    })
+
+
+async def post(data) -> httpx.Response:
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        if isinstance(data, (dict, list)):
+            return await client.post("/api/webhook/crypto-bot", json=data)
+        return await client.post("/api/webhook/crypto-bot", content=data)
+
+
+async def state(mongo) -> tuple:
+    user = await mongo.users.find_one({"steam_id": "1"})
+    events = await mongo.webhook_inbox.find().to_list(length=None)
+    credits = await mongo.ledger_entries.count_documents({"reason": BalanceReason.CRYPTO_PAYMENT.value})
+    return user["balance"], events, credits
+
+
+def test_redelivered_invoice_paid_credits_once(mongo):
+    async def main():
+        await add_user_and_transaction(mongo)
+        # Crypto Bot retried: a new update id for the same paid invoice
+        responses = [await post(invoice_paid("u1")), await post(invoice_paid("u2"))]
+        handled = await webhook_inbox.drain()
+        # Even a duplicate that slipped past the inbox can't win the pending -> paid transition
+        await server.process_crypto_bot_update(invoice_paid("u3"))
+        return responses, handled, await state(mongo)
+
+    responses, handled, (balance, events, credits) = asyncio.run(main())
+    assert [response.status_code for response in responses] == [200, 200]
+    assert handled == 1
+    assert [event["status"] for event in events] == ["processed"]
+    assert balance == 1250 and credits == 1
+
+
+def test_webhook_before_its_transaction_stays_pending_then_credits(mongo):
+    async def main():
+        await mongo.users.insert_one({"steam_id": "1", "balance": 0})
+        assert (await post(invoice_paid())).status_code == 200
+        await webhook_inbox.drain()
+        early = await state(mongo)
+
+        await mongo.payment_transactions.insert_one({
+            "invoice_id": INVOICE_ID, "user_steam_id": "1", "amount_rub": 12.5, "status": "pending"
+        })
+        # Skip the retry delay
+        await mongo.webhook_inbox.update_many({}, {"$set": {"available_at": datetime.utcnow()}})
+        await webhook_inbox.drain()
+        return early, await state(mongo)
+
+    (early_balance, early_events, _), (balance, events, credits) = asyncio.run(main())
+    assert early_balance == 0
+    assert [(event["status"], event["attempts"]) for event in early_events] == [("pending", 1)]
+    assert "No transaction" in early_events[0]["last_error"]
+    assert [(event["status"], event["attempts"]) for event in events] == [("processed", 2)]
+    assert balance == 1250 and credits == 1
+
+
+def test_already_paid_transaction_is_not_credited_again(mongo):
+    async def main():
+        await add_user_and_transaction(mongo, status="paid")
+        assert (await post(invoice_paid())).status_code == 200
+        await webhook_inbox.drain()
+        return await state(mongo)
+
+    balance, events, credits = asyncio.run(main())
+    assert [event["status"] for event in events] == ["processed"]
+    assert balance == 0 and credits == 0
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    [1, 2],
+    {"update_type": "invoice_paid", "update_id": "u1"},
+    {"update_type": "invoice_paid", "update_id": "u1", "payload": {}},
+    {"update_type": "invoice_paid", "update_id": "u1", "payload": "1001"},
+    {"update_type": "something_else"},
+])
+def test_malformed_update_is_refused(mongo, body):
+    async def main():
+        response = await post(body)
+        return response, await mongo.webhook_inbox.count_documents({})
+
+    response, stored = asyncio.run(main())
+    assert response.status_code == 400
+    assert stored == 0
+
+
+def test_update_that_cannot_be_stored_is_not_acknowledged(mongo, monkeypatch):
+    async def unreachable(*args, **kwargs):
+        raise ServerSelectionTimeoutError("mongo down")
+
+    monkeypatch.setattr(webhook_inbox, "append", unreachable)
+    response = asyncio.run(post(invoice_paid()))
+    # Anything but 2xx makes Crypto Bot deliver the update again
+    assert response.status_code == 503
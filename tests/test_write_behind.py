@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+import write_behind
+from write_behind import CaseResultsWriter
+
+
+class RecordingDb:
+    """Records the size of every insert_many; inserts wait while ``gate`` is closed"""
+
+    def __init__(self, database):
+        self._database = database
+        self.batches = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    def __getitem__(self, name):
+        collection = self._database[name]
+        recorder = self
+
+        class Collection:
+            async def insert_many(self, documents, **kwargs):
+                await recorder.gate.wait()
+                recorder.batches.append(len(documents))
+                return await collection.insert_many(documents, **kwargs)
+
+        return Collection()
+
+
+@pytest.fixture
+def writer(mongo, monkeypatch):
+    """An enabled case results writer with small batches and a small queue"""
+    monkeypatch.setenv("CASE_RESULTS_WRITE_BEHIND", "true")
+    monkeypatch.setenv("CASE_RESULTS_BATCH_SIZE", "3")
+    monkeypatch.setenv("CASE_RESULTS_FLUSH_SECONDS", "60")
+    monkeypatch.setenv("CASE_RESULTS_MAX_QUEUE", "4")
+    monkeypatch.setattr(write_behind, "db", RecordingDb(mongo))
+    return CaseResultsWriter()
+
+
+def items(count: int) -> list:
+    return [{"name": f"item {i}", "price": i} for i in range(count)]
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.005)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_disabled_writer_saves_synchronously(mongo, monkeypatch):
+    monkeypatch.setenv("CASE_RESULTS_WRITE_BEHIND", "false")
+    writer = CaseResultsWriter()
+
+    async def main():
+        await writer.start()
+        await writer.save("user", "1", items(2))
+        return await mongo.case_results.count_documents({})
+
+    assert asyncio.run(main()) == 2
+    assert not writer.running
+
+
+def test_full_batches_are_flushed_by_size(mongo, writer):
+    async def main():
+        await writer.start()
+        await writer.save("user", "1", items(7))
+        # The flush interval is a minute, so only full batches can have gone out
+        await wait_for(lambda: writer.written == 6)
+        flushed = list(write_behind.db.batches)
+        await writer.stop()
+        return flushed, await mongo.case_results.count_documents({})
+
+    flushed, stored = asyncio.run(main())
+    assert flushed == [3, 3]
+    assert write_behind.db.batches == [3, 3, 1]
+    assert stored == 7
+    assert writer.stats()["written"] == 7
+
+
+def test_partial_batch_is_flushed_by_time(mongo, writer, monkeypatch):
+    monkeypatch.setenv("CASE_RESULTS_FLUSH_SECONDS", "0.05")
+
+    async def main():
+        await writer.start()
+        await writer.save("user", "1", items(2))
+        await wait_for(lambda: writer.written == 2)
+        stored = await mongo.case_results.count_documents({})
+        await writer.stop()
+        return stored
+
+    assert asyncio.run(main()) == 2
+    assert write_behind.db.batches == [2]
+
+
+def test_full_queue_makes_save_wait(mongo, writer, monkeypatch):
+    monkeypatch.setenv("CASE_RESULTS_BATCH_SIZE", "1")
+
+    async def main():
+        write_behind.db.gate.clear()
+        await writer.start()
+        # One document is held by the stalled flush and four fill the queue
+        await writer.save("user", "1", items(5))
+        await wait_for(lambda: writer.stats()["queued"] == 4)
+        blocked = asyncio.create_task(writer.save("user", "1", items(1)))
+        await asyncio.sleep(0.05)
+        waited = not blocked.done()
+        write_behind.db.gate.set()
+        await blocked
+        await writer.stop()
+        return waited, await mongo.case_results.count_documents({})
+
+    waited, stored = asyncio.run(main())
+    assert waited
+    assert stored == 6
+    assert writer.stats() == {"enabled": False, "queued": 0, "max_queue": 4, "written": 6, "dropped": 0}
+
+
+def test_stop_flushes_everything_queued(mongo, writer):
+    async def main():
+        write_behind.db.gate.clear()
+        await writer.start()
+        await writer.save("user", "1", items(4))
+        await writer.save("user", "2", items(1))
+        write_behind.db.gate.set()
+        await writer.stop()
+        return await mongo.case_results.find({}, {"_id": False}).to_list(length=None)
+
+    stored = asyncio.run(main())
+    assert len(stored) == 5
+    assert sorted(document["case_id"] for document in stored) == ["1"] * 4 + ["2"]
+    assert sum(write_behind.db.batches) == 5
+    assert all(size <= 3 for size in write_behind.db.batches)